@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text, Boolean
+from sqlalchemy import Column, String, DateTime, Text, Boolean, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -18,5 +18,10 @@ class Customer(Base):
     create_date = Column(DateTime(timezone=True), server_default=func.now())
     ban = Column(Boolean, default=False)
 
+    __table_args__ = (
+        # 供 keyset 分頁使用 (create_date, line_id)
+        Index('ix_customers_create_date_line_id', 'create_date', 'line_id'),
+    )
+
     # Relationships
     orders = relationship("Order", back_populates="customer")
@@ -1,9 +1,10 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
 from app.db import get_db
+from app.pagination import keyset_page
 from . import models, schemas
 
 router = APIRouter(prefix="/customers", tags=["customers"])
@@ -22,6 +23,20 @@ def create_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_
     return db_customer
 
 
+# 必須註冊在 /{line_id} 之前，否則 "page" 會被當成 line_id
+@router.get("/page", response_model=schemas.CustomerPage)
+def list_customers_page(
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """Cursor-paginated customer list keyed on (create_date, line_id)"""
+    customers, next_cursor = keyset_page(
+        db.query(models.Customer), models.Customer.create_date, models.Customer.line_id, cursor, limit
+    )
+    return {"items": customers, "next_cursor": next_cursor}
+
+
 @router.get("/{line_id}", response_model=schemas.Customer)
 def get_customer(line_id: str, db: Session = Depends(get_db)):
     db_customer = db.query(models.Customer).filter(models.Customer.line_id == line_id).first()
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, ConfigDict
 
 
@@ -30,3 +30,8 @@ class Customer(CustomerBase):
     create_date: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class CustomerPage(BaseModel):
+    items: List[Customer]
+    next_cursor: Optional[str] = None
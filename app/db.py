@@ -1,30 +1,143 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 
 # Get database URL from environment variable or use default
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/app.db")
+# Optional read replica for heavy read-only routes
+SQLALCHEMY_READ_DATABASE_URL = os.getenv("DATABASE_READ_URL")
+# How long after a write the same client keeps reading from the primary
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+# Most clients remembered per worker; the oldest are dropped first
+READ_YOUR_WRITES_MAX_CLIENTS = int(os.getenv("READ_YOUR_WRITES_MAX_CLIENTS", "10000"))
+
+
+def _create_engine(url: str):
+    # Create engine with the appropriate connect_args for SQLite
+    return create_engine(
+        url,
+        connect_args={"check_same_thread": False} if url.startswith("sqlite") else {}
+    )
+
 
-# Create engine with the appropriate connect_args for SQLite
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
-)
+engine = _create_engine(SQLALCHEMY_DATABASE_URL)
+read_engine = _create_engine(SQLALCHEMY_READ_DATABASE_URL) if SQLALCHEMY_READ_DATABASE_URL else engine
 
-# Create session factory
+# Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 # Create declarative base
 Base = declarative_base()
 
-def get_db():
+# 各 client 最近一次寫入的時間（每個 worker 各自記錄，依寫入時間排序）
+_last_writes: "OrderedDict[str, float]" = OrderedDict()
+_last_writes_lock = threading.Lock()
+# session.info 中標記本交易確實寫入了資料
+_WROTE_KEY = "wrote"
+
+
+def _client_key(request: Request) -> Optional[str]:
+    """The requesting user: a hash of the Bearer token (LINE userId) when present"""
+    authorization = request.headers.get("authorization")
+    if not authorization:
+        return None
+    # 不在記憶體中保留原始 token
+    return hashlib.blake2b(authorization.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _wrote_recently(key: Optional[str]) -> bool:
+    if key is None:
+        return False
+    with _last_writes_lock:
+        written = _last_writes.get(key)
+        if written is None:
+            return False
+        if time.monotonic() - written < READ_YOUR_WRITES_SECONDS:
+            return True
+        del _last_writes[key]
+        return False
+
+
+def _sweep_last_writes(now: float) -> None:
+    # 最舊的在最前面：移除過期者，並限制總數
+    while _last_writes:
+        key, written = next(iter(_last_writes.items()))
+        if now - written < READ_YOUR_WRITES_SECONDS and len(_last_writes) <= READ_YOUR_WRITES_MAX_CLIENTS:
+            break
+        del _last_writes[key]
+
+
+@event.listens_for(Session, "after_flush")
+def _detect_flushed_writes(session, flush_context):
+    session.info[_WROTE_KEY] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _detect_executed_writes(orm_execute_state):
+    # 以 db.execute 送出的 INSERT/UPDATE/DELETE 不經過 flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[_WROTE_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_write(session):
+    wrote = session.info.pop(_WROTE_KEY, False)
+    key = session.info.get("client_key")
+    if wrote and key is not None and read_engine is not engine:
+        now = time.monotonic()
+        with _last_writes_lock:
+            _last_writes[key] = now
+            _last_writes.move_to_end(key)
+            _sweep_last_writes(now)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_writes(session, transaction):
+    # 回滾時寫入不生效
+    if transaction.parent is None:
+        session.info.pop(_WROTE_KEY, None)
+
+
+def get_db(request: Request):
     """Dependency for getting database session"""
     db = SessionLocal()
+    db.info["client_key"] = _client_key(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request):
+    """
+    Dependency for read-only routes: a replica session when DATABASE_READ_URL is set.
+
+    A client that committed through get_db within READ_YOUR_WRITES_SECONDS
+    reads from the primary instead, so it sees its own writes despite
+    replica lag. Such sessions carry info["read_your_writes"] so shared
+    response caches are bypassed for them.
+    """
+    if read_engine is engine:
+        db = SessionLocal()
+    elif _wrote_recently(_client_key(request)):
+        db = SessionLocal()
+        db.info["read_your_writes"] = True
+    else:
+        db = ReadSessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+
 def create_tables():
     """Create all tables in the database"""
     Base.metadata.create_all(bind=engine)
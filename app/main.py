@@ -1,3 +1,6 @@
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.product.routes import router as product_router
@@ -7,12 +10,57 @@ from app.location.routes import router as location_router
 from app.marquee.routes import router as marquee_router
 from app.linebot_usage.routes import router as linebot_usage_router
 
-from app.db import create_tables
+from app.db import SessionLocal, create_tables
+from app.product.flash import FlashStockFlusher
+from app.product.snapshot import CatalogSnapshotBuilder
+from app.product.suggest import ProductSuggestRefresher
+from app.order.events import LogSender, OrderEventDispatcher
+from app.order.sales_summary import SalesSummaryFlusher
+from app.query_count import query_count_middleware
 from app.order.routes import router as order_router
 from fastapi.staticfiles import StaticFiles
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 快閃模式結束後才補回的數量定期寫回 products；設為 0 則不啟動（測試以 flush_flash_stock 手動寫回）
+    interval = float(os.getenv("FLASH_FLUSH_INTERVAL", "1"))
+    flusher = FlashStockFlusher(SessionLocal, interval)
+    if interval > 0:
+        flusher.start()
+    # 訂單事件 outbox 的背景派送；設為 0 則不啟動
+    dispatch_interval = float(os.getenv("ORDER_EVENT_DISPATCH_INTERVAL", "5"))
+    dispatcher = OrderEventDispatcher(SessionLocal, LogSender(), dispatch_interval)
+    if dispatch_interval > 0:
+        dispatcher.start()
+    # 商品目錄快照於寫入後在背景重建；設為 0 則由下一個請求同步重建
+    snapshot_interval = float(os.getenv("CATALOG_SNAPSHOT_INTERVAL", "1"))
+    snapshot_builder = CatalogSnapshotBuilder(SessionLocal, snapshot_interval)
+    if snapshot_interval > 0:
+        snapshot_builder.start()
+    # 自動完成索引於啟動時建立並定期重建；設為 0 則於第一次查詢時建立
+    suggest_interval = float(os.getenv("PRODUCT_SUGGEST_REFRESH_INTERVAL", "300"))
+    suggest_refresher = ProductSuggestRefresher(SessionLocal, suggest_interval)
+    if suggest_interval > 0:
+        suggest_refresher.start()
+    # 銷售彙總異動定期批次併入；設為 0 則不啟動（改由 rebuild 或手動 flush 併入）
+    sales_interval = float(os.getenv("SALES_SUMMARY_FLUSH_INTERVAL", "2"))
+    sales_flusher = SalesSummaryFlusher(SessionLocal, sales_interval)
+    if sales_interval > 0:
+        sales_flusher.start()
+    yield
+    if suggest_interval > 0:
+        suggest_refresher.stop()
+    if snapshot_interval > 0:
+        snapshot_builder.stop()
+    if sales_interval > 0:
+        sales_flusher.stop()
+    dispatcher.stop()
+    if interval > 0:
+        flusher.stop()
+
 # Create FastAPI application
 app = FastAPI(
+    lifespan=lifespan,
     title="Backend API",
     description="Backend API for engineering project management",
     version="1.0.0",
@@ -30,6 +78,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 每個回應附上該請求送出的 SQL 次數（X-Query-Count）
+app.middleware("http")(query_count_middleware)
+
 # Register routes
 app.include_router(product_router)
 app.include_router(photo_router)
@@ -0,0 +1,121 @@
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.order import models
+from app.product.models import Product
+
+ARCHIVABLE_STATUSES = ["completed", "cancelled"]
+
+
+def archive_after_days() -> int:
+    return int(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", "180"))
+
+
+def _copy_columns(archive_model, source_model):
+    """Columns shared by an archive table and its hot table, in archive order"""
+    names = [c.name for c in archive_model.__table__.columns if c.name in source_model.__table__.columns]
+    return names, [source_model.__table__.c[name] for name in names]
+
+
+def archive_orders(db: Session, older_than_days: Optional[int] = None, batch_size: int = 500) -> int:
+    """
+    Move completed/cancelled orders older than `older_than_days` into the archive tables.
+
+    Each batch copies orders and their details with INSERT ... SELECT,
+    deletes them from the hot tables and commits, so locks stay short.
+    product_sales_summary is left as is: archived lines still count as sold.
+    Returns the number of orders archived.
+    """
+    if older_than_days is None:
+        older_than_days = archive_after_days()
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    order_names, order_columns = _copy_columns(models.OrderArchive, models.Order)
+    detail_names, detail_columns = _copy_columns(models.OrderDetailArchive, models.OrderDetail)
+
+    archived = 0
+    while True:
+        order_ids = db.scalars(
+            select(models.Order.order_id)
+            .where(models.Order.order_status.in_(ARCHIVABLE_STATUSES), models.Order.order_date < cutoff)
+            .order_by(models.Order.order_id)
+            .limit(batch_size)
+            .with_for_update()
+        ).all()
+        if not order_ids:
+            break
+
+        db.execute(insert(models.OrderArchive).from_select(
+            order_names, select(*order_columns).where(models.Order.order_id.in_(order_ids))
+        ))
+        db.execute(insert(models.OrderDetailArchive).from_select(
+            detail_names, select(*detail_columns).where(models.OrderDetail.order_id.in_(order_ids))
+        ))
+        db.execute(delete(models.OrderDetail).where(models.OrderDetail.order_id.in_(order_ids)))
+        db.execute(delete(models.OrderIdempotencyKey).where(models.OrderIdempotencyKey.order_id.in_(order_ids)))
+        db.execute(delete(models.Order).where(models.Order.order_id.in_(order_ids)))
+        db.commit()
+        archived += len(order_ids)
+    return archived
+
+
+def archived_customer_orders(db: Session, line_id: str) -> List[Dict[str, Any]]:
+    """
+    A customer's archived orders shaped like schemas.Order, from three flat
+    queries (orders, details, products); lines of deleted products have no product.
+    """
+    orders = db.query(models.OrderArchive)\
+        .filter(models.OrderArchive.line_id == line_id)\
+        .order_by(models.OrderArchive.order_id)\
+        .all()
+    if not orders:
+        return []
+    details: Dict[int, List[models.OrderDetailArchive]] = defaultdict(list)
+    for detail in db.query(models.OrderDetailArchive)\
+            .filter(models.OrderDetailArchive.order_id.in_([order.order_id for order in orders]))\
+            .order_by(models.OrderDetailArchive.order_detail_id):
+        details[detail.order_id].append(detail)
+    product_ids = {detail.product_id for rows in details.values() for detail in rows if detail.product_id is not None}
+    products = {
+        product.product_id: product for product in db.query(Product).filter(Product.product_id.in_(product_ids))
+    } if product_ids else {}
+
+    columns = [c.name for c in models.OrderArchive.__table__.columns]
+    detail_columns = [c.name for c in models.OrderDetailArchive.__table__.columns]
+    return [
+        {
+            **{name: getattr(order, name) for name in columns},
+            "order_details": [
+                {**{name: getattr(detail, name) for name in detail_columns}, "product": products.get(detail.product_id)}
+                for detail in details.get(order.order_id, [])
+            ],
+        }
+        for order in orders
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 載入所有模型，讓關聯能完成設定
+    import app.customer.models  # noqa: F401
+    import app.location.models  # noqa: F401
+    import app.photo.models  # noqa: F401
+    import app.product.models  # noqa: F401
+    from app.db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Move old completed/cancelled orders to the archive tables")
+    parser.add_argument("--older-than-days", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        count = archive_orders(session, args.older_than_days, args.batch_size)
+    finally:
+        session.close()
+    print(f"{count} order(s) archived")
@@ -0,0 +1,63 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.order import models
+
+
+def _micros(value: Optional[datetime]) -> int:
+    return int(value.timestamp() * 1_000_000) if value else 0
+
+
+def order_etag(db: Session, order_id: int) -> Optional[str]:
+    """Strong ETag from the order's revision and update_time (primary key lookup); None if missing"""
+    row = db.query(models.Order.revision, models.Order.update_time)\
+        .filter(models.Order.order_id == order_id)\
+        .first()
+    if row is None:
+        return None
+    revision, update_time = row
+    return f'"o{order_id}-{revision or 0}-{_micros(update_time)}"'
+
+
+def customer_orders_etag(db: Session, line_id: str, include_archived: bool = False) -> str:
+    """
+    Strong ETag for all of a customer's orders from one aggregate on orders.line_id.
+
+    Adding, deleting or changing any order (or one of its details) changes
+    the count, the id sum, the revision sum or the latest update_time.
+    include_archived adds the count and id sum of the archived orders.
+    """
+    count, order_ids, revisions, last_update = db.query(
+        func.count(models.Order.order_id),
+        func.coalesce(func.sum(models.Order.order_id), 0),
+        func.coalesce(func.sum(models.Order.revision), 0),
+        func.max(models.Order.update_time),
+    )\
+        .filter(models.Order.line_id == line_id)\
+        .one()
+    if isinstance(last_update, str):
+        # SQLite 的聚合結果不經過 DateTime 型別轉換
+        last_update = datetime.fromisoformat(last_update)
+    etag = f'"c{count}-{order_ids}-{revisions}-{_micros(last_update)}"'
+    if include_archived:
+        archived_count, archived_ids = db.query(
+            func.count(models.OrderArchive.order_id),
+            func.coalesce(func.sum(models.OrderArchive.order_id), 0),
+        )\
+            .filter(models.OrderArchive.line_id == line_id)\
+            .one()
+        etag = f'{etag[:-1]}-a{archived_count}-{archived_ids}"'
+    return etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison (RFC 9110), so a W/ prefix is ignored"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
@@ -0,0 +1,198 @@
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.linebot_usage.models import LineBotUsage
+from app.order import models
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = "order_created"
+ORDER_STATUS_CHANGED = "order_status_changed"
+PAYMENT_STATUS_CHANGED = "payment_status_changed"
+
+
+def _event_row(order_id: int, line_id: Optional[str], event_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    return {
+        "order_id": order_id,
+        "line_id": line_id,
+        "event_type": event_type,
+        "payload": json.dumps({"order_id": order_id, **payload}, ensure_ascii=False, default=str),
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "create_time": now,
+    }
+
+
+def record_event(db: Session, order: models.Order, event_type: str, **payload: Any) -> None:
+    """Queue an event for `order` in the caller's transaction; it is sent only if that commits"""
+    db.execute(insert(models.OrderEvent), [_event_row(order.order_id, order.line_id, event_type, payload)])
+
+
+def record_status_events(
+    db: Session,
+    changes: Iterable[Tuple[int, Optional[str], Optional[str]]],
+    event_type: str,
+    field: str,
+    new_value: str,
+) -> None:
+    """Queue one event per (order_id, line_id, previous value) with a single executemany insert"""
+    rows = [
+        _event_row(order_id, line_id, event_type, {field: new_value, "previous": previous})
+        for order_id, line_id, previous in changes
+    ]
+    if rows:
+        db.execute(insert(models.OrderEvent), rows)
+
+
+class OrderEventSender(ABC):
+    """
+    Delivers one order event, e.g. as a LINE push message.
+
+    send() returns the number of pushes it made (recorded in LineBotUsage)
+    and raises to have the event retried later.
+    """
+
+    @abstractmethod
+    def send(self, event: models.OrderEvent) -> int:
+        ...
+
+
+class LogSender(OrderEventSender):
+    """Default sender: only logs the event, no push is made"""
+
+    def send(self, event: models.OrderEvent) -> int:
+        logger.info("order event %s for order %s: %s", event.event_type, event.order_id, event.payload)
+        return 0
+
+
+class StubSender(OrderEventSender):
+    """Local sender for tests: remembers every event and counts one push each"""
+
+    def __init__(self, fail_times: int = 0):
+        self.fail_times = fail_times
+        self.sent: List[Dict[str, Any]] = []
+
+    def send(self, event: models.OrderEvent) -> int:
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise RuntimeError("stub sender failure")
+        self.sent.append({"event_type": event.event_type, "line_id": event.line_id, **json.loads(event.payload)})
+        return 1
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    # 指數退避：2, 4, 8 ... 秒，最多 10 分鐘
+    return timedelta(seconds=min(2 ** attempts, 600))
+
+
+def _record_pushes(db: Session, pushes: int) -> None:
+    """Add to today's push count with one INSERT ... ON CONFLICT/DUPLICATE KEY UPDATE"""
+    table = LineBotUsage.__table__
+    row = {"date": date.today(), "push_count": pushes}
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(table).values(row)
+        db.execute(stmt.on_duplicate_key_update(push_count=table.c.push_count + stmt.inserted.push_count))
+    elif dialect in ("sqlite", "postgresql"):
+        stmt = (sqlite.insert if dialect == "sqlite" else postgresql.insert)(table).values(row)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.date],
+            set_={"push_count": table.c.push_count + stmt.excluded.push_count},
+        ))
+    else:
+        result = db.execute(
+            update(table).where(table.c.date == row["date"]).values(push_count=table.c.push_count + pushes)
+        )
+        if not result.rowcount:
+            db.execute(insert(table).values(**row))
+
+
+def dispatch_pending(db: Session, sender: OrderEventSender, batch_size: int = 100, max_attempts: int = 5) -> Dict[str, int]:
+    """
+    Send up to `batch_size` due events and commit their outcome.
+
+    Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED so several
+    dispatchers can run at once. Failed sends are retried with backoff and
+    marked failed after `max_attempts`.
+    """
+    now = datetime.utcnow()
+    events = db.scalars(
+        select(models.OrderEvent)
+        .where(models.OrderEvent.status == "pending", models.OrderEvent.next_attempt_at <= now)
+        .order_by(models.OrderEvent.event_id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    result = {"sent": 0, "retried": 0, "failed": 0}
+    pushes = 0
+    for event in events:
+        try:
+            pushes += sender.send(event)
+        except Exception as e:
+            event.attempts += 1
+            event.last_error = str(e)[:255]
+            if event.attempts >= max_attempts:
+                event.status = "failed"
+                result["failed"] += 1
+            else:
+                event.next_attempt_at = now + _retry_delay(event.attempts)
+                result["retried"] += 1
+            continue
+        event.status = "sent"
+        event.sent_time = datetime.utcnow()
+        result["sent"] += 1
+
+    if pushes:
+        _record_pushes(db, pushes)
+    db.commit()
+    return result
+
+
+class OrderEventDispatcher:
+    """Background thread that drains the order_events outbox every `interval` seconds"""
+
+    def __init__(self, session_factory: sessionmaker, sender: OrderEventSender, interval: float, batch_size: int = 100):
+        self.session_factory = session_factory
+        self.sender = sender
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="order-event-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def dispatch(self) -> Dict[str, int]:
+        db = self.session_factory()
+        try:
+            return dispatch_pending(db, self.sender, self.batch_size)
+        except Exception:
+            logger.exception("Failed to dispatch order events")
+            db.rollback()
+            return {"sent": 0, "retried": 0, "failed": 0}
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            # 一批處理滿代表仍有積壓，立即再取下一批
+            while not self._stop.is_set():
+                if sum(self.dispatch().values()) < self.batch_size:
+                    break
@@ -0,0 +1,45 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from app.order import models, schemas
+
+
+def idempotency_ttl() -> timedelta:
+    """How long a replayed Idempotency-Key returns the original order"""
+    return timedelta(hours=float(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24")))
+
+
+def request_fingerprint(order: schemas.OrderCreate) -> str:
+    """Compact hash of the request body; pydantic serialises fields in a fixed order"""
+    return hashlib.blake2b(order.model_dump_json().encode("utf-8"), digest_size=16).hexdigest()
+
+
+def find_key(db: Session, line_id: str, key: str) -> Optional[models.OrderIdempotencyKey]:
+    """The live record for `key`; an expired record is deleted so the key can be reused"""
+    record = db.query(models.OrderIdempotencyKey).filter(
+        models.OrderIdempotencyKey.line_id == line_id,
+        models.OrderIdempotencyKey.idempotency_key == key,
+    ).first()
+    if record is None:
+        return None
+    # 過期或原訂單已被刪除時，視為新的請求
+    if record.create_time < datetime.utcnow() - idempotency_ttl() or db.get(models.Order, record.order_id) is None:
+        db.delete(record)
+        db.flush()
+        return None
+    return record
+
+
+def purge_expired_keys(db: Session) -> int:
+    """Delete every expired key with a single statement; returns the number removed"""
+    cutoff = datetime.utcnow() - idempotency_ttl()
+    result = db.execute(
+        delete(models.OrderIdempotencyKey).where(models.OrderIdempotencyKey.create_time < cutoff)
+    )
+    db.commit()
+    return result.rowcount
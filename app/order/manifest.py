@@ -0,0 +1,137 @@
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.location.models import Schedule
+from app.order import models
+from app.order.reports import OrderReportContext, order_list_row
+
+# (訂單數, revision 總和, order_id 總和)：任何訂單新增、刪除、改時段或內容變動都會改變
+ManifestStamp = Tuple[int, int, int]
+
+
+def schedule_stamp(db: Session, schedule_id: int) -> ManifestStamp:
+    """One aggregate query that changes whenever an order on the schedule changes"""
+    count, revisions, order_ids = db.query(
+        func.count(models.Order.order_id),
+        func.coalesce(func.sum(models.Order.revision), 0),
+        func.coalesce(func.sum(models.Order.order_id), 0),
+    )\
+        .filter(models.Order.schedule_id == schedule_id)\
+        .one()
+    return int(count), int(revisions), int(order_ids)
+
+
+def build_pickup_manifest(db: Session, schedule: Schedule) -> Dict[str, Any]:
+    """
+    Everything staff need at one pickup slot, grouped by customer.
+
+    Customers are sorted by name, their orders by id and items by detail id.
+    Cancelled orders are left out. Item rows reuse the pickup sheet format
+    (unit display for sets, remark, finish state).
+    """
+    orders_query = db.query(models.Order).filter(
+        models.Order.schedule_id == schedule.schedule_id,
+        models.Order.order_status != "cancelled",
+    )
+    orders = orders_query.order_by(models.Order.order_id).all()
+    location = schedule.location
+
+    customers: Dict[str, Dict[str, Any]] = {}
+    if orders:
+        ctx = OrderReportContext(db, orders_query)
+        for order in orders:
+            customer = ctx.customers.get(order.line_id)
+            entry = customers.setdefault(order.line_id, {
+                "line_id": order.line_id,
+                "name": customer.name if customer else "",
+                "line_name": customer.line_name if customer else "",
+                "phone": customer.phone if customer and customer.phone else "",
+                "finished_items": 0,
+                "total_items": 0,
+                "orders": [],
+            })
+            items = []
+            for detail in ctx.details_by_order.get(order.order_id, []):
+                row = order_list_row(
+                    order, detail, customer, schedule, location,
+                    ctx.products.get(detail.product_id), ctx.ladders.get(detail.product_id)
+                )
+                items.append({
+                    "order_detail_id": detail.order_detail_id,
+                    "product_id": detail.product_id,
+                    "product_name": row["商品名稱"],
+                    "quantity": detail.quantity,
+                    "unit": row["單位"],
+                    "subtotal": row["小計金額"],
+                    "remark": row["備註"],
+                    "is_finish": bool(detail.is_finish),
+                })
+            entry["orders"].append({
+                "order_id": order.order_id,
+                "order_status": order.order_status,
+                "payment_status": order.payment_status,
+                "payment_method": order.payment_method,
+                "total_amount": float(order.total_amount or 0),
+                "items": items,
+            })
+            entry["total_items"] += len(items)
+            entry["finished_items"] += sum(1 for item in items if item["is_finish"])
+
+    return {
+        "schedule_id": schedule.schedule_id,
+        "date": schedule.date.isoformat() if schedule.date else None,
+        "pickup_time": f"{schedule.pickup_start_time} - {schedule.pickup_end_time}",
+        "location": location.name if location else "",
+        "order_count": len(orders),
+        "customers": sorted(customers.values(), key=lambda c: (c["name"], c["line_id"])),
+    }
+
+
+class PickupManifestCache:
+    """
+    Per-worker cache of pickup manifests keyed by schedule_id.
+
+    Each read runs one aggregate query (schedule_stamp) and rebuilds only
+    when an order on the schedule changed, so the check is correct across
+    workers and order writes need no explicit invalidation. The TTL bounds staleness from changes the stamp cannot see,
+    such as a renamed customer or product.
+    """
+
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._manifests: Dict[int, Tuple[float, ManifestStamp, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session, schedule: Schedule) -> Dict[str, Any]:
+        stamp = schedule_stamp(db, schedule.schedule_id)
+        manifest = self._lookup(schedule.schedule_id, stamp)
+        if manifest is not None:
+            return manifest
+        manifest = build_pickup_manifest(db, schedule)
+        with self._lock:
+            self._manifests[schedule.schedule_id] = (time.monotonic(), stamp, manifest)
+        return manifest
+
+    def _lookup(self, schedule_id: int, stamp: ManifestStamp) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._manifests.get(schedule_id)
+            if entry is not None and entry[1] == stamp and time.monotonic() - entry[0] < self.ttl_seconds:
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._manifests.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+pickup_manifests = PickupManifestCache()
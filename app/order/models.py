@@ -1,6 +1,7 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Numeric, ForeignKey, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, Numeric, ForeignKey, Boolean, Index, UniqueConstraint
+from sqlalchemy import event
+from sqlalchemy.orm import Session, relationship
 
 from app.db import Base
 
@@ -29,6 +30,15 @@ class Order(Base):
     delivery_method = Column(String(50), nullable=True)  # 新增配送方式欄位
     create_time = Column(DateTime, default=datetime.utcnow)
     update_time = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 訂單或其明細每次變動就遞增，用來判斷快取是否過期
+    revision = Column(Integer, default=0, server_default="0", nullable=False)
+
+    __table_args__ = (
+        # 供 keyset 分頁使用 (order_date, order_id)
+        Index('ix_orders_order_date_order_id', 'order_date', 'order_id'),
+        # 封存工作依狀態與訂購日期挑出舊訂單
+        Index('ix_orders_order_status_order_date', 'order_status', 'order_date'),
+    )
 
     # Relationships
     customer = relationship("Customer", back_populates="orders")
@@ -52,3 +62,123 @@ class OrderDetail(Base):
     order = relationship("Order", back_populates="order_details")
     product = relationship("Product", back_populates="order_details")
     discount = relationship("ProductDiscount", back_populates="order_details")
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_order_revisions(session, flush_context, instances):
+    """Increment Order.revision for every order whose row or details change in this flush"""
+    changed = set()
+    for obj in session.dirty:
+        if isinstance(obj, Order) and session.is_modified(obj, include_collections=False):
+            changed.add(obj.order_id)
+        elif isinstance(obj, OrderDetail) and session.is_modified(obj, include_collections=False):
+            changed.add(obj.order_id)
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, OrderDetail):
+            changed.add(obj.order_id)
+
+    for order_id in changed:
+        if order_id is None:
+            continue
+        order = session.get(Order, order_id)
+        if order is None or order in session.deleted or order in session.new:
+            continue
+        # 以 SQL 運算式遞增，併發更新也不會遺失
+        order.revision = Order.revision + 1
+
+
+class OrderIdempotencyKey(Base):
+    __tablename__ = "order_idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    line_id = Column(String(100), nullable=False)
+    idempotency_key = Column(String(100), nullable=False)
+    fingerprint = Column(String(32), nullable=False)  # 請求內容的雜湊，用來辨識同一把 key 被用在不同請求
+    order_id = Column(Integer, ForeignKey("orders.order_id", ondelete="CASCADE"), nullable=False)
+    create_time = Column(DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        UniqueConstraint('line_id', 'idempotency_key', name='uq_order_idempotency_keys_line_id_key'),
+    )
+
+
+class ProductSalesSummary(Base):
+    """Per-product order line totals by order status, maintained alongside order writes"""
+    __tablename__ = "product_sales_summary"
+
+    product_id = Column(Integer, primary_key=True)
+    order_status = Column(String(50), primary_key=True)
+    quantity = Column(Integer, default=0, nullable=False)
+    subtotal = Column(Numeric(12, 2), default=0, nullable=False)
+    line_count = Column(Integer, default=0, nullable=False)
+
+
+class ProductSalesDelta(Base):
+    """
+    Pending change to product_sales_summary, appended in the order transaction
+    and folded into the summary by the background flusher (no hot-row lock at checkout)
+    """
+    __tablename__ = "product_sales_deltas"
+
+    delta_id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, nullable=False)
+    order_status = Column(String(50), nullable=False)
+    quantity = Column(Integer, default=0, nullable=False)
+    subtotal = Column(Numeric(12, 2), default=0, nullable=False)
+    line_count = Column(Integer, default=0, nullable=False)
+
+
+class OrderEvent(Base):
+    """Outbox row written in the same transaction as the order change it describes"""
+    __tablename__ = "order_events"
+
+    event_id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, nullable=False)  # 不設外鍵，訂單刪除後事件仍需送出
+    line_id = Column(String(100), nullable=True)
+    event_type = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    status = Column(String(20), default="pending", nullable=False)  # pending, sent, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(String(255), nullable=True)
+    create_time = Column(DateTime, default=datetime.utcnow)
+    sent_time = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # 派送器依狀態與下次嘗試時間取出待送事件
+        Index('ix_order_events_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+
+class OrderArchive(Base):
+    """Completed or cancelled orders moved out of `orders` by the archive job (same columns)"""
+    __tablename__ = "orders_archive"
+
+    order_id = Column(Integer, primary_key=True)
+    line_id = Column(String(100), index=True)
+    schedule_id = Column(Integer, nullable=True)
+    order_date = Column(DateTime)
+    order_status = Column(String(50))
+    payment_method = Column(String(50), nullable=True)
+    payment_status = Column(String(50))
+    total_amount = Column(Numeric(10, 2))
+    delivery_address = Column(String(255), nullable=True)
+    delivery_method = Column(String(50), nullable=True)
+    create_time = Column(DateTime)
+    update_time = Column(DateTime)
+    revision = Column(Integer, default=0, server_default="0", nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+class OrderDetailArchive(Base):
+    """Details of archived orders (same columns as `order_details`)"""
+    __tablename__ = "order_details_archive"
+
+    order_detail_id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, index=True)
+    product_id = Column(Integer, index=True)
+    quantity = Column(Integer)
+    unit_price = Column(Numeric(10, 2))
+    subtotal = Column(Numeric(10, 2))
+    discount_id = Column(Integer, nullable=True)
+    is_finish = Column(Boolean, default=False)
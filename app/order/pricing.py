@@ -0,0 +1,95 @@
+from typing import Any, Dict, List
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.product.cache import DiscountLadder, discount_ladders
+from app.product.models import Product
+from app.order import schemas
+
+
+def calculate_price_with_ladder(product: Product, quantity: int, ladder: DiscountLadder) -> Dict[str, Any]:
+    """
+    Price one cart line against an already loaded discount ladder.
+
+    Args:
+        product: The product object
+        quantity: The quantity ordered
+        ladder: The product's discount ladder
+
+    Returns:
+        Dictionary with price, originalPrice, and savedAmount
+    """
+    # 使用原始單價（如果有），否則使用商品的單價
+    # 注意：後端沒有 originalUnitPrice 的概念，所以只檢查 one_set_price 和 price
+    base_price = float(product.one_set_price if product.one_set_quantity else product.price)
+    original_total = base_price * quantity
+
+    # 找到符合當前數量的最大折扣（數量大於等於折扣要求數量）
+    applicable_discount = ladder.best_tier(quantity)
+
+    if applicable_discount:
+        # 如果找到符合的折扣，使用折扣價格
+        discount_quantity, discount_price = applicable_discount
+        discount_sets = quantity // discount_quantity
+        remaining_quantity = quantity % discount_quantity
+
+        # 計算折扣價格和剩餘數量的原價
+        final_price = (discount_sets * discount_price) + (remaining_quantity * base_price)
+
+        return {
+            "price": final_price,
+            "originalPrice": original_total,
+            "savedAmount": original_total - final_price
+        }
+
+    # 如果沒有折扣，使用原價
+    return {
+        "price": original_total,
+        "originalPrice": original_total,
+        "savedAmount": 0
+    }
+
+
+def calculate_item_subtotal(product: Product, quantity: int, db: Session) -> Dict[str, Any]:
+    """
+    Calculate item subtotal based on the same logic as calculateItemPrice in CartPage.jsx
+
+    Args:
+        product: The product object
+        quantity: The quantity ordered
+        db: Database session
+
+    Returns:
+        Dictionary with price, originalPrice, and savedAmount
+    """
+    # 折扣階梯由快取提供，命中時不查詢資料庫
+    ladder = discount_ladders.get(db, product.product_id)
+    return calculate_price_with_ladder(product, quantity, ladder)
+
+
+def quote_cart(items: List[schemas.QuoteItem], db: Session) -> Dict[str, Any]:
+    """
+    Price a whole cart: one IN query for the products, one for uncached discount ladders.
+    """
+    product_ids = {item.product_id for item in items}
+    products = {
+        p.product_id: p for p in db.query(Product).filter(Product.product_id.in_(product_ids))
+    }
+    for item in items:
+        if item.product_id not in products:
+            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
+
+    ladders = discount_ladders.get_many(db, product_ids)
+
+    lines = []
+    for item in items:
+        line = calculate_price_with_ladder(products[item.product_id], item.quantity, ladders[item.product_id])
+        lines.append({"product_id": item.product_id, "quantity": item.quantity, **line})
+
+    return {
+        "items": lines,
+        "totalPrice": sum(line["price"] for line in lines),
+        "totalOriginalPrice": sum(line["originalPrice"] for line in lines),
+        "totalSavedAmount": sum(line["savedAmount"] for line in lines),
+    }
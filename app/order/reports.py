@@ -0,0 +1,385 @@
+from collections import defaultdict
+import csv
+import io
+import json
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Query, Session
+
+from app.customer.models import Customer
+from app.location.models import PickupLocation, Schedule
+from app.order import models
+from app.order.pricing import calculate_price_with_ladder
+from app.product.cache import DiscountLadder, discount_ladders
+from app.product.models import Product
+
+STATUS_MAPPING = {
+    "pending": "待處理",
+    "paid": "已付款",
+    "preparing": "準備中",
+    "ready_for_pickup": "可取貨",
+    #部分完成
+    "partial_completed": "分批取貨",
+    "completed": "已完成",
+    "cancelled": "已取消"
+}
+
+
+def order_tables(archived: bool = False):
+    """(order model, detail model) for the hot tables or the archive tables"""
+    if archived:
+        return models.OrderArchive, models.OrderDetailArchive
+    return models.Order, models.OrderDetail
+
+
+class OrderReportContext:
+    """
+    Lookup tables for the orders of a report, loaded with one query per table.
+    """
+
+    def __init__(self, db: Session, orders_query: Query, archived: bool = False):
+        order_model, detail_model = order_tables(archived)
+        order_ids = orders_query.with_entities(order_model.order_id).scalar_subquery()
+        line_ids = orders_query.with_entities(order_model.line_id).scalar_subquery()
+        schedule_ids = orders_query.with_entities(order_model.schedule_id).scalar_subquery()
+
+        details = db.query(detail_model)\
+            .filter(detail_model.order_id.in_(order_ids))\
+            .order_by(detail_model.order_id, detail_model.order_detail_id)\
+            .all()
+        self.details_by_order: Dict[int, List[models.OrderDetail]] = defaultdict(list)
+        for detail in details:
+            self.details_by_order[detail.order_id].append(detail)
+
+        self.customers: Dict[str, Customer] = {
+            c.line_id: c for c in db.query(Customer).filter(Customer.line_id.in_(line_ids))
+        }
+        self.schedules: Dict[int, Schedule] = {
+            s.schedule_id: s for s in db.query(Schedule).filter(Schedule.schedule_id.in_(schedule_ids))
+        }
+        location_ids = db.query(Schedule.location_id)\
+            .filter(Schedule.schedule_id.in_(schedule_ids))\
+            .scalar_subquery()
+        self.locations: Dict[int, PickupLocation] = {
+            l.location_id: l for l in db.query(PickupLocation).filter(PickupLocation.location_id.in_(location_ids))
+        }
+
+        product_ids = db.query(detail_model.product_id)\
+            .filter(detail_model.order_id.in_(order_ids))\
+            .scalar_subquery()
+        self.products: Dict[int, Product] = {
+            p.product_id: p for p in db.query(Product).filter(Product.product_id.in_(product_ids))
+        }
+        self.ladders: Dict[int, DiscountLadder] = discount_ladders.get_many(db, self.products)
+
+
+def order_list_row(
+    order: models.Order,
+    order_detail: models.OrderDetail,
+    customer: Optional[Customer],
+    schedule: Optional[Schedule],
+    location: Optional[PickupLocation],
+    product: Optional[Product],
+    ladder: Optional[DiscountLadder],
+) -> Dict[str, Any]:
+    """Build one row of the pickup sheet (same keys as GET /orders/list/all)"""
+    # 檢查商品是否存在
+    if product is None:
+        # 商品已被刪除，使用預設值
+        unit_display = ""
+        remark = "商品已下架"
+        # 顯示價格為 0，避免累計到總額
+        item_subtotal = {
+            "price": 0.0,
+            "originalPrice": 0.0,
+            "savedAmount": 0
+        }
+    else:
+        # Format unit display
+        if product.one_set_quantity and product.one_set_quantity > 1:
+            unit_display = f"組(每組{product.one_set_quantity}{product.unit})"
+        else:
+            unit_display = product.unit
+
+        if product.arrival_date and product.arrival_date > date.today():
+            remark = "未到貨"
+        else:
+            remark = ""
+
+        # Calculate item subtotal based on CartPage.jsx calculateItemPrice logic
+        item_subtotal = calculate_price_with_ladder(product, order_detail.quantity, ladder)
+
+    return {
+        '訂單編號': order.order_id,
+        '訂購人': customer.name if customer else '',
+        'LINE姓名': customer.line_name if customer else '',
+        '電話': customer.phone if customer and customer.phone else '',
+        '日期': schedule.date if schedule else '',
+        '地點': location.name if location else '',
+        '商品名稱': product.product_name if product else '商品已下架',
+        '數量': order_detail.quantity,
+        '單位': unit_display,
+        "小計金額": float(item_subtotal["price"]),
+        '備註': remark,
+        '明細編號': order_detail.order_detail_id,
+        '領取狀態': "已領取" if order_detail.is_finish else "未領取",
+        '訂單狀態': STATUS_MAPPING.get(order.order_status, ''),
+        "配送方式": order.delivery_method,
+        "配送地址": order.delivery_address,
+    }
+
+
+def build_order_list_rows(db: Session, orders_query: Optional[Query] = None, archived: bool = False) -> List[Dict[str, Any]]:
+    """
+    Build the all-orders pickup sheet with a fixed number of queries.
+
+    Orders, details, customers, schedules, locations, products and discount
+    ladders are each fetched once, then joined in memory. With archived=True
+    the rows come from the archive tables instead.
+    """
+    order_model, _ = order_tables(archived)
+    if orders_query is None:
+        orders_query = db.query(order_model)
+
+    orders = orders_query.order_by(order_model.order_id).all()
+    if not orders:
+        return []
+
+    ctx = OrderReportContext(db, orders_query, archived)
+
+    rows = []
+    for order in orders:
+        customer = ctx.customers.get(order.line_id)
+        schedule = ctx.schedules.get(order.schedule_id)
+        location = ctx.locations.get(schedule.location_id) if schedule else None
+        for order_detail in ctx.details_by_order.get(order.order_id, []):
+            product = ctx.products.get(order_detail.product_id)
+            ladder = ctx.ladders.get(order_detail.product_id)
+            rows.append(order_list_row(order, order_detail, customer, schedule, location, product, ladder))
+    return rows
+
+
+def filter_orders_for_report(
+    db: Session,
+    schedule_date: Optional[date] = None,
+    location_id: Optional[int] = None,
+    status: Optional[str] = None,
+) -> Query:
+    """Orders query restricted by pickup date, pickup location and order status"""
+    query = db.query(models.Order)
+    if schedule_date is not None or location_id is not None:
+        schedule_ids = db.query(Schedule.schedule_id)
+        if schedule_date is not None:
+            schedule_ids = schedule_ids.filter(Schedule.date == schedule_date)
+        if location_id is not None:
+            schedule_ids = schedule_ids.filter(Schedule.location_id == location_id)
+        query = query.filter(models.Order.schedule_id.in_(schedule_ids.scalar_subquery()))
+    if status:
+        query = query.filter(models.Order.order_status == status)
+    return query
+
+
+def iter_order_list_rows(db: Session, orders_query: Query, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """
+    Stream pickup sheet rows without materialising the whole report.
+
+    Discount ladders are resolved up front; everything else comes from one
+    joined query read through a server-side cursor (yield_per), so no other
+    statement is issued on the connection while the cursor is open.
+    """
+    order_ids = orders_query.with_entities(models.Order.order_id).scalar_subquery()
+    product_ids = db.query(models.OrderDetail.product_id)\
+        .filter(models.OrderDetail.order_id.in_(order_ids))\
+        .distinct()\
+        .all()
+    ladders = discount_ladders.get_many(db, [product_id for (product_id,) in product_ids if product_id is not None])
+
+    stream = db.query(models.Order, models.OrderDetail, Customer, Schedule, PickupLocation, Product)\
+        .select_from(models.Order)\
+        .join(models.OrderDetail, models.OrderDetail.order_id == models.Order.order_id)\
+        .outerjoin(Customer, Customer.line_id == models.Order.line_id)\
+        .outerjoin(Schedule, Schedule.schedule_id == models.Order.schedule_id)\
+        .outerjoin(PickupLocation, PickupLocation.location_id == Schedule.location_id)\
+        .outerjoin(Product, Product.product_id == models.OrderDetail.product_id)\
+        .filter(models.Order.order_id.in_(order_ids))\
+        .order_by(models.Order.order_id, models.OrderDetail.order_detail_id)\
+        .yield_per(batch_size)
+
+    for order, order_detail, customer, schedule, location, product in stream:
+        yield order_list_row(
+            order, order_detail, customer, schedule, location, product,
+            ladders.get(order_detail.product_id)
+        )
+
+
+def build_product_order_rows(db: Session, product_id: int, archived: bool = False) -> List[Dict[str, Any]]:
+    """
+    Simplified rows for every order containing `product_id`, from one joined query.
+
+    Each row lists all items of the order, as the per-order version did;
+    items whose product was deleted are left out. With archived=True the
+    rows come from the archive tables instead.
+    """
+    order_model, detail_model = order_tables(archived)
+    order_ids = db.query(detail_model.order_id)\
+        .filter(detail_model.product_id == product_id)\
+        .scalar_subquery()
+
+    lines = db.query(
+        order_model.order_id,
+        order_model.total_amount,
+        Customer.name,
+        PickupLocation.name,
+        Schedule.schedule_id,
+        Schedule.date,
+        Schedule.pickup_start_time,
+        Schedule.pickup_end_time,
+        Product.product_name,
+        Product.unit,
+        detail_model.quantity,
+        detail_model.subtotal,
+    )\
+        .select_from(order_model)\
+        .outerjoin(detail_model, detail_model.order_id == order_model.order_id)\
+        .outerjoin(Product, Product.product_id == detail_model.product_id)\
+        .outerjoin(Customer, Customer.line_id == order_model.line_id)\
+        .outerjoin(Schedule, Schedule.schedule_id == order_model.schedule_id)\
+        .outerjoin(PickupLocation, PickupLocation.location_id == Schedule.location_id)\
+        .filter(order_model.order_id.in_(order_ids))\
+        .order_by(order_model.order_id, detail_model.order_detail_id)
+
+    rows: List[Dict[str, Any]] = []
+    for (order_id, total_amount, customer_name, location_name, schedule_id, schedule_date,
+         start_time, end_time, product_name, unit, quantity, subtotal) in lines:
+        if not rows or rows[-1]["訂單編號"] != order_id:
+            rows.append({
+                "訂單編號": order_id,
+                "訂購人": customer_name or "",
+                "取貨地點": location_name or "",
+                "取貨日期": schedule_date.isoformat() if schedule_date else "",
+                "取貨時間": f"{start_time} - {end_time}" if schedule_id is not None else "",
+                "訂購金額": float(total_amount),
+                "訂購項目": []
+            })
+        if product_name is not None:
+            rows[-1]["訂購項目"].append({
+                "product_name": product_name,
+                "quantity": quantity,
+                "unit": unit,
+                "subtotal": float(subtotal)
+            })
+    return rows
+
+
+def product_demand_rollup(db: Session, product_id: int, include_archived: bool = False) -> Dict[str, Any]:
+    """
+    Ordered quantity of one product per pickup schedule and per pickup location.
+
+    One GROUP BY query per schedule; location totals are summed from it.
+    Cancelled orders are excluded; orders without a schedule (delivery) are
+    grouped under a null schedule and location. include_archived adds the
+    archive tables' quantities.
+    """
+    groups = []
+    for archived in ((False, True) if include_archived else (False,)):
+        order_model, detail_model = order_tables(archived)
+        groups += db.query(
+            Schedule.schedule_id,
+            Schedule.date,
+            Schedule.pickup_start_time,
+            Schedule.pickup_end_time,
+            PickupLocation.location_id,
+            PickupLocation.name,
+            func.sum(detail_model.quantity),
+            func.count(func.distinct(order_model.order_id)),
+        )\
+            .select_from(detail_model)\
+            .join(order_model, order_model.order_id == detail_model.order_id)\
+            .outerjoin(Schedule, Schedule.schedule_id == order_model.schedule_id)\
+            .outerjoin(PickupLocation, PickupLocation.location_id == Schedule.location_id)\
+            .filter(detail_model.product_id == product_id, order_model.order_status != "cancelled")\
+            .group_by(
+                Schedule.schedule_id, Schedule.date, Schedule.pickup_start_time, Schedule.pickup_end_time,
+                PickupLocation.location_id, PickupLocation.name
+            )\
+            .order_by(Schedule.date, Schedule.schedule_id)\
+            .all()
+
+    # 含封存訂單時同一場次可能出現兩次，依場次合併
+    if include_archived:
+        groups.sort(key=lambda g: (g[1] is not None, g[1] or date.min, g[0] or 0))
+    by_schedule = []
+    schedule_index: Dict[Optional[int], Dict[str, Any]] = {}
+    by_location: Dict[Optional[int], Dict[str, Any]] = {}
+    for schedule_id, schedule_date, start_time, end_time, location_id, location_name, quantity, order_count in groups:
+        quantity = int(quantity or 0)
+        schedule = schedule_index.get(schedule_id)
+        if schedule is None:
+            schedule = schedule_index[schedule_id] = {
+                "schedule_id": schedule_id,
+                "date": schedule_date.isoformat() if schedule_date else None,
+                "pickup_time": f"{start_time} - {end_time}" if schedule_id is not None else None,
+                "location_id": location_id,
+                "location_name": location_name,
+                "quantity": 0,
+                "order_count": 0,
+            }
+            by_schedule.append(schedule)
+        schedule["quantity"] += quantity
+        schedule["order_count"] += order_count
+        location = by_location.setdefault(location_id, {
+            "location_id": location_id, "location_name": location_name, "quantity": 0, "order_count": 0
+        })
+        location["quantity"] += quantity
+        location["order_count"] += order_count
+
+    return {
+        "product_id": product_id,
+        "total_quantity": sum(group["quantity"] for group in by_schedule),
+        "order_count": sum(group["order_count"] for group in by_schedule),
+        "by_location": sorted(by_location.values(), key=lambda l: -l["quantity"]),
+        "by_schedule": by_schedule,
+    }
+
+
+EXPORT_COLUMNS = [
+    '訂單編號', '訂購人', 'LINE姓名', '電話', '日期', '地點', '商品名稱', '數量', '單位',
+    "小計金額", '備註', '明細編號', '領取狀態', '訂單狀態', "配送方式", "配送地址",
+]
+
+
+def encode_csv(rows: Iterator[Dict[str, Any]], flush_every: int = 200) -> Iterator[str]:
+    """Encode rows as CSV chunks; the header (with a BOM for Excel) is sent first"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    buffer.write("\ufeff")
+    writer.writeheader()
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= flush_every:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def encode_ndjson(rows: Iterator[Dict[str, Any]], flush_every: int = 200) -> Iterator[str]:
+    """Encode rows as newline-delimited JSON chunks"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False, default=str))
+        if len(lines) >= flush_every:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
@@ -1,70 +1,60 @@
 from typing import List, Optional
 from decimal import Decimal
 from datetime import datetime, date
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.db import get_db
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from app.db import get_db, get_read_db
+from app.pagination import keyset_page
 from app.auth.dependencies import get_current_user
 from app.customer.models import Customer
+from app.product.cache import discount_ladders
 from app.product.models import Product, ProductDiscount
-from app.photo.models import ProductPhoto
+from app.product.stock import available_units, release_stock, reserve_many, reserve_stock, stock_units
 from app.order import models, schemas
 from app.auth.dependencies import get_current_user
 from app.location.models import PickupLocation, Schedule
+from app.order.events import (
+    ORDER_CREATED,
+    ORDER_STATUS_CHANGED,
+    PAYMENT_STATUS_CHANGED,
+    record_event,
+    record_status_events,
+)
+from app.order.archive import archive_orders, archived_customer_orders
+from app.order.etags import customer_orders_etag, etag_matches, order_etag
+from app.order.manifest import pickup_manifests
+from app.order.idempotency import find_key, purge_expired_keys, request_fingerprint
+from app.order.sales_summary import move_orders, read_sales_summary, rebuild_sales_summary, record_lines
+from app.order.totals import check_order_totals, recalculate_order_total
+from app.order.pricing import calculate_price_with_ladder, quote_cart
+from app.order.reports import (
+    build_order_list_rows,
+    build_product_order_rows,
+    encode_csv,
+    encode_ndjson,
+    filter_orders_for_report,
+    iter_order_list_rows,
+    product_demand_rollup,
+)
 from typing import Dict, Any
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
+VALID_ORDER_STATUSES = ["pending", "paid", "preparing", "ready_for_pickup", "partial_completed", "completed", "cancelled"]
+VALID_PAYMENT_STATUSES = ["pending", "paid", "refunded"]
 
-def calculate_item_subtotal(product: Product, quantity: int, db: Session) -> Dict[str, Any]:
+
+@router.post("/quote", response_model=schemas.Quote)
+def quote_order(quote: schemas.QuoteRequest, db: Session = Depends(get_db)):
     """
-    Calculate item subtotal based on the same logic as calculateItemPrice in CartPage.jsx
-    
-    Args:
-        product: The product object
-        quantity: The quantity ordered
-        db: Database session
-        
-    Returns:
-        Dictionary with price, originalPrice, and savedAmount
+    Price a whole cart in one call, using the same rules as calculateItemPrice in CartPage.jsx.
+
+    Returns price, originalPrice and savedAmount per line plus the cart totals.
     """
-    # 使用原始單價（如果有），否則使用商品的單價
-    # 注意：後端沒有 originalUnitPrice 的概念，所以只檢查 one_set_price 和 price
-    base_price = float(product.one_set_price if product.one_set_quantity else product.price)
-    original_total = base_price * quantity
-    
-    # 檢查是否有適用的折扣
-    discounts = db.query(ProductDiscount)\
-        .filter(ProductDiscount.product_id == product.product_id)\
-        .all()
-    
-    if discounts:
-        # 按數量降序排序，找到符合當前數量的最大折扣
-        sorted_discounts = sorted(discounts, key=lambda d: d.quantity, reverse=True)
-        
-        # 尋找第一個適用的折扣（數量大於等於折扣要求數量）
-        applicable_discount = next((d for d in sorted_discounts if quantity >= d.quantity), None)
-        
-        if applicable_discount:
-            # 如果找到符合的折扣，使用折扣價格
-            discount_sets = quantity // applicable_discount.quantity
-            remaining_quantity = quantity % applicable_discount.quantity
-            
-            # 計算折扣價格和剩餘數量的原價
-            final_price = (discount_sets * float(applicable_discount.price)) + (remaining_quantity * base_price)
-            
-            return {
-                "price": final_price,
-                "originalPrice": original_total,
-                "savedAmount": original_total - final_price
-            }
-    
-    # 如果沒有折扣，使用原價
-    return {
-        "price": original_total,
-        "originalPrice": original_total,
-        "savedAmount": 0
-    }
+    return quote_cart(quote.items, db)
 
 
 @router.post("/{order_id}/details", response_model=schemas.Order)
@@ -75,12 +65,11 @@ def add_order_detail(order_id: int, detail: schemas.OrderDetailCreate,  db: Sess
     product = db.query(Product).filter(Product.product_id == detail.product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    actual_quantity = detail.quantity
-    if hasattr(product, 'one_set_quantity') and product.one_set_quantity and product.one_set_quantity > 0:
-        actual_quantity = detail.quantity * product.one_set_quantity
-    if product.stock_quantity < actual_quantity:
+    actual_quantity = stock_units(product, detail.quantity)
+    # 以條件式 UPDATE 原子地扣庫存，避免併發超賣
+    if not reserve_stock(db, product.product_id, actual_quantity):
+        db.rollback()
         raise HTTPException(status_code=400, detail=f"Insufficient stock for product {product.product_id}")
-    product.stock_quantity -= actual_quantity
     db_detail = models.OrderDetail(
         order_id=order_id,
         product_id=detail.product_id,
@@ -90,8 +79,9 @@ def add_order_detail(order_id: int, detail: schemas.OrderDetailCreate,  db: Sess
         discount_id=detail.discount_id
     )
     db.add(db_detail)
-    # Recalculate total
-    db_order.total_amount = sum(d.subtotal for d in db.query(models.OrderDetail).filter(models.OrderDetail.order_id == order_id)) + Decimal(str(detail.subtotal))
+    record_lines(db, db_order.order_status, [(detail.product_id, detail.quantity, detail.subtotal)])
+    # Recalculate total with one SUM() in the database
+    recalculate_order_total(db, db_order)
     db.commit()
     db.refresh(db_order)
     return db_order
@@ -108,23 +98,27 @@ def update_order_detail(order_id: int, detail_id: int, detail: schemas.OrderDeta
     product = db.query(Product).filter(Product.product_id == detail.product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    # 處理庫存差異
-    old_actual = db_detail.quantity
-    new_actual = detail.quantity
-    if hasattr(product, 'one_set_quantity') and product.one_set_quantity and product.one_set_quantity > 0:
-        old_actual = db_detail.quantity * product.one_set_quantity
-        new_actual = detail.quantity * product.one_set_quantity
-    diff = new_actual - old_actual
-    if diff > 0 and product.stock_quantity < diff:
-        raise HTTPException(status_code=400, detail=f"Insufficient stock for product {product.product_id}")
-    product.stock_quantity -= diff
+    # 處理庫存差異：換商品時舊商品整筆歸還、新商品整筆預留；商品已刪除則無庫存可歸還
+    changes: Dict[int, int] = {product.product_id: stock_units(product, detail.quantity)}
+    old_product = db.get(Product, db_detail.product_id) if db_detail.product_id is not None else None
+    if old_product is not None:
+        changes[old_product.product_id] = changes.get(old_product.product_id, 0) - stock_units(old_product, db_detail.quantity)
+    out_of_stock_id = reserve_many(db, {product_id: units for product_id, units in changes.items() if units > 0})
+    if out_of_stock_id is not None:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Insufficient stock for product {out_of_stock_id}")
+    for product_id in sorted(changes):
+        if changes[product_id] < 0:
+            release_stock(db, product_id, -changes[product_id])
+    record_lines(db, db_order.order_status, [(db_detail.product_id, db_detail.quantity, db_detail.subtotal)], sign=-1)
+    record_lines(db, db_order.order_status, [(detail.product_id, detail.quantity, detail.subtotal)])
     db_detail.product_id = detail.product_id
     db_detail.quantity = detail.quantity
     db_detail.unit_price = detail.unit_price
-    db_detail.subtotal = detail.subtotal
+    db_detail.subtotal = Decimal(str(detail.subtotal))
     db_detail.discount_id = detail.discount_id
-    # Recalculate total
-    db_order.total_amount = sum(d.subtotal for d in db.query(models.OrderDetail).filter(models.OrderDetail.order_id == order_id))
+    # Recalculate total with one SUM() in the database
+    recalculate_order_total(db, db_order)
     db.commit()
     db.refresh(db_order)
     return db_order
@@ -143,21 +137,57 @@ def delete_order_detail(order_id: int, detail_id: int, db: Session = Depends(get
     product = db.query(Product).filter(Product.product_id == db_detail.product_id).first()
     if product:
         # 只有商品存在時才恢復庫存
-        actual_quantity = db_detail.quantity
-        if hasattr(product, 'one_set_quantity') and product.one_set_quantity and product.one_set_quantity > 0:
-            actual_quantity = db_detail.quantity * product.one_set_quantity
-        product.stock_quantity += actual_quantity
+        release_stock(db, product.product_id, stock_units(product, db_detail.quantity))
     
+    record_lines(db, db_order.order_status, [(db_detail.product_id, db_detail.quantity, db_detail.subtotal)], sign=-1)
     db.delete(db_detail)
-    # Recalculate total
-    db_order.total_amount = sum(d.subtotal for d in db.query(models.OrderDetail).filter(models.OrderDetail.order_id == order_id))
+    # Recalculate total with one SUM() in the database
+    recalculate_order_total(db, db_order)
     db.commit()
     db.refresh(db_order)
     return db_order
 
 
+def _load_order_for_response(db: Session, order_id: int) -> Optional[models.Order]:
+    """Load an order with everything schemas.Order serialises, in a fixed number of queries"""
+    return db.query(models.Order)\
+        .options(
+            selectinload(models.Order.order_details)
+            .selectinload(models.OrderDetail.product)
+            .options(
+                selectinload(Product.categories),
+                selectinload(Product.photos),
+                selectinload(Product.discounts),
+            )
+        )\
+        .filter(models.Order.order_id == order_id)\
+        .first()
+
+
+def _replay_order(db: Session, record: models.OrderIdempotencyKey, fingerprint: str, response: Response):
+    """Return the order created by an earlier request that used the same Idempotency-Key"""
+    if record.fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    response.headers["Idempotent-Replayed"] = "true"
+    return _load_order_for_response(db, record.order_id)
+
+
 @router.post("/", response_model=schemas.Order)
-def create_order(order: schemas.OrderCreate, current_user: Customer = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_order(
+    order: schemas.OrderCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key", max_length=100),
+    current_user: Customer = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # LIFF 在網路不穩時會重送；同一把 Idempotency-Key 直接回傳原訂單，不再扣庫存
+    fingerprint = None
+    if idempotency_key:
+        fingerprint = request_fingerprint(order)
+        record = find_key(db, current_user.line_id, idempotency_key)
+        if record is not None:
+            return _replay_order(db, record, fingerprint, response)
+
     # Create new order
     total_amount = order.total_amount # 取用前端過來的 total_amount
 
@@ -191,128 +221,102 @@ def create_order(order: schemas.OrderCreate, current_user: Customer = Depends(ge
     
     db.add(db_order)
     db.flush()  # Get order_id without committing
+    # 推播等副作用寫入 outbox，與訂單同一交易提交，由背景派送器送出
+    record_event(db, db_order, ORDER_CREATED, total_amount=total_amount, delivery_method=db_order.delivery_method)
 
-    # Create order details and calculate total
+    # 一次載入所有商品與其折扣，避免每個品項各查一次
+    product_ids = {detail.product_id for detail in order.order_details}
+    products = {
+        p.product_id: p for p in db.query(Product).filter(Product.product_id.in_(product_ids))
+    }
+    discounts_by_product: Dict[int, List[ProductDiscount]] = {}
+    if products:
+        for discount in db.query(ProductDiscount)\
+                .filter(ProductDiscount.product_id.in_(products))\
+                .order_by(ProductDiscount.discount_id):
+            discounts_by_product.setdefault(discount.product_id, []).append(discount)
+
+    # 每個商品需要扣除的庫存數量，最後在同一交易中一次預留
+    requested_stock: Dict[int, int] = {}
+    detail_rows: List[Dict[str, Any]] = []
+
+    # Create order details
     for detail in order.order_details:
-        # Verify product exists and get current price
-        product = db.query(Product).filter(Product.product_id == detail.product_id).first()
+        # Verify product exists
+        product = products.get(detail.product_id)
         if not product:
             db.rollback()
             raise HTTPException(status_code=404, detail=f"Product {detail.product_id} not found")
         
-        # 計算實際需要的庫存數量
-        actual_quantity = detail.quantity
-        if product.one_set_quantity and product.one_set_quantity > 0:
-            # 如果有設定一組數量，需要將訂購數量轉換為實際庫存數量
-            actual_quantity = detail.quantity * product.one_set_quantity
-
-        # Check if there's enough stock
-        if product.stock_quantity < actual_quantity:
-            db.rollback()
-            raise HTTPException(
-                status_code=400,
-                detail=f"Insufficient stock for product {product.product_id}. Available: {product.stock_quantity}, Requested: {actual_quantity} (Order quantity: {detail.quantity})"
-            )
-        
-        # Reduce stock
-        product.stock_quantity -= actual_quantity
-        
-        # 獲取產品價格並檢查折扣
-        unit_price = float(product.price)  # 默認使用基本價格
-        discount_id = None
+        # 計算實際需要的庫存數量（如果有設定一組數量，需要將訂購數量轉換為實際庫存數量）
+        actual_quantity = stock_units(product, detail.quantity)
+        requested_stock[product.product_id] = requested_stock.get(product.product_id, 0) + actual_quantity
         
-        # 優先檢查前端傳來的折扣 ID
+        product_discounts = discounts_by_product.get(product.product_id, [])
+        discount = None
+        # 優先檢查前端傳來的折扣 ID，須存在且適用於該產品
         if detail.discount_id:
-            # 驗證折扣是否存在且適用於該產品
-            discount = db.query(ProductDiscount).filter(
-                ProductDiscount.discount_id == detail.discount_id,
-                ProductDiscount.product_id == product.product_id
-            ).first()
-            
-            # 如果找到有效的折扣，使用其價格
-            if discount:
-                discount_id = discount.discount_id
-                unit_price = float(discount.price)  # 使用折扣價格
-                # 折扣價格已經是總價，不需要再乘以數量
-                subtotal = unit_price
-                
-                # 創建訂單詳情，使用後端計算的價格
-                db_detail = models.OrderDetail(
-                    order_id=db_order.order_id,
-                    product_id=detail.product_id,
-                    quantity=detail.quantity,
-                    # unit_price=unit_price,  # 使用後端計算的單價
-                    # subtotal=subtotal,      # 使用後端計算的小計
-                    unit_price=detail.unit_price, # 使用前端傳來的單價
-                    subtotal=detail.subtotal, # 使用前端傳來的小計
-                    discount_id=discount_id
-                )
-                db.add(db_detail)
-                total_amount += subtotal
-                
-                # 跳過後面的計算，直接處理下一個訂單項目
-                continue
-        
-        # 如果沒有前端折扣 ID 或折扣無效，則根據數量查詢折扣
-        # 直接尋找與購買數量完全匹配的折扣
-        discount = db.query(ProductDiscount).filter(
-            ProductDiscount.product_id == product.product_id,
-            ProductDiscount.quantity == detail.quantity  # 購買數量完全匹配折扣要求數量
-        ).first()
+            discount = next((d for d in product_discounts if d.discount_id == detail.discount_id), None)
+        # 如果沒有前端折扣 ID 或折扣無效，直接尋找與購買數量完全匹配的折扣
+        if discount is None:
+            discount = next((d for d in product_discounts if d.quantity == detail.quantity), None)
         
-        # 如果找到完全匹配的折扣，使用其價格
-        if discount:
-            discount_id = discount.discount_id
-            unit_price = float(discount.price)  # 使用折扣價格
-            # 折扣價格已經是總價，不需要再乘以數量
-            subtotal = unit_price
-        # 如果沒有找到完全匹配的折扣但產品有套裝價格，使用套裝價格
-        elif hasattr(product, 'one_set_price') and product.one_set_price:  
-            unit_price = float(product.one_set_price)
-            # 套裝價格需要乘以數量
-            subtotal = unit_price * detail.quantity
-        else:
-            # 一般價格需要乘以數量
-            subtotal = unit_price * detail.quantity
-        
-        # 創建訂單詳情，使用後端計算的價格
-        db_detail = models.OrderDetail(
-            order_id=db_order.order_id,
-            product_id=detail.product_id,
-            quantity=detail.quantity,
-            # unit_price=unit_price,  # 使用後端計算的單價
-            # subtotal=subtotal,      # 使用後端計算的小計
-            unit_price=detail.unit_price, # 使用前端傳來的單價
-            subtotal=detail.subtotal, # 使用前端傳來的小計
-            discount_id=discount_id
+        detail_rows.append({
+            "order_id": db_order.order_id,
+            "product_id": detail.product_id,
+            "quantity": detail.quantity,
+            "unit_price": detail.unit_price, # 使用前端傳來的單價
+            "subtotal": detail.subtotal, # 使用前端傳來的小計
+            "discount_id": discount.discount_id if discount else None,
+        })
+
+    # 明細以單一 executemany 批次寫入
+    if detail_rows:
+        db.execute(insert(models.OrderDetail), detail_rows)
+    record_lines(db, db_order.order_status, [(row["product_id"], row["quantity"], row["subtotal"]) for row in detail_rows])
+
+    # 以條件式 UPDATE 依 product_id 順序扣庫存：檢查與扣減為同一語句，
+    # 併發下不會超賣；放在最後執行以縮短商品列被鎖住的時間
+    out_of_stock_id = reserve_many(db, requested_stock)
+    if out_of_stock_id is not None:
+        db.rollback()
+        product = db.get(Product, out_of_stock_id)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Insufficient stock for product {out_of_stock_id}. Available: {available_units(product)}, Requested: {requested_stock[out_of_stock_id]}"
         )
-        db.add(db_detail)
-        # total_amount += subtotal
-
-    # Update order total
-    # db_order.total_amount = total_amount
     
+    if idempotency_key:
+        db.add(models.OrderIdempotencyKey(
+            line_id=current_user.line_id,
+            idempotency_key=idempotency_key,
+            fingerprint=fingerprint,
+            order_id=db_order.order_id
+        ))
+
     try:
         db.commit()
-        db.refresh(db_order)
+    except IntegrityError:
+        db.rollback()
+        # 同一把 key 的併發重送：另一個請求已先提交，回傳它建立的訂單
+        record = find_key(db, current_user.line_id, idempotency_key) if idempotency_key else None
+        if record is None:
+            raise HTTPException(status_code=500, detail="Failed to create order")
+        return _replay_order(db, record, fingerprint, response)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail="Failed to create order")
     
-    return db_order
+    return _load_order_for_response(db, db_order.order_id)
 
 
-@router.get("/", response_model=List[schemas.Order])
-def get_orders(
-    skip: int = 0, 
-    limit: int = 100, 
-    line_id: Optional[str] = None,
-    start_date: Optional[date] = None,
-    end_date: Optional[date] = None,
+@router.delete("/idempotency-keys/expired")
+def purge_idempotency_keys(current_user: Customer = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Remove expired Idempotency-Key records in one bulk DELETE"""
+    return {"deleted": purge_expired_keys(db)}
 
-    current_user: Customer = Depends(get_current_user), 
-    db: Session = Depends(get_db)
-):
+
+def _filtered_orders_query(db: Session, line_id: Optional[str], start_date: Optional[date], end_date: Optional[date]):
     # 建立基本查詢，使用 join 來關聯 Schedule
     query = db.query(models.Order).join(Schedule)
     
@@ -327,6 +331,22 @@ def get_orders(
     if end_date:
         # 根據 Schedule 的日期進行過濾
         query = query.filter(Schedule.date <= end_date)
+
+    return query
+
+
+@router.get("/", response_model=List[schemas.Order])
+def get_orders(
+    skip: int = 0, 
+    limit: int = 100, 
+    line_id: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+
+    current_user: Customer = Depends(get_current_user), 
+    db: Session = Depends(get_db)
+):
+    query = _filtered_orders_query(db, line_id, start_date, end_date)
     
     # 應用分頁
     orders = query.offset(skip).limit(limit).all()
@@ -337,10 +357,91 @@ def get_orders(
     return orders
 
 
+@router.get("/sales-summary", response_model=List[schemas.ProductSalesSummary])
+def get_sales_summary(product_id: Optional[int] = None, db: Session = Depends(get_read_db)):
+    """
+    Ordered quantity and amount per product and order status: the maintained
+    summary table plus the changes still queued for it, so committed orders
+    are always counted.
+    """
+    return read_sales_summary(db, product_id)
+
+
+@router.post("/sales-summary/rebuild")
+def rebuild_sales_summary_table(db: Session = Depends(get_db)):
+    """Recompute the sales summary from order_details and report rows that had drifted"""
+    drift = rebuild_sales_summary(db)
+    return {"drift": drift}
+
+
+@router.post("/totals/check")
+def check_totals(repair: bool = False, batch_size: int = Query(500, ge=1, le=5000), db: Session = Depends(get_db)):
+    """
+    Report orders whose total_amount differs from the sum of their details.
+
+    Dry run unless repair=true, since totals sent by the client or set through
+    PUT /orders/{id}/amount may differ on purpose.
+    """
+    mismatches = check_order_totals(db, repair=repair, batch_size=batch_size)
+    return {"repaired": repair, "mismatches": mismatches}
+
+
+@router.post("/archive/run")
+def run_order_archive(
+    older_than_days: Optional[int] = Query(None, ge=0),
+    batch_size: int = Query(500, ge=1, le=5000),
+    current_user: Customer = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Move completed and cancelled orders older than `older_than_days`
+    (default ORDER_ARCHIVE_AFTER_DAYS) into the archive tables.
+    """
+    return {"archived": archive_orders(db, older_than_days=older_than_days, batch_size=batch_size)}
+
+
+@router.get("/page", response_model=schemas.OrderPage)
+def get_orders_page(
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=500),
+    line_id: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    current_user: Customer = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Cursor-paginated order history, newest first.
+
+    Pages are keyed on (order_date, order_id), so deep pages cost the same as
+    the first one and new orders never shift rows between pages. Pass the
+    returned next_cursor to fetch the following page.
+    """
+    query = _filtered_orders_query(db, line_id, start_date, end_date)
+    orders, next_cursor = keyset_page(
+        query, models.Order.order_date, models.Order.order_id, cursor, limit, descending=True
+    )
+    return {"items": orders, "next_cursor": next_cursor}
+
+
 @router.get("/{order_id}", response_model=schemas.Order)
-def get_order(order_id: int, current_user: Customer = Depends(get_current_user), db: Session = Depends(get_db)):
-    # 先檢查訂單是否存在
-    order = db.query(models.Order).filter(models.Order.order_id == order_id).first()
+def get_order(
+    order_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(default=None),
+    current_user: Customer = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # 輪詢時先以主鍵查 revision/update_time，未變動就直接回 304，不載入整張訂單
+    etag = order_etag(db, order_id)
+    if etag is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    # 明細、商品及其照片、類別、折扣一併以 selectinload 載入
+    order = _load_order_for_response(db, order_id)
     if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -348,6 +449,11 @@ def get_order(order_id: int, current_user: Customer = Depends(get_current_user),
     # if current_user.line_id != order.line_id:
     #     raise HTTPException(status_code=403, detail="Not authorized to access this order")
     
+    # 所有商品的折扣階梯一次取得（快取未命中者以單一 IN 查詢載入）
+    ladders = discount_ladders.get_many(
+        db, {detail.product_id for detail in order.order_details if detail.product is not None}
+    )
+
     # 增強訂單詳細資訊
     for detail in order.order_details:
         product = detail.product
@@ -368,14 +474,12 @@ def get_order(order_id: int, current_user: Customer = Depends(get_current_user),
         detail.product_name = product.product_name
         detail.product_description = product.description
         
-        # 獲取產品照片
-        photo = db.query(ProductPhoto)\
-            .filter(ProductPhoto.product_id == product.product_id)\
-            .first()
+        # 產品照片已預先載入，取最早上傳的一張
+        photo = min(product.photos, key=lambda p: p.photo_id, default=None)
         detail.product_photo_path = photo.file_path if photo else None
         
         # 使用當前價格和折扣重新計算價格
-        item_subtotal = calculate_item_subtotal(product, detail.quantity, db)
+        item_subtotal = calculate_price_with_ladder(product, detail.quantity, ladders[product.product_id])
         
         # 添加計算後的價格信息
         detail.current_price = item_subtotal["price"]
@@ -386,7 +490,14 @@ def get_order(order_id: int, current_user: Customer = Depends(get_current_user),
 
 
 @router.get("/customer/{line_id}", response_model=List[schemas.Order])
-def get_customer_orders(line_id: str, current_user: Customer = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_customer_orders(
+    line_id: str,
+    response: Response,
+    include_archived: bool = False,
+    if_none_match: Optional[str] = Header(default=None),
+    current_user: Customer = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     # 先檢查客戶是否存在
     customer = db.query(Customer).filter(Customer.line_id == line_id).first()
     if not customer:
@@ -395,14 +506,94 @@ def get_customer_orders(line_id: str, current_user: Customer = Depends(get_curre
     # 如果存在，再檢查授權
     if current_user.line_id != line_id:
         raise HTTPException(status_code=403, detail="Not authorized to access this resource")
+
+    # 所有訂單都未變動時以單一聚合查詢回 304
+    etag = customer_orders_etag(db, line_id, include_archived)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
     # 使用 joinedload 預加載關聯數據
     orders = db.query(models.Order)\
         .filter(models.Order.line_id == line_id)\
         .all()
+    if include_archived:
+        # 封存訂單另外查詢後依訂單編號合併
+        archived = [schemas.Order.model_validate(order) for order in archived_customer_orders(db, line_id)]
+        orders = sorted([*orders, *archived], key=lambda order: order.order_id)
     
     return orders
 
 
+def _bulk_transition(db: Session, selection: schemas.BulkOrderSelection, column, new_value: str, valid_statuses: List[str]):
+    """
+    Move every selected order to `new_value` with one UPDATE.
+
+    `current_status` filters on the same column being changed. Returns a
+    compact result per order id instead of re-serialising whole orders.
+    """
+    if new_value not in valid_statuses:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}")
+    if selection.current_status is not None and selection.current_status not in valid_statuses:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}")
+    if not selection.order_ids and selection.schedule_id is None and selection.current_status is None:
+        raise HTTPException(status_code=400, detail="Provide order_ids or a schedule_id/current_status filter")
+
+    conditions = []
+    if selection.order_ids:
+        conditions.append(models.Order.order_id.in_(selection.order_ids))
+    if selection.schedule_id is not None:
+        conditions.append(models.Order.schedule_id == selection.schedule_id)
+    if selection.current_status is not None:
+        conditions.append(column == selection.current_status)
+
+    # 先鎖定符合條件的訂單，再以單一 UPDATE 只改動狀態不同的那些
+    rows = db.query(models.Order.order_id, models.Order.line_id, column)\
+        .filter(*conditions)\
+        .with_for_update()\
+        .all()
+    matched = {order_id: value for order_id, line_id, value in rows}
+    to_update = [order_id for order_id, value in matched.items() if value != new_value]
+    if to_update:
+        if column is models.Order.order_status:
+            move_orders(db, to_update, new_value)
+        record_status_events(
+            db,
+            [(order_id, line_id, value) for order_id, line_id, value in rows if value != new_value],
+            ORDER_STATUS_CHANGED if column is models.Order.order_status else PAYMENT_STATUS_CHANGED,
+            column.key,
+            new_value,
+        )
+        db.execute(
+            update(models.Order)
+            .where(models.Order.order_id.in_(to_update))
+            .values({column.key: new_value, "revision": models.Order.revision + 1})
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+
+    results = [
+        {"order_id": order_id, "result": "updated" if matched[order_id] != new_value else "unchanged"}
+        for order_id in sorted(matched)
+    ]
+    for order_id in selection.order_ids or []:
+        if order_id not in matched:
+            results.append({"order_id": order_id, "result": "not_matched"})
+    return {"updated": len(to_update), "results": results}
+
+
+@router.post("/bulk/status", response_model=schemas.BulkTransitionResponse)
+def bulk_update_order_status(bulk_update: schemas.BulkOrderStatusUpdate, current_user: Customer = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Transition many orders at once, e.g. every paid order of a schedule to ready_for_pickup"""
+    return _bulk_transition(db, bulk_update, models.Order.order_status, bulk_update.order_status, VALID_ORDER_STATUSES)
+
+
+@router.post("/bulk/payment", response_model=schemas.BulkTransitionResponse)
+def bulk_update_payment_status(bulk_update: schemas.BulkPaymentStatusUpdate, current_user: Customer = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Set the payment status of many orders at once"""
+    return _bulk_transition(db, bulk_update, models.Order.payment_status, bulk_update.payment_status, VALID_PAYMENT_STATUSES)
+
+
 @router.patch("/{order_id}/status", response_model=schemas.Order)
 def update_order_status(order_id: int, status_update: schemas.OrderStatusUpdate, current_user: Customer = Depends(get_current_user), db: Session = Depends(get_db)):
     # 先檢查訂單是否存在
@@ -414,10 +605,12 @@ def update_order_status(order_id: int, status_update: schemas.OrderStatusUpdate,
     # if current_user.line_id != order.line_id:
     #     raise HTTPException(status_code=403, detail="Not authorized to update this order")
 
-    valid_statuses = ["pending", "paid", "preparing", "ready_for_pickup", "partial_completed", "completed", "cancelled"]
-    if status_update.order_status not in valid_statuses:
-        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}")
+    if status_update.order_status not in VALID_ORDER_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {', '.join(VALID_ORDER_STATUSES)}")
 
+    if order.order_status != status_update.order_status:
+        record_event(db, order, ORDER_STATUS_CHANGED, order_status=status_update.order_status, previous=order.order_status)
+    move_orders(db, [order_id], status_update.order_status)
     order.order_status = status_update.order_status
     db.commit()
     db.refresh(order)
@@ -435,10 +628,11 @@ def update_payment_status(order_id: int, payment_update: schemas.PaymentStatusUp
     if current_user.line_id != order.line_id:
         raise HTTPException(status_code=403, detail="Not authorized to update this order")
 
-    valid_statuses = ["pending", "paid", "refunded"]
-    if payment_update.payment_status not in valid_statuses:
-        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}")
+    if payment_update.payment_status not in VALID_PAYMENT_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {', '.join(VALID_PAYMENT_STATUSES)}")
 
+    if order.payment_status != payment_update.payment_status:
+        record_event(db, order, PAYMENT_STATUS_CHANGED, payment_status=payment_update.payment_status, previous=order.payment_status)
     order.payment_status = payment_update.payment_status
     db.commit()
     db.refresh(order)
@@ -493,102 +687,70 @@ def delete_order(order_id: int, current_user: Customer = Depends(get_current_use
     if order.order_status == "pending":
         for detail in order.order_details:
             product = detail.product
-            # 計算實際需要的庫存數量
-            actual_quantity = detail.quantity
-            if product.one_set_quantity and product.one_set_quantity > 0:
-                # 如果有設定一組數量，需要將訂購數量轉換為實際庫存數量
-                actual_quantity = detail.quantity * product.one_set_quantity
-            product.stock_quantity += actual_quantity
+            # 商品已被刪除則無庫存可恢復
+            if product is None:
+                continue
+            # 計算實際需要的庫存數量（如果有設定一組數量，需要將訂購數量轉換為實際庫存數量）
+            release_stock(db, product.product_id, stock_units(product, detail.quantity))
     
+    record_lines(db, order.order_status, [(d.product_id, d.quantity, d.subtotal) for d in order.order_details], sign=-1)
     # Delete the order (cascade will handle order_details)
     db.delete(order)
     db.commit()
     
     return {"message": "Order soft deleted successfully"}
 
-STATUS_MAPPING = {
-    "pending": "待處理",
-    "paid": "已付款",
-    "preparing": "準備中",
-    "ready_for_pickup": "可取貨",
-    #部分完成
-    "partial_completed": "分批取貨",
-    "completed": "已完成",
-    "cancelled": "已取消"
-}
-
 @router.get("/list/all")
-def get_orders_list(current_user: Customer = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Get all orders
-    orders = db.query(models.Order).all()
-    
-    # Create a list to store all order data
-    all_order_data = []
-    
-    # Process all orders
-    for order in orders:
-        # Get related data
-        customer = db.query(Customer).filter(Customer.line_id == order.line_id).first()
-        schedule = db.query(Schedule).filter(Schedule.schedule_id == order.schedule_id).first()
-        location = db.query(PickupLocation).filter(PickupLocation.location_id == schedule.location_id).first() if schedule else None
-        
-        # Process each order detail
-        for order_detail in order.order_details:
-            product = db.query(Product).filter(Product.product_id == order_detail.product_id).first()
-            
-            # 檢查商品是否存在
-            if product is None:
-                # 商品已被刪除，使用預設值
-                unit_display = ""
-                remark = "商品已下架"
-                # 顯示價格為 0，避免累計到總額
-                item_subtotal = {
-                    "price": 0.0,
-                    "originalPrice": 0.0,
-                    "savedAmount": 0
-                }
-            else:
-                # Format unit display
-                if product.one_set_quantity > 1:
-                    unit_display = f"組(每組{product.one_set_quantity}{product.unit})"
-                    remark = ""
-                else:
-                    unit_display = product.unit
-                    remark = ""
-                
-                if product.arrival_date and product.arrival_date > date.today():
-                    remark = "未到貨"
-                else:
-                    remark = ""
-                
-                # Calculate item subtotal based on CartPage.jsx calculateItemPrice logic
-                item_subtotal = calculate_item_subtotal(product, order_detail.quantity, db)
-            
-            # Add this order detail to our list
-            all_order_data.append({
-                '訂單編號': order.order_id,
-                # '訂單金額': order.total_amount,
-                '訂購人': customer.name if customer else '',
-                'LINE姓名': customer.line_name if customer else '',
-                '電話': customer.phone if customer and customer.phone else '',
-                '日期': schedule.date if schedule else '',
-                '地點': location.name if location else '',
-                '商品名稱': product.product_name if product else '商品已下架',
-                '數量': order_detail.quantity,
-                '單位': unit_display,
-                "小計金額": float(item_subtotal["price"]),
-                '備註': remark,
-                '明細編號': order_detail.order_detail_id,
-                '領取狀態': "已領取" if order_detail.is_finish else "未領取",
-                '訂單狀態': STATUS_MAPPING.get(order.order_status, ''),
-                "配送方式": order.delivery_method,
-                "配送地址": order.delivery_address,
-                # "小計金額": float(item_subtotal["price"]),
-                # "原始金額": float(item_subtotal["originalPrice"]),
-                # "節省金額": float(item_subtotal["savedAmount"])
-            })
-    
-    return all_order_data
+def get_orders_list(include_archived: bool = False, current_user: Customer = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    # 以固定次數的查詢載入所有訂單、明細及關聯資料，再於記憶體中組合
+    rows = build_order_list_rows(db)
+    if include_archived:
+        # 封存訂單另外查詢後依訂單編號合併
+        rows = sorted(rows + build_order_list_rows(db, archived=True), key=lambda row: row["訂單編號"])
+    return rows
+
+
+@router.get("/manifest/{schedule_id}")
+def get_pickup_manifest(schedule_id: int, current_user: Customer = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Pickup manifest for one schedule: customers with their orders, items,
+    set-unit display and finish state. Served from cache until an order on
+    the schedule changes.
+    """
+    schedule = db.query(Schedule).filter(Schedule.schedule_id == schedule_id).first()
+    if schedule is None:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return pickup_manifests.get(db, schedule)
+
+
+@router.get("/list/export")
+def export_orders_list(
+    format: str = "csv",
+    schedule_date: Optional[date] = None,
+    location_id: Optional[int] = None,
+    status: Optional[str] = None,
+    current_user: Customer = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Stream the pickup sheet as CSV or NDJSON.
+
+    Rows are read through a server-side cursor and written out as they
+    arrive, so memory stays flat regardless of the number of order lines.
+    """
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Invalid format. Must be one of: csv, ndjson")
+
+    orders_query = filter_orders_for_report(db, schedule_date, location_id, status)
+    rows = iter_order_list_rows(db, orders_query)
+
+    if format == "csv":
+        return StreamingResponse(
+            encode_csv(rows),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": "attachment; filename=orders.csv"}
+        )
+    return StreamingResponse(encode_ndjson(rows), media_type="application/x-ndjson")
 
 
 @router.put("/{order_id}/details/{detail_id}/finish")
@@ -613,58 +775,104 @@ def update_order_detail_finish_status(order_id: int, detail_id: int, is_finish:
     
     return {"message": "Order detail finish status updated successfully", "is_finish": order_detail.is_finish}
 
+@router.post("/bulk/finish", response_model=schemas.BulkFinishResult)
+def bulk_update_finish_status(
+    bulk_update: schemas.BulkFinishUpdate,
+    current_user: Customer = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Mark every detail of the selected orders as picked up in one UPDATE.
+
+    With auto_advance, orders whose details are all finished become
+    completed and orders with some finished become partial_completed, in
+    the same transaction. Cancelled orders keep their status.
+    """
+    if bulk_update.schedule_id is None and bulk_update.order_id is None and bulk_update.line_id is None:
+        raise HTTPException(status_code=400, detail="Provide schedule_id, order_id or line_id")
+
+    order_ids = select(models.Order.order_id)
+    if bulk_update.schedule_id is not None:
+        order_ids = order_ids.where(models.Order.schedule_id == bulk_update.schedule_id)
+    if bulk_update.order_id is not None:
+        order_ids = order_ids.where(models.Order.order_id == bulk_update.order_id)
+    if bulk_update.line_id is not None:
+        order_ids = order_ids.where(models.Order.line_id == bulk_update.line_id)
+    # 先具體化訂單 ID，MySQL 不允許 UPDATE 的子查詢引用同一張表
+    matched_ids = db.scalars(order_ids).all()
+    if not matched_ids:
+        return {"orders_matched": 0, "details_updated": 0}
+
+    details_updated = db.execute(
+        update(models.OrderDetail)
+        .where(
+            models.OrderDetail.order_id.in_(matched_ids),
+            models.OrderDetail.is_finish.isnot(bulk_update.is_finish),
+        )
+        .values(is_finish=bulk_update.is_finish)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if details_updated:
+        db.execute(
+            update(models.Order)
+            .where(models.Order.order_id.in_(matched_ids))
+            .values(revision=models.Order.revision + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    result = {"orders_matched": len(matched_ids), "details_updated": details_updated}
+    if bulk_update.auto_advance:
+        progress = db.query(
+            models.OrderDetail.order_id,
+            func.count(models.OrderDetail.order_detail_id),
+            func.sum(case((models.OrderDetail.is_finish.is_(True), 1), else_=0)),
+        )\
+            .join(models.Order, models.Order.order_id == models.OrderDetail.order_id)\
+            .filter(models.OrderDetail.order_id.in_(matched_ids), models.Order.order_status != "cancelled")\
+            .group_by(models.OrderDetail.order_id)\
+            .all()
+        completed = [order_id for order_id, total, finished in progress if finished == total]
+        partial = [order_id for order_id, total, finished in progress if 0 < finished < total]
+        for status, ids in (("completed", completed), ("partial_completed", partial)):
+            if ids:
+                move_orders(db, ids, status)
+                changes = db.query(models.Order.order_id, models.Order.line_id, models.Order.order_status)\
+                    .filter(models.Order.order_id.in_(ids), models.Order.order_status != status)\
+                    .all()
+                record_status_events(db, changes, ORDER_STATUS_CHANGED, "order_status", status)
+                db.execute(
+                    update(models.Order)
+                    .where(models.Order.order_id.in_(ids), models.Order.order_status != status)
+                    .values(order_status=status, revision=models.Order.revision + 1)
+                    .execution_options(synchronize_session=False)
+                )
+        result["orders_completed"] = len(completed)
+        result["orders_partial_completed"] = len(partial)
+
+    db.commit()
+    return result
+
 @router.get("/by-product/{product_id}/simple")
-def get_orders_by_product_simple(product_id: int, db: Session = Depends(get_db)):
+def get_orders_by_product_simple(product_id: int, include_archived: bool = False, db: Session = Depends(get_read_db)):
     """
     Get simplified information for all orders containing a specific product ID.
     Returns only essential order information: order ID, customer name, pickup location, 
     pickup date, pickup time, order amount, and order items.
     """
-    # 查詢包含特定產品的所有訂單
-    orders = db.query(models.Order)\
-        .join(models.OrderDetail, models.Order.order_id == models.OrderDetail.order_id)\
-        .filter(models.OrderDetail.product_id == product_id)\
-        .distinct()\
-        .all()
-    
-    result = []
-    
-    for order in orders:
-        # 獲取客戶資訊
-        customer = db.query(Customer).filter(Customer.line_id == order.line_id).first()
-        
-        # 獲取取貨時間與地點資訊
-        schedule = db.query(Schedule).filter(Schedule.schedule_id == order.schedule_id).first()
-        location = None
-        if schedule:
-            location = db.query(PickupLocation).filter(PickupLocation.location_id == schedule.location_id).first()
-        
-        # 獲取訂單項目
-        order_items = []
-        for detail in order.order_details:
-            product = db.query(Product).filter(Product.product_id == detail.product_id).first()
-            if product:
-                order_items.append({
-                    "product_name": product.product_name,
-                    "quantity": detail.quantity,
-                    "unit": product.unit,
-                    "subtotal": float(detail.subtotal)
-                })
-        
-        # 建立簡化的訂單資訊
-        order_info = {
-            "訂單編號": order.order_id,
-            "訂購人": customer.name if customer else "",
-            "取貨地點": location.name if location else "",
-            "取貨日期": schedule.date.isoformat() if schedule and schedule.date else "",
-            "取貨時間": f"{schedule.pickup_start_time} - {schedule.pickup_end_time}" if schedule else "",
-            "訂購金額": float(order.total_amount),
-            "訂購項目": order_items
-        }
-        
-        result.append(order_info)
-    
-    return result
+    # 單一聯結查詢取得訂單、客戶、取貨時段與地點及所有明細
+    rows = build_product_order_rows(db, product_id)
+    if include_archived:
+        rows = sorted(rows + build_product_order_rows(db, product_id, archived=True), key=lambda row: row["訂單編號"])
+    return rows
+
+
+@router.get("/by-product/{product_id}/rollup")
+def get_product_demand_rollup(product_id: int, include_archived: bool = False, db: Session = Depends(get_read_db)):
+    """
+    Ordered quantity of a product per pickup location and per pickup schedule,
+    so suppliers can see demand by pickup point. Cancelled orders are excluded.
+    """
+    return product_demand_rollup(db, product_id, include_archived=include_archived)
 
 
 @router.put("/{order_id}/amount", response_model=schemas.Order)
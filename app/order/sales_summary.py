@@ -0,0 +1,337 @@
+import logging
+import threading
+from collections import defaultdict
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, literal, select, union_all, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.order import models
+
+logger = logging.getLogger(__name__)
+
+# (product_id, order_status) -> [quantity, subtotal, line_count]
+SalesDelta = Dict[Tuple[int, str], List[Any]]
+
+_CENT = Decimal("0.01")
+
+
+def _new_delta() -> SalesDelta:
+    return defaultdict(lambda: [0, Decimal(0), 0])
+
+
+def _add(delta: SalesDelta, product_id: Optional[int], status: Optional[str], quantity, subtotal, sign: int) -> None:
+    if product_id is None:
+        return
+    entry = delta[(product_id, status or "pending")]
+    entry[0] += sign * (quantity or 0)
+    entry[1] += sign * Decimal(str(subtotal or 0))
+    entry[2] += sign
+
+
+def _upsert(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Add to several summary rows with one multi-row INSERT ... ON CONFLICT/DUPLICATE KEY UPDATE"""
+    table = models.ProductSalesSummary.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            quantity=table.c.quantity + stmt.inserted.quantity,
+            subtotal=table.c.subtotal + stmt.inserted.subtotal,
+            line_count=table.c.line_count + stmt.inserted.line_count,
+        )
+        db.execute(stmt)
+    elif dialect in ("sqlite", "postgresql"):
+        stmt = (sqlite.insert if dialect == "sqlite" else postgresql.insert)(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.product_id, table.c.order_status],
+            set_={
+                "quantity": table.c.quantity + stmt.excluded.quantity,
+                "subtotal": table.c.subtotal + stmt.excluded.subtotal,
+                "line_count": table.c.line_count + stmt.excluded.line_count,
+            },
+        )
+        db.execute(stmt)
+    else:
+        for row in rows:
+            result = db.execute(
+                update(table)
+                .where(table.c.product_id == row["product_id"], table.c.order_status == row["order_status"])
+                .values(
+                    quantity=table.c.quantity + row["quantity"],
+                    subtotal=table.c.subtotal + row["subtotal"],
+                    line_count=table.c.line_count + row["line_count"],
+                )
+            )
+            if not result.rowcount:
+                db.execute(insert(table).values(**row))
+
+
+def _rows(delta: SalesDelta) -> List[Dict[str, Any]]:
+    return [
+        {"product_id": product_id, "order_status": status, "quantity": quantity, "subtotal": subtotal, "line_count": line_count}
+        for (product_id, status), (quantity, subtotal, line_count) in sorted(delta.items())
+        if quantity or subtotal or line_count
+    ]
+
+
+def apply_sales_delta(db: Session, delta: SalesDelta) -> None:
+    """
+    Queue accumulated changes inside the caller's transaction.
+
+    The changes are appended to product_sales_deltas with one plain INSERT,
+    so concurrent checkouts of the same product never wait on each other;
+    flush_sales_deltas folds them into the summary later.
+    """
+    rows = _rows(delta)
+    if rows:
+        db.execute(insert(models.ProductSalesDelta), rows)
+
+
+def flush_sales_deltas(db: Session, batch_size: int = 5000) -> int:
+    """
+    Fold queued deltas into product_sales_summary in batches; returns the number of deltas applied.
+
+    Each batch is claimed with FOR UPDATE SKIP LOCKED and deleted in the
+    same transaction as the summary upsert, so a delta is applied exactly
+    once even with several flushers running.
+    """
+    table = models.ProductSalesDelta.__table__
+    applied = 0
+    while True:
+        rows = db.execute(
+            select(table.c.delta_id, table.c.product_id, table.c.order_status,
+                   table.c.quantity, table.c.subtotal, table.c.line_count)
+            .order_by(table.c.delta_id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            break
+        ids = [row.delta_id for row in rows]
+        # 沒有列鎖的資料庫（SQLite）以刪除筆數確認這批未被其他程序處理
+        if db.execute(delete(table).where(table.c.delta_id.in_(ids))).rowcount != len(ids):
+            db.rollback()
+            break
+        delta = _new_delta()
+        for row in rows:
+            entry = delta[(row.product_id, row.order_status)]
+            entry[0] += row.quantity
+            entry[1] += Decimal(str(row.subtotal))
+            entry[2] += row.line_count
+        summary_rows = _rows(delta)
+        if summary_rows:
+            # 依主鍵順序更新，避免死結
+            _upsert(db, summary_rows)
+        db.commit()
+        applied += len(rows)
+        if len(rows) < batch_size:
+            break
+    return applied
+
+
+def record_lines(db: Session, status: Optional[str], lines: Iterable[Tuple[Optional[int], int, Any]], sign: int = 1) -> None:
+    """Add (sign=1) or remove (sign=-1) order lines given as (product_id, quantity, subtotal)"""
+    delta = _new_delta()
+    for product_id, quantity, subtotal in lines:
+        _add(delta, product_id, status, quantity, subtotal, sign)
+    apply_sales_delta(db, delta)
+
+
+def move_orders(db: Session, order_ids: Iterable[int], new_status: str) -> None:
+    """
+    Move the lines of `order_ids` to the `new_status` bucket.
+
+    Call before changing order_status; orders already in `new_status` are
+    left alone, matching an UPDATE filtered on order_status != new_status.
+    """
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+    groups = db.query(
+        models.OrderDetail.product_id,
+        models.Order.order_status,
+        func.sum(models.OrderDetail.quantity),
+        func.sum(models.OrderDetail.subtotal),
+        func.count(models.OrderDetail.order_detail_id),
+    )\
+        .join(models.Order, models.Order.order_id == models.OrderDetail.order_id)\
+        .filter(models.Order.order_id.in_(order_ids), models.Order.order_status != new_status)\
+        .group_by(models.OrderDetail.product_id, models.Order.order_status)\
+        .all()
+
+    delta = _new_delta()
+    for product_id, old_status, quantity, subtotal, line_count in groups:
+        if product_id is None:
+            continue
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            entry = delta[(product_id, status or "pending")]
+            entry[0] += sign * int(quantity or 0)
+            entry[1] += sign * Decimal(str(subtotal or 0))
+            entry[2] += sign * line_count
+    apply_sales_delta(db, delta)
+
+
+def read_sales_summary(db: Session, product_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Current totals per (product_id, order_status): the summary plus deltas still queued.
+
+    Both tables are read in one UNION ALL statement, so a flush running at
+    the same time can neither hide a delta nor count it twice.
+    """
+    summary = models.ProductSalesSummary.__table__
+    deltas = models.ProductSalesDelta.__table__
+    parts = []
+    for table in (summary, deltas):
+        part = select(table.c.product_id, table.c.order_status, table.c.quantity, table.c.subtotal, table.c.line_count)
+        if product_id is not None:
+            part = part.where(table.c.product_id == product_id)
+        parts.append(part)
+    rows = union_all(*parts).subquery()
+    grouped = select(
+        rows.c.product_id,
+        rows.c.order_status,
+        func.sum(rows.c.quantity),
+        func.sum(rows.c.subtotal),
+        func.sum(rows.c.line_count),
+    )\
+        .group_by(rows.c.product_id, rows.c.order_status)\
+        .having(func.sum(rows.c.line_count) != literal(0))\
+        .order_by(rows.c.product_id, rows.c.order_status)
+    result = []
+    for pid, status, quantity, subtotal, line_count in db.execute(grouped):
+        quantity, subtotal, line_count = _summary_key_values(quantity, subtotal, line_count)
+        result.append({
+            "product_id": pid, "order_status": status, "quantity": quantity, "subtotal": subtotal, "line_count": line_count,
+        })
+    return result
+
+
+def _summary_key_values(quantity, subtotal, line_count) -> Tuple[int, Decimal, int]:
+    return int(quantity or 0), Decimal(str(subtotal or 0)).quantize(_CENT), int(line_count or 0)
+
+
+def rebuild_sales_summary(db: Session) -> List[Dict[str, Any]]:
+    """
+    Recompute product_sales_summary from order_details (hot and archived) and replace its contents.
+
+    Returns the rows whose stored values differed from the recomputed ones
+    (drift), so a mismatch in the incremental maintenance gets noticed.
+    Queued deltas count towards the stored values and are consumed here.
+    """
+    # 封存的訂單仍算已售出，因此同時彙總熱表與封存表
+    totals = _new_delta()
+    for order_model, detail_model in (
+        (models.Order, models.OrderDetail),
+        (models.OrderArchive, models.OrderDetailArchive),
+    ):
+        for product_id, status, quantity, subtotal, line_count in db.query(
+            detail_model.product_id,
+            order_model.order_status,
+            func.sum(detail_model.quantity),
+            func.sum(detail_model.subtotal),
+            func.count(detail_model.order_detail_id),
+        )\
+            .join(order_model, order_model.order_id == detail_model.order_id)\
+            .filter(detail_model.product_id.isnot(None))\
+            .group_by(detail_model.product_id, order_model.order_status):
+            entry = totals[(product_id, status or "pending")]
+            entry[0] += int(quantity or 0)
+            entry[1] += Decimal(str(subtotal or 0))
+            entry[2] += line_count
+    expected = {key: _summary_key_values(*values) for key, values in totals.items()}
+
+    actual = {
+        (row.product_id, row.order_status): _summary_key_values(row.quantity, row.subtotal, row.line_count)
+        for row in db.query(models.ProductSalesSummary)
+    }
+    # 尚未併入的異動視為已記錄；之後才提交的異動保留給下一次 flush
+    pending = _new_delta()
+    pending_ids = []
+    for row in db.query(models.ProductSalesDelta).with_for_update():
+        pending_ids.append(row.delta_id)
+        entry = pending[(row.product_id, row.order_status)]
+        entry[0] += row.quantity
+        entry[1] += Decimal(str(row.subtotal))
+        entry[2] += row.line_count
+    for key, (quantity, subtotal, line_count) in pending.items():
+        have = actual.get(key, (0, Decimal(0), 0))
+        actual[key] = _summary_key_values(have[0] + quantity, have[1] + subtotal, have[2] + line_count)
+    zero = (0, Decimal(0).quantize(_CENT), 0)
+    drift = []
+    for key in sorted(set(expected) | set(actual)):
+        want = expected.get(key, zero)
+        have = actual.get(key, zero)
+        if want != have:
+            drift.append({
+                "product_id": key[0],
+                "order_status": key[1],
+                "expected": {"quantity": want[0], "subtotal": float(want[1]), "line_count": want[2]},
+                "actual": {"quantity": have[0], "subtotal": float(have[1]), "line_count": have[2]},
+            })
+
+    if pending_ids:
+        db.execute(delete(models.ProductSalesDelta).where(models.ProductSalesDelta.delta_id.in_(pending_ids)))
+    db.execute(delete(models.ProductSalesSummary))
+    if expected:
+        db.execute(insert(models.ProductSalesSummary), [
+            {"product_id": product_id, "order_status": status, "quantity": q, "subtotal": s, "line_count": n}
+            for (product_id, status), (q, s, n) in sorted(expected.items())
+        ])
+    db.commit()
+    return drift
+
+
+class SalesSummaryFlusher:
+    """Background thread that folds queued sales deltas into the summary every `interval` seconds"""
+
+    def __init__(self, session_factory: sessionmaker, interval: float):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sales-summary-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the thread and fold whatever is still queued (nothing to do if it never started)"""
+        self._stop.set()
+        if self._thread is None:
+            return
+        self._thread.join()
+        self.flush()
+
+    def flush(self) -> None:
+        db = self.session_factory()
+        try:
+            flush_sales_deltas(db)
+        except Exception:
+            logger.exception("Failed to fold sales deltas into product_sales_summary")
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+
+if __name__ == "__main__":
+    # 載入所有模型，讓關聯能完成設定
+    import app.customer.models  # noqa: F401
+    import app.location.models  # noqa: F401
+    import app.photo.models  # noqa: F401
+    import app.product.models  # noqa: F401
+    from app.db import SessionLocal
+
+    session = SessionLocal()
+    try:
+        drift = rebuild_sales_summary(session)
+    finally:
+        session.close()
+    print(f"product_sales_summary rebuilt, {len(drift)} drifted row(s)")
+    for row in drift:
+        print(f"  product {row['product_id']} [{row['order_status']}]: expected {row['expected']}, found {row['actual']}")
@@ -69,6 +69,11 @@ class Order(OrderBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class OrderPage(BaseModel):
+    items: List[Order]
+    next_cursor: Optional[str] = None
+
+
 class OrderStatusUpdate(BaseModel):
     order_status: str = Field(
         description="Order status: pending, paid, preparing, ready_for_pickup, completed, cancelled"
@@ -81,6 +86,61 @@ class PaymentStatusUpdate(BaseModel):
     )
 
 
+class BulkOrderSelection(BaseModel):
+    """Orders to transition: explicit ids and/or a filter, combined with AND"""
+    order_ids: Optional[List[int]] = Field(default=None, description="要更新的訂單 ID 列表")
+    schedule_id: Optional[int] = Field(default=None, description="只更新此取貨時段的訂單")
+    current_status: Optional[str] = Field(default=None, description="只更新目前為此狀態的訂單")
+
+
+class BulkOrderStatusUpdate(BulkOrderSelection):
+    order_status: str = Field(
+        description="Order status: pending, paid, preparing, ready_for_pickup, completed, cancelled"
+    )
+
+
+class BulkPaymentStatusUpdate(BulkOrderSelection):
+    payment_status: str = Field(
+        description="Payment status: pending, paid, refunded"
+    )
+
+
+class BulkTransitionResult(BaseModel):
+    order_id: int
+    result: str = Field(description="updated, unchanged, or not_matched")
+
+
+class BulkTransitionResponse(BaseModel):
+    updated: int
+    results: List[BulkTransitionResult]
+
+
+class BulkFinishUpdate(BaseModel):
+    """Pickup check-off for every detail of the selected orders (filters combined with AND)"""
+    schedule_id: Optional[int] = Field(default=None, description="取貨時段 ID")
+    order_id: Optional[int] = Field(default=None, description="訂單 ID")
+    line_id: Optional[str] = Field(default=None, description="客戶 LINE ID")
+    is_finish: bool = Field(default=True, description="領取狀態")
+    auto_advance: bool = Field(default=False, description="依領取進度同步更新訂單狀態")
+
+
+class BulkFinishResult(BaseModel):
+    orders_matched: int
+    details_updated: int
+    orders_completed: int = 0
+    orders_partial_completed: int = 0
+
+
+class ProductSalesSummary(BaseModel):
+    product_id: int
+    order_status: str
+    quantity: int
+    subtotal: float
+    line_count: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class OrderScheduleUpdate(BaseModel):
     schedule_id: int = Field(
         description="The ID of the new schedule for the order"
@@ -91,3 +151,27 @@ class OrderAmountUpdate(BaseModel):
     total_amount: float = Field(
         description="The new total amount for the order"
     )
+
+
+class QuoteItem(BaseModel):
+    product_id: int
+    quantity: int = Field(gt=0)
+
+
+class QuoteRequest(BaseModel):
+    items: List[QuoteItem]
+
+
+class QuoteLine(BaseModel):
+    product_id: int
+    quantity: int
+    price: float
+    originalPrice: float
+    savedAmount: float
+
+
+class Quote(BaseModel):
+    items: List[QuoteLine]
+    totalPrice: float
+    totalOriginalPrice: float
+    totalSavedAmount: float
@@ -0,0 +1,105 @@
+from decimal import Decimal
+from typing import Any, Dict, List
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.order import models
+
+_CENT = Decimal("0.01")
+
+
+def details_total(order_id):
+    """Scalar subquery: SUM(subtotal) of an order's details, 0 when it has none"""
+    return select(func.coalesce(func.sum(models.OrderDetail.subtotal), 0))\
+        .where(models.OrderDetail.order_id == order_id)\
+        .scalar_subquery()
+
+
+def recalculate_order_total(db: Session, order: models.Order) -> None:
+    """
+    Set order.total_amount to the sum of its details inside the current transaction.
+
+    Pending detail changes are flushed first; the total is then written as
+    one UPDATE ... SET total_amount = (SELECT SUM(...)), without loading the
+    details into Python.
+    """
+    db.flush()
+    order.total_amount = details_total(order.order_id)
+
+
+def check_order_totals(db: Session, repair: bool = False, batch_size: int = 500) -> List[Dict[str, Any]]:
+    """
+    Scan orders in order_id batches and report those whose total differs from their details.
+
+    Dry run by default: total_amount is first taken from the client in
+    create_order and can be set by PUT /orders/{id}/amount, so a mismatch is
+    not always an error. With repair=True the mismatched totals are
+    recomputed with one UPDATE per batch.
+    """
+    mismatches = []
+    last_id = 0
+    while True:
+        order_ids = db.scalars(
+            select(models.Order.order_id)
+            .where(models.Order.order_id > last_id)
+            .order_by(models.Order.order_id)
+            .limit(batch_size)
+        ).all()
+        if not order_ids:
+            break
+        last_id = order_ids[-1]
+
+        rows = db.query(
+            models.Order.order_id,
+            models.Order.total_amount,
+            func.coalesce(func.sum(models.OrderDetail.subtotal), 0),
+        )\
+            .outerjoin(models.OrderDetail, models.OrderDetail.order_id == models.Order.order_id)\
+            .filter(models.Order.order_id.in_(order_ids))\
+            .group_by(models.Order.order_id, models.Order.total_amount)\
+            .all()
+
+        batch = []
+        for order_id, total_amount, expected in rows:
+            stored = Decimal(str(total_amount or 0)).quantize(_CENT)
+            expected = Decimal(str(expected)).quantize(_CENT)
+            if stored != expected:
+                batch.append(order_id)
+                mismatches.append({"order_id": order_id, "total_amount": float(stored), "details_total": float(expected)})
+
+        if repair and batch:
+            db.execute(
+                update(models.Order)
+                .where(models.Order.order_id.in_(batch))
+                .values(total_amount=details_total(models.Order.order_id), revision=models.Order.revision + 1)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+    return mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 載入所有模型，讓關聯能完成設定
+    import app.customer.models  # noqa: F401
+    import app.location.models  # noqa: F401
+    import app.photo.models  # noqa: F401
+    import app.product.models  # noqa: F401
+    from app.db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Compare order totals with the sum of their details")
+    parser.add_argument("--repair", action="store_true", help="rewrite mismatched totals from their details")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        found = check_order_totals(session, repair=args.repair, batch_size=args.batch_size)
+    finally:
+        session.close()
+    action = "repaired" if args.repair else "found"
+    print(f"{len(found)} mismatched order total(s) {action}")
+    for row in found:
+        print(f"  order {row['order_id']}: total_amount {row['total_amount']}, details {row['details_total']}")
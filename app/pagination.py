@@ -0,0 +1,78 @@
+import base64
+import json
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import String, and_, cast, literal, or_
+from sqlalchemy.orm import Query
+
+
+def encode_cursor(sort_value: Optional[str], row_id: Any) -> str:
+    """Pack the last row's sort key into an opaque, URL-safe cursor (a NULL sort value stays null)"""
+    raw = json.dumps([sort_value, row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[str], Any]:
+    """Unpack a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if sort_value is not None and not isinstance(sort_value, str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # 只接受主鍵可能的型別；bool 是 int 的子類別，需另外排除
+    if isinstance(row_id, bool) or not isinstance(row_id, (int, str)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return sort_value, row_id
+
+
+def keyset_page(
+    query: Query,
+    sort_column,
+    id_column,
+    cursor: Optional[str],
+    limit: int,
+    descending: bool = False,
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Return one page of `query` ordered by (sort_column, id_column) and the cursor of the next page.
+
+    The sort key is compared as the string the database itself renders, so
+    the cursor round-trips exactly on both SQLite (which stores text) and MySQL.
+    Rows whose sort value is NULL come after all others, ordered by id, in
+    either direction; each part is still a plain range scan on its index.
+    """
+    sort_key = cast(sort_column, String)
+    after_id = id_column.__lt__ if descending else id_column.__gt__
+    id_order = id_column.desc() if descending else id_column.asc()
+
+    last_sort, last_id = decode_cursor(cursor) if cursor else (None, None)
+    rows: List[Any] = []
+    if last_id is None or last_sort is not None:
+        valued = query.filter(sort_column.isnot(None))
+        if last_id is not None:
+            last_sort = literal(last_sort, type_=String())
+            before_sort = sort_column.__lt__ if descending else sort_column.__gt__
+            valued = valued.filter(or_(
+                before_sort(last_sort),
+                and_(sort_column == last_sort, after_id(last_id))
+            ))
+        sort_order = sort_column.desc() if descending else sort_column.asc()
+        rows = valued.order_by(sort_order, id_order).add_columns(sort_key, id_column).limit(limit + 1).all()
+        last_id = None
+
+    if len(rows) <= limit:
+        # 排序欄位為 NULL 的列接在最後，只依主鍵排序
+        nulls = query.filter(sort_column.is_(None))
+        if last_id is not None:
+            nulls = nulls.filter(after_id(last_id))
+        rows += nulls.order_by(id_order).add_columns(sort_key, id_column).limit(limit + 1 - len(rows)).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = [row[0] for row in rows]
+    next_cursor = encode_cursor(rows[-1][1], rows[-1][2]) if has_more else None
+    return items, next_cursor
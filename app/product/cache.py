@@ -0,0 +1,112 @@
+import threading
+import time
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .models import ProductDiscount
+
+
+class DiscountLadder:
+    """A product's quantity discounts, sorted by quantity for bisect lookup"""
+
+    __slots__ = ("quantities", "prices")
+
+    def __init__(self, discounts: Iterable[ProductDiscount]):
+        tiers: Dict[int, float] = {}
+        for discount in discounts:
+            # 同數量的折扣以先建立者為準（與原本排序後取第一筆的行為一致）
+            tiers.setdefault(discount.quantity, float(discount.price))
+        self.quantities: List[int] = sorted(tiers)
+        self.prices: List[float] = [tiers[q] for q in self.quantities]
+
+    def __bool__(self) -> bool:
+        return bool(self.quantities)
+
+    def best_tier(self, quantity: int) -> Optional[Tuple[int, float]]:
+        """Largest (tier_quantity, tier_price) whose quantity does not exceed `quantity`"""
+        index = bisect_right(self.quantities, quantity) - 1
+        if index < 0:
+            return None
+        return self.quantities[index], self.prices[index]
+
+
+class DiscountLadderCache:
+    """
+    Per-worker cache of discount ladders keyed by product_id.
+
+    Writes through the discount routes invalidate the affected product. The
+    TTL bounds how long another worker can serve a ladder changed elsewhere.
+    """
+
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._ladders: Dict[int, Tuple[float, DiscountLadder]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session, product_id: int) -> DiscountLadder:
+        ladder = self._lookup(product_id)
+        if ladder is not None:
+            return ladder
+
+        discounts = db.query(ProductDiscount)\
+            .filter(ProductDiscount.product_id == product_id)\
+            .all()
+        return self._store(product_id, DiscountLadder(discounts))
+
+    def get_many(self, db: Session, product_ids: Iterable[int]) -> Dict[int, DiscountLadder]:
+        """Ladders for all `product_ids`, loading every miss with one IN query"""
+        result: Dict[int, DiscountLadder] = {}
+        missing = []
+        for product_id in set(product_ids):
+            ladder = self._lookup(product_id)
+            if ladder is not None:
+                result[product_id] = ladder
+            else:
+                missing.append(product_id)
+
+        if missing:
+            discounts = db.query(ProductDiscount)\
+                .filter(ProductDiscount.product_id.in_(missing))\
+                .all()
+            grouped: Dict[int, List[ProductDiscount]] = {product_id: [] for product_id in missing}
+            for discount in discounts:
+                grouped.setdefault(discount.product_id, []).append(discount)
+            for product_id in missing:
+                result[product_id] = self._store(product_id, DiscountLadder(grouped[product_id]))
+
+        return result
+
+    def _lookup(self, product_id: int) -> Optional[DiscountLadder]:
+        with self._lock:
+            entry = self._ladders.get(product_id)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def _store(self, product_id: int, ladder: DiscountLadder) -> DiscountLadder:
+        with self._lock:
+            self._ladders[product_id] = (time.monotonic(), ladder)
+        return ladder
+
+    def invalidate(self, product_id: int) -> None:
+        with self._lock:
+            self._ladders.pop(product_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ladders.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._ladders), "hits": self.hits, "misses": self.misses}
+
+
+discount_ladders = DiscountLadderCache()
@@ -0,0 +1,175 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+from sqlalchemy import case, event, func, or_
+from sqlalchemy.orm import Session, selectinload
+
+from app.photo.models import ProductPhoto
+from . import models, schemas
+from .flash import flash_stock, overlay_flash_stock
+from .snapshot import catalog_snapshot
+
+# session.info 中標記本交易是否異動了商品目錄，提交後才清除快取
+_SESSION_KEY = "catalog_changed"
+
+_CATALOG_MODELS = (
+    models.Product,
+    models.Category,
+    models.ProductDiscount,
+    models.ProductsCategories,
+    ProductPhoto,
+)
+
+
+class CatalogCache:
+    """
+    Per-worker cache of serialized catalog responses.
+
+    Entries are JSON bodies ready to send, so a hit does no ORM or Pydantic
+    work. Any committed catalog write clears the whole cache; the TTL bounds
+    how long another worker can serve a page changed elsewhere. Stock
+    changes count as catalog writes only when a product sells out or comes
+    back into stock, so cached stock_quantity figures may lag by up to the TTL.
+    """
+
+    def __init__(self, ttl_seconds: float = 60, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, body: bytes) -> bytes:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+product_pages = CatalogCache()
+category_listings = CatalogCache()
+
+
+def invalidate_catalog() -> None:
+    """Drop every cached catalog response in this worker and bump the snapshot version"""
+    product_pages.invalidate()
+    category_listings.invalidate()
+    catalog_snapshot.bump()
+
+
+def mark_catalog_changed(db: Session) -> None:
+    """Invalidate the catalog caches once `db` commits (for Core UPDATEs the ORM does not see, e.g. sell-outs)"""
+    db.info[_SESSION_KEY] = True
+
+
+@event.listens_for(Session, "before_flush")
+def _detect_catalog_writes(session, flush_context, instances):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, _CATALOG_MODELS):
+            session.info[_SESSION_KEY] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop(_SESSION_KEY, False):
+        invalidate_catalog()
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_catalog_writes(session, transaction):
+    # 回滾時異動不生效，不需清除快取
+    if transaction.parent is None:
+        session.info.pop(_SESSION_KEY, None)
+
+
+def product_page(db: Session, skip: int, limit: int, category_id: Optional[int]) -> bytes:
+    """
+    JSON body of one GET /products/ page, from cache or built with eager loading.
+
+    Categories, photos and discounts are loaded with one selectin query each
+    instead of three lazy loads per product. Read-your-writes sessions skip
+    the cache, which may hold a page built from a lagging replica.
+    """
+    key = (skip, limit, category_id)
+    use_cache = not db.info.get("read_your_writes")
+    body = product_pages.get(key) if use_cache else None
+    if body is not None:
+        return body
+
+    query = db.query(models.Product).options(
+        selectinload(models.Product.categories),
+        selectinload(models.Product.photos),
+        selectinload(models.Product.discounts),
+    )
+    if category_id:
+        query = query.join(models.Product.categories).filter(models.Category.category_id == category_id)
+    products = query.order_by(models.Product.product_id).offset(skip).limit(limit).all()
+
+    payload: List[Dict[str, Any]] = overlay_flash_stock([
+        schemas.Product.model_validate(product).model_dump(mode="json") for product in products
+    ])
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    return product_pages.put(key, body) if use_cache else body
+
+
+def category_counts(db: Session) -> bytes:
+    """
+    JSON body of the category menu: every category with its product count and
+    in-stock product count, from one grouped query, cached until the next
+    catalog write.
+    """
+    use_cache = not db.info.get("read_your_writes")
+    body = category_listings.get("counts") if use_cache else None
+    if body is not None:
+        return body
+
+    # 快閃模式商品的庫存在計數器中，products 的列為 0
+    flash_ids = [product_id for product_id, available in flash_stock.counters().items() if available > 0]
+    in_stock = or_(models.Product.stock_quantity > 0, models.Product.product_id.in_(flash_ids))
+    rows = db.query(
+        models.Category.category_id,
+        models.Category.category_name,
+        func.count(func.distinct(models.Product.product_id)),
+        func.count(func.distinct(case((in_stock, models.Product.product_id)))),
+    )\
+        .outerjoin(models.ProductsCategories, models.ProductsCategories.category_id == models.Category.category_id)\
+        .outerjoin(models.Product, models.Product.product_id == models.ProductsCategories.product_id)\
+        .group_by(models.Category.category_id, models.Category.category_name)\
+        .order_by(models.Category.category_id)\
+        .all()
+    payload = [
+        {"category_id": category_id, "category_name": name, "product_count": product_count, "in_stock_count": in_stock_count}
+        for category_id, name, product_count, in_stock_count in rows
+    ]
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    return category_listings.put("counts", body) if use_cache else body
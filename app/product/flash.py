@@ -0,0 +1,284 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session, sessionmaker
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# session.info 中記錄本交易已套用的快閃庫存異動，回滾時反向補回
+_SESSION_KEY = "flash_stock_adjustments"
+
+
+class FlashStockStore:
+    """
+    Stock counters for products in flash-sale mode.
+
+    Counters live in a local SQLite file shared by every worker process on the
+    host. Enabling flash mode moves the product's stock out of
+    products.stock_quantity into `available` (the row is left at 0), so the
+    two stores never hold the same units; disabling moves the unsold
+    remainder back. Reservations are single-statement UPDATEs on this file,
+    so they never touch the MySQL products row. Other hosts see a product
+    with no stock while its flash sale runs here.
+
+    Which products are in flash mode is cached in memory for
+    `mode_ttl_seconds`, so reserving a normal product never touches the
+    file; a worker whose cache is stale falls back to the products row,
+    which holds no flash units. Units given back after the flash mode
+    ended (a rolled-back reservation) are kept in the flash_pending table
+    until flush_flash_stock adds them to products.stock_quantity.
+    """
+
+    def __init__(self, path: Optional[str] = None, mode_ttl_seconds: float = 1.0):
+        self._path = path
+        self._local = threading.local()
+        self.mode_ttl_seconds = mode_ttl_seconds
+        # (path, 載入時間, 快閃模式商品)
+        self._modes: Optional[Tuple[str, float, FrozenSet[int]]] = None
+
+    @property
+    def path(self) -> str:
+        return self._path or os.getenv("FLASH_STOCK_PATH", "./data/flash_stock.db")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "path", None) != self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS flash_stock ("
+                " product_id INTEGER PRIMARY KEY,"
+                " available INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS flash_pending ("
+                " product_id INTEGER PRIMARY KEY,"
+                " pending INTEGER NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.path = self.path
+        return conn
+
+    def in_flash_mode(self, product_id: int) -> bool:
+        modes = self._modes
+        if modes is None or modes[0] != self.path or time.monotonic() - modes[1] >= self.mode_ttl_seconds:
+            rows = self._conn().execute("SELECT product_id FROM flash_stock").fetchall()
+            modes = (self.path, time.monotonic(), frozenset(row[0] for row in rows))
+            self._modes = modes
+        return product_id in modes[2]
+
+    def enable(self, product_id: int, units: int) -> None:
+        """Start flash mode (if needed) and add `units` moved out of products.stock_quantity"""
+        self._conn().execute(
+            "INSERT INTO flash_stock (product_id, available) VALUES (?, ?)"
+            " ON CONFLICT (product_id) DO UPDATE SET available = available + excluded.available",
+            (product_id, units),
+        )
+        self._modes = None
+
+    def disable(self, product_id: int) -> Optional[int]:
+        """Stop flash mode; returns the unsold units to move back to stock_quantity (None if not enabled)"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT available FROM flash_stock WHERE product_id = ?", (product_id,)).fetchone()
+            conn.execute("DELETE FROM flash_stock WHERE product_id = ?", (product_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._modes = None
+        return row[0] if row else None
+
+    def available(self, product_id: int) -> Optional[int]:
+        row = self._conn().execute("SELECT available FROM flash_stock WHERE product_id = ?", (product_id,)).fetchone()
+        return row[0] if row else None
+
+    def counters(self) -> Dict[int, int]:
+        """Units left per product in flash mode (one query), for showing stock in listings"""
+        return dict(self._conn().execute("SELECT product_id, available FROM flash_stock").fetchall())
+
+    def reserve(self, product_id: int, amount: int) -> Optional[bool]:
+        """
+        Take `amount` units; None means the product is not in flash mode.
+        """
+        if not self.in_flash_mode(product_id):
+            return None
+        conn = self._conn()
+        cursor = conn.execute(
+            "UPDATE flash_stock SET available = available - ? WHERE product_id = ? AND available >= ?",
+            (amount, product_id, amount),
+        )
+        if cursor.rowcount == 1:
+            return True
+        if self.available(product_id) is None:
+            return None
+        return False
+
+    def release(self, product_id: int, amount: int) -> bool:
+        """Give `amount` units back; False means the product is not in flash mode"""
+        if not self.in_flash_mode(product_id):
+            return False
+        return self.adjust(product_id, amount)
+
+    def adjust(self, product_id: int, delta: int) -> bool:
+        """Unconditionally move the counter by `delta`; False if the product is no longer in flash mode"""
+        cursor = self._conn().execute(
+            "UPDATE flash_stock SET available = available + ? WHERE product_id = ?",
+            (delta, product_id),
+        )
+        return cursor.rowcount == 1
+
+    def take_pending(self) -> Dict[int, int]:
+        """Atomically collect and clear the units owed back to products.stock_quantity"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            pending = dict(conn.execute("SELECT product_id, pending FROM flash_pending WHERE pending != 0").fetchall())
+            conn.execute("DELETE FROM flash_pending")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return pending
+
+    def restore_pending(self, pending: Dict[int, int]) -> None:
+        """Record units owed back to products.stock_quantity (also puts back a failed flush)"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for product_id, delta in pending.items():
+                # 只記在 flash_pending，不會讓商品重新進入快閃模式
+                conn.execute(
+                    "INSERT INTO flash_pending (product_id, pending) VALUES (?, ?)"
+                    " ON CONFLICT (product_id) DO UPDATE SET pending = pending + excluded.pending",
+                    (product_id, delta),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM flash_stock")
+        conn.execute("DELETE FROM flash_pending")
+        self._modes = None
+
+
+flash_stock = FlashStockStore()
+
+
+def overlay_flash_stock(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Show the flash counter as stock_quantity of serialized products in flash mode (their row holds 0)"""
+    counters = flash_stock.counters()
+    if counters:
+        for item in items:
+            if item["product_id"] in counters:
+                item["stock_quantity"] = counters[item["product_id"]]
+    return items
+
+
+def record_adjustment(db: Session, product_id: int, delta: int) -> None:
+    """Remember a counter change so it is undone if the order transaction rolls back"""
+    adjustments: List[Tuple[int, int]] = db.info.setdefault(_SESSION_KEY, [])
+    adjustments.append((product_id, delta))
+
+
+@event.listens_for(Session, "after_commit")
+def _keep_flash_adjustments(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _undo_flash_adjustments(session, transaction):
+    if transaction.parent is not None:
+        return
+    # 交易未提交就結束（回滾），反向補回本交易對計數器的異動
+    for product_id, delta in reversed(session.info.pop(_SESSION_KEY, [])):
+        if not flash_stock.adjust(product_id, -delta):
+            # 期間已關閉快閃模式，剩餘數量已移回 products；補回的數量改由下次寫回加上
+            flash_stock.restore_pending({product_id: -delta})
+
+
+def flush_flash_stock(db: Session) -> Dict[int, int]:
+    """
+    Add units owed back after a flash mode ended to products.stock_quantity in one transaction.
+
+    Returns the applied change per product. On failure the changes are put
+    back so the next flush retries them.
+    """
+    # catalog 模組會匯入本模組，於此延後匯入
+    from .catalog import mark_catalog_changed
+
+    pending = flash_stock.take_pending()
+    if not pending:
+        return {}
+    try:
+        # 只有進出有庫存狀態時才需清除商品目錄快取
+        before = dict(
+            db.query(Product.product_id, Product.stock_quantity)
+            .filter(Product.product_id.in_(pending))
+        )
+        for product_id in sorted(pending):
+            db.execute(
+                update(Product)
+                .where(Product.product_id == product_id)
+                .values(stock_quantity=Product.stock_quantity + pending[product_id])
+            )
+        for product_id, delta in pending.items():
+            stock = before.get(product_id) or 0
+            if (stock > 0) != (stock + delta > 0):
+                mark_catalog_changed(db)
+                break
+        db.commit()
+    except Exception:
+        db.rollback()
+        flash_stock.restore_pending(pending)
+        raise
+    return pending
+
+
+class FlashStockFlusher:
+    """Background thread that writes units owed back by ended flash modes every `interval` seconds"""
+
+    def __init__(self, session_factory: sessionmaker, interval: float):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="flash-stock-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the thread and reconcile whatever is still pending (nothing to do if it never started)"""
+        self._stop.set()
+        if self._thread is None:
+            return
+        self._thread.join()
+        self.flush()
+
+    def flush(self) -> None:
+        db = self.session_factory()
+        try:
+            flush_flash_stock(db)
+        except Exception:
+            logger.exception("Failed to write flash-sale stock back to products")
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
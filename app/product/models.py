@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Table, Boolean, Date
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Table, Boolean, Date, Text, DDL, Index, event
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..db import Base
@@ -14,6 +14,11 @@ from ..db import Base
 
 class ProductsCategories(Base):
     __tablename__ = "products_categories"
+    __table_args__ = (
+        # 依類別篩選商品與依商品查類別各一個複合索引
+        Index('ix_products_categories_category_id_product_id', 'category_id', 'product_id'),
+        Index('ix_products_categories_product_id_category_id', 'product_id', 'category_id'),
+    )
 
     id = Column(Integer, primary_key=True)
     product_id = Column(Integer, ForeignKey("products.product_id")) # 商品ID
@@ -57,4 +62,46 @@ class ProductDiscount(Base):
     
     # Relationships
     product = relationship("Product", back_populates="discounts")
-    order_details = relationship("OrderDetail", back_populates="discount")
\ No newline at end of file
+    order_details = relationship("OrderDetail", back_populates="discount")
+
+
+class ProductSearchDocument(Base):
+    """
+    Search text of one product, already split into search tokens
+    (CJK bigrams and lowercase words) by app.product.search.
+    """
+    __tablename__ = "product_search_documents"
+
+    product_id = Column(Integer, ForeignKey("products.product_id", ondelete="CASCADE"), primary_key=True)
+    name_tokens = Column(Text, nullable=False, default="")  # 商品名稱
+    body_tokens = Column(Text, nullable=False, default="")  # 描述與類別名稱
+    update_time = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# SQLite 以 FTS5 外部內容表建立倒排索引，觸發器保持與文件表同步
+for _statement in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search_fts USING fts5("
+    "name_tokens, body_tokens, content='product_search_documents', content_rowid='product_id')",
+    "CREATE TRIGGER IF NOT EXISTS product_search_ai AFTER INSERT ON product_search_documents BEGIN "
+    "INSERT INTO product_search_fts (rowid, name_tokens, body_tokens) "
+    "VALUES (new.product_id, new.name_tokens, new.body_tokens); END",
+    "CREATE TRIGGER IF NOT EXISTS product_search_ad AFTER DELETE ON product_search_documents BEGIN "
+    "INSERT INTO product_search_fts (product_search_fts, rowid, name_tokens, body_tokens) "
+    "VALUES ('delete', old.product_id, old.name_tokens, old.body_tokens); END",
+    "CREATE TRIGGER IF NOT EXISTS product_search_au AFTER UPDATE ON product_search_documents BEGIN "
+    "INSERT INTO product_search_fts (product_search_fts, rowid, name_tokens, body_tokens) "
+    "VALUES ('delete', old.product_id, old.name_tokens, old.body_tokens); "
+    "INSERT INTO product_search_fts (rowid, name_tokens, body_tokens) "
+    "VALUES (new.product_id, new.name_tokens, new.body_tokens); END",
+):
+    event.listen(ProductSearchDocument.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(
+    ProductSearchDocument.__table__, "before_drop",
+    DDL("DROP TABLE IF EXISTS product_search_fts").execute_if(dialect="sqlite"),
+)
+# MySQL 以 ngram parser 的 FULLTEXT 索引搜尋（名稱單獨一個索引用於加權）
+for _statement in (
+    "ALTER TABLE product_search_documents ADD FULLTEXT INDEX ft_product_search_all (name_tokens, body_tokens) WITH PARSER ngram",
+    "ALTER TABLE product_search_documents ADD FULLTEXT INDEX ft_product_search_name (name_tokens) WITH PARSER ngram",
+):
+    event.listen(ProductSearchDocument.__table__, "after_create", DDL(_statement).execute_if(dialect="mysql"))
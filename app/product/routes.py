@@ -1,13 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, UploadFile, File
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import and_,insert
-from typing import List, Optional
+from typing import List, Optional, Union
 import hashlib
 from datetime import datetime
 import os
 
-from ..db import get_db
+from ..db import get_db, get_read_db
 from . import models, schemas
+from .cache import discount_ladders
+from .catalog import category_counts, product_page
+from .search import index_product, index_products, remove_product, search_product_ids
+from .snapshot import catalog_snapshot
+from .suggest import product_suggestions
+from app.order.etags import etag_matches
+from .flash import flash_stock, overlay_flash_stock
 
 router = APIRouter()
 
@@ -40,8 +47,10 @@ def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)
         db_product.categories = categories
     
     db.add(db_product)
+    index_product(db, db_product)
     db.commit()
     db.refresh(db_product)
+    product_suggestions.upsert(db_product.product_id, db_product.product_name)
     return db_product
 
 @router.get("/products/", response_model=List[schemas.Product], tags=["Products"])
@@ -49,14 +58,73 @@ def list_products(
     skip: int = 0,
     limit: int = 100,
     category_id: Optional[int] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    query = db.query(models.Product)
-    if category_id:
-        query = query.join(models.Product.categories).filter(models.Category.category_id == category_id)
-    
-    products = query.offset(skip).limit(limit).all()
-    return products
+    # 已序列化的頁面快取於記憶體，商品/類別/照片/折扣異動提交後清除
+    return Response(content=product_page(db, skip, limit, category_id), media_type="application/json")
+
+@router.get("/products/snapshot", tags=["Products"])
+def get_catalog_snapshot(
+    if_none_match: Optional[str] = Header(default=None),
+    accept_encoding: Optional[str] = Header(default=None),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Every in-stock product with categories, first photo and discount ladder,
+    as one pre-built JSON blob (gzipped when the client accepts it).
+    Unchanged clients get 304 from the strong ETag.
+    """
+    snapshot = catalog_snapshot.get(db)
+    # 不同內容編碼各自使用不同的強驗證碼（RFC 9110）
+    gzipped = bool(accept_encoding) and "gzip" in accept_encoding.lower()
+    etag = snapshot.gzip_etag if gzipped else snapshot.etag
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=snapshot.gzipped, media_type="application/json", headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+@router.get("/products/search", response_model=List[schemas.Product], tags=["Products"])
+def search_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Products matching every word of `q` in their name, description or
+    category names, best match first. Chinese text is matched by bigrams.
+    """
+    product_ids = search_product_ids(db, q, limit)
+    if not product_ids:
+        return []
+    products = db.query(models.Product)\
+        .options(
+            selectinload(models.Product.categories),
+            selectinload(models.Product.photos),
+            selectinload(models.Product.discounts),
+        )\
+        .filter(models.Product.product_id.in_(product_ids))\
+        .all()
+    by_id = {product.product_id: product for product in products}
+    return overlay_flash_stock([
+        schemas.Product.model_validate(by_id[product_id]).model_dump()
+        for product_id in product_ids if product_id in by_id
+    ])
+
+@router.get("/products/suggest", response_model=List[schemas.ProductSuggestion], tags=["Products"])
+def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Autocomplete: products whose name has a word (or, in Chinese, any
+    character run) starting with `q`, best sellers of the last
+    PRODUCT_SUGGEST_SALES_DAYS days first. Served from an in-memory index.
+    """
+    return product_suggestions.suggest(db, q, limit)
 
 @router.get("/products/{product_id}", response_model=schemas.Product, tags=["Products"])
 
@@ -64,7 +132,7 @@ def get_product(product_id: int, db: Session = Depends(get_db)):
     product = db.query(models.Product).filter(models.Product.product_id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    return overlay_flash_stock([schemas.Product.model_validate(product).model_dump()])[0]
 
 @router.delete("/products/{product_id}", tags=["Products"])
 
@@ -72,8 +140,11 @@ def delete_product(product_id: int, db: Session = Depends(get_db)):
     product = db.query(models.Product).filter(models.Product.product_id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
+    remove_product(db, product_id)
     db.delete(product)
     db.commit()
+    discount_ladders.invalidate(product_id)
+    product_suggestions.remove(product_id)
     return {"message": "Product deleted successfully"}
 
 @router.put("/products/{product_id}", response_model=schemas.Product, tags=["Products"])
@@ -102,10 +173,58 @@ def update_product(product_id: int, product: schemas.ProductUpdate, db: Session
         else:
             setattr(db_product, field, value)
     
+    index_product(db, db_product)
     db.commit()
     db.refresh(db_product)
+    product_suggestions.upsert(product_id, db_product.product_name)
     return db_product
 
+@router.post("/products/{product_id}/flash", response_model=schemas.FlashSaleStatus, tags=["Products"])
+def enable_flash_sale(product_id: int, db: Session = Depends(get_db)):
+    """
+    Move this product's stock into the local flash counter and reserve from there.
+
+    The products row is locked, so checkouts still holding a reservation
+    finish first, and its stock is set to 0 in the same transaction.
+    Calling it again moves stock added to the row since then.
+    """
+    product = db.query(models.Product).filter(models.Product.product_id == product_id).with_for_update().first()
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    units = max(product.stock_quantity or 0, 0)
+    product.stock_quantity = 0
+    db.flush()
+    flash_stock.enable(product_id, units)
+    try:
+        db.commit()
+    except Exception:
+        # 資料庫未提交，計數器也不可保留這些數量
+        flash_stock.adjust(product_id, -units)
+        raise
+    return {
+        "product_id": product_id,
+        "flash_mode": True,
+        "available": flash_stock.available(product_id),
+        "stock_quantity": 0,
+    }
+
+@router.delete("/products/{product_id}/flash", response_model=schemas.FlashSaleStatus, tags=["Products"])
+def disable_flash_sale(product_id: int, db: Session = Depends(get_db)):
+    """Leave flash mode and move the counter's unsold units back to stock_quantity"""
+    product = db.query(models.Product).filter(models.Product.product_id == product_id).with_for_update().first()
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    remaining = flash_stock.disable(product_id)
+    if remaining:
+        product.stock_quantity = models.Product.stock_quantity + remaining
+        try:
+            db.commit()
+        except Exception:
+            flash_stock.enable(product_id, remaining)
+            raise
+        db.refresh(product)
+    return {"product_id": product_id, "flash_mode": False, "available": None, "stock_quantity": product.stock_quantity}
+
 # Category Routes
 
 @router.post("/categories/", response_model=schemas.Category, tags=["Categories"])
@@ -125,9 +244,12 @@ def create_category(category: schemas.CategoryCreate, db: Session = Depends(get_
     db.refresh(db_category)
     return db_category
 
-@router.get("/categories/", response_model=List[schemas.Category], tags=["Categories"])
+@router.get("/categories/", response_model=Union[List[schemas.CategoryWithCounts], List[schemas.Category]], tags=["Categories"])
 
-def list_categories(db: Session = Depends(get_db)):
+def list_categories(with_counts: bool = False, db: Session = Depends(get_db)):
+    if with_counts:
+        # 一次分組查詢取得各類別的商品數與有庫存商品數，快取至下次商品或類別異動
+        return Response(content=category_counts(db), media_type="application/json")
     return db.query(models.Category).all()
 
 @router.get("/categories/{category_id}", response_model=schemas.Category, tags=["Categories"])
@@ -144,7 +266,10 @@ def delete_category(category_id: int, db: Session = Depends(get_db)):
     category = db.query(models.Category).filter(models.Category.category_id == category_id).first()
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
+    product_ids = [product.product_id for product in category.products]
     db.delete(category)
+    db.flush()
+    index_products(db, product_ids)
     db.commit()
     return {"message": "Category deleted successfully"}
 
@@ -170,6 +295,7 @@ def create_product_category(
         category_id=product_category.category_id
     )
     db.add(db_product_category)
+    index_product(db, product)
     db.commit()
 
     return {
@@ -200,6 +326,7 @@ def delete_all_product_categories(product_id: int, db: Session = Depends(get_db)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     product.categories = []
+    index_product(db, product)
     db.commit()
     return {"message": "All categories deleted successfully"}
 
@@ -218,6 +345,7 @@ def create_product_discount(product_id: int, discount: schemas.ProductDiscountCr
     )
     db.add(db_discount)
     db.commit()
+    discount_ladders.invalidate(product_id)
     db.refresh(db_discount)
     return db_discount
 
@@ -268,6 +396,7 @@ def delete_all_product_discounts(product_id: int, db: Session = Depends(get_db))
             deleted_count += 1
     
     db.commit()
+    discount_ladders.invalidate(product_id)
     
     # 返回結果訊息
     if skipped_count > 0 and deleted_count > 0:
@@ -345,6 +474,7 @@ def update_product_discounts(product_id: int, discounts: List[schemas.ProductDis
             db.delete(discount)
     
     db.commit()
+    discount_ladders.invalidate(product_id)
     
     # 重新獲取所有折扣以確保數據最新
     updated_discounts = db.query(models.ProductDiscount).filter(
@@ -14,6 +14,10 @@ class Category(CategoryBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class CategoryWithCounts(Category):
+    product_count: int = Field(description="商品數量")
+    in_stock_count: int = Field(description="有庫存的商品數量")
+
 class ProductDiscountBase(BaseModel):
     quantity: int = Field(gt=0, description="購買數量")
     price: int = Field(gt=0, description="折扣價格")
@@ -60,4 +64,15 @@ class Product(ProductBase):
     photos: List[Photo] = []
     discounts: List[ProductDiscount] = []
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+class FlashSaleStatus(BaseModel):
+    product_id: int
+    flash_mode: bool
+    available: Optional[int] = Field(default=None, description="快閃模式下可預留的數量")
+    stock_quantity: int = Field(description="已寫回資料庫的庫存數量")
+
+class ProductSuggestion(BaseModel):
+    product_id: int
+    product_name: str
+    recent_sales: int = Field(description="近期售出數量")
@@ -0,0 +1,174 @@
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, text
+from sqlalchemy.orm import Session
+
+from .models import Category, Product, ProductSearchDocument, ProductsCategories
+
+# 中日韓文字：平假名/片假名、CJK 統一漢字（含擴充 A）、相容漢字、韓文
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(f"([{_CJK}]+)|([^\\W_{_CJK}]+)")
+
+
+def tokenize(value: Optional[str], unigrams: bool = False) -> List[str]:
+    """
+    Split text into search tokens: CJK runs become overlapping bigrams
+    (a lone character stays a unigram), other runs become lowercase words.
+
+    Documents are indexed with unigrams=True so a one-character query can
+    match any character of a longer run.
+    """
+    tokens: List[str] = []
+    for cjk, word in _TOKEN_RE.findall((value or "").lower()):
+        if cjk:
+            if len(cjk) == 1:
+                tokens.append(cjk)
+            else:
+                tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+                if unigrams:
+                    tokens.extend(cjk)
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def _join(tokens: Iterable[str]) -> str:
+    return " ".join(tokens)
+
+
+def _write_documents(db: Session, products: List[Product]) -> None:
+    """Upsert the search documents of `products` with one query for categories and one for documents"""
+    if not products:
+        return
+    db.flush()
+    ids = [product.product_id for product in products]
+    category_names: Dict[int, List[str]] = defaultdict(list)
+    for product_id, name in db.query(ProductsCategories.product_id, Category.category_name)\
+            .join(Category, Category.category_id == ProductsCategories.category_id)\
+            .filter(ProductsCategories.product_id.in_(ids))\
+            .order_by(ProductsCategories.product_id, Category.category_id):
+        category_names[product_id].append(name)
+    documents = {
+        document.product_id: document
+        for document in db.query(ProductSearchDocument).filter(ProductSearchDocument.product_id.in_(ids))
+    }
+
+    for product in products:
+        name_tokens = _join(tokenize(product.product_name, unigrams=True))
+        body_tokens = _join(tokenize(product.description, unigrams=True) + [
+            token for name in category_names.get(product.product_id, []) for token in tokenize(name, unigrams=True)
+        ])
+        document = documents.get(product.product_id)
+        if document is None:
+            db.add(ProductSearchDocument(product_id=product.product_id, name_tokens=name_tokens, body_tokens=body_tokens))
+        elif (document.name_tokens, document.body_tokens) != (name_tokens, body_tokens):
+            document.name_tokens = name_tokens
+            document.body_tokens = body_tokens
+
+
+def index_product(db: Session, product: Product) -> None:
+    """Write (or rewrite) the search document of `product` inside the caller's transaction"""
+    _write_documents(db, [product])
+
+
+def index_products(db: Session, product_ids: Iterable[int]) -> None:
+    """Re-index several products (e.g. after a category they belong to changed)"""
+    ids = set(product_ids)
+    if ids:
+        _write_documents(db, db.query(Product).filter(Product.product_id.in_(ids)).all())
+
+
+def remove_product(db: Session, product_id: int) -> None:
+    db.execute(delete(ProductSearchDocument).where(ProductSearchDocument.product_id == product_id))
+
+
+def _fts_query(tokens: List[str]) -> str:
+    # 詞只含文字字元；加上雙引號避免 AND/OR/NEAR 被當成運算子
+    return " ".join(f'"{token}"' for token in tokens)
+
+
+def search_product_ids(db: Session, query: str, limit: int = 20) -> List[int]:
+    """
+    Product ids matching every token of `query`, best match first.
+
+    SQLite ranks with FTS5 bm25 and MySQL with ngram FULLTEXT relevance;
+    name matches weigh more than description/category matches. Other
+    databases fall back to a LIKE scan of the documents.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return []
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        rows = db.execute(text(
+            "SELECT rowid FROM product_search_fts WHERE product_search_fts MATCH :q"
+            " ORDER BY bm25(product_search_fts, 5.0, 1.0) LIMIT :limit"
+        ), {"q": _fts_query(tokens), "limit": limit})
+        return [row[0] for row in rows]
+
+    if dialect == "mysql":
+        boolean_query = " ".join(f'+"{token}"' for token in tokens)
+        rows = db.execute(text(
+            "SELECT product_id,"
+            " MATCH(name_tokens) AGAINST(:q IN BOOLEAN MODE) * 4"
+            " + MATCH(name_tokens, body_tokens) AGAINST(:q IN BOOLEAN MODE) AS score"
+            " FROM product_search_documents"
+            " WHERE MATCH(name_tokens, body_tokens) AGAINST(:q IN BOOLEAN MODE)"
+            " ORDER BY score DESC, product_id LIMIT :limit"
+        ), {"q": boolean_query, "limit": limit})
+        return [row[0] for row in rows]
+
+    query_ = db.query(ProductSearchDocument.product_id)
+    for token in tokens:
+        document = func.concat(ProductSearchDocument.name_tokens, " ", ProductSearchDocument.body_tokens)
+        query_ = query_.filter(document.contains(token, autoescape=True))
+    return [product_id for (product_id,) in query_.order_by(ProductSearchDocument.product_id).limit(limit)]
+
+
+def rebuild_search_index(db: Session, batch_size: int = 1000) -> int:
+    """Re-index every product in batches (backfill after the migration); returns the product count"""
+    count = 0
+    last_id = 0
+    while True:
+        products = db.query(Product)\
+            .filter(Product.product_id > last_id)\
+            .order_by(Product.product_id)\
+            .limit(batch_size)\
+            .all()
+        if not products:
+            break
+        _write_documents(db, products)
+        db.commit()
+        count += len(products)
+        last_id = products[-1].product_id
+    # 清除已刪除商品遺留的文件
+    db.execute(delete(ProductSearchDocument).where(
+        ProductSearchDocument.product_id.not_in(db.query(Product.product_id).scalar_subquery())
+    ))
+    db.commit()
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 載入所有模型，讓關聯能完成設定
+    import app.customer.models  # noqa: F401
+    import app.location.models  # noqa: F401
+    import app.order.models  # noqa: F401
+    import app.photo.models  # noqa: F401
+    from app.db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild the product search index")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        total = rebuild_search_index(session, args.batch_size)
+    finally:
+        session.close()
+    print(f"{total} product(s) indexed")
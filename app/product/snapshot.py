@@ -0,0 +1,211 @@
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.photo.models import ProductPhoto
+from .cache import DiscountLadder
+from .flash import flash_stock
+from .models import Category, Product, ProductDiscount, ProductsCategories
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot(NamedTuple):
+    version: int
+    etag: str
+    body: bytes
+    gzipped: bytes
+    built_at: float
+
+    @property
+    def gzip_etag(self) -> str:
+        """Strong validator of the gzip-encoded representation"""
+        return f'{self.etag[:-1]}-gz"'
+
+
+def build_catalog_payload(db: Session) -> List[Dict[str, Any]]:
+    """
+    All in-stock products with categories, first photo and discount ladder.
+
+    Four flat queries (products, category links, first photos, discounts),
+    joined in memory; no ORM objects or Pydantic models are built. Products
+    in flash mode count as in stock while their counter has units left.
+    """
+    counters = flash_stock.counters()
+    flash_ids = [product_id for product_id, available in counters.items() if available > 0]
+    in_stock_filter = or_(Product.stock_quantity > 0, Product.product_id.in_(flash_ids))
+    products = db.query(
+        Product.product_id, Product.product_name, Product.description, Product.price,
+        Product.one_set_price, Product.one_set_quantity, Product.stock_quantity,
+        Product.unit, Product.arrival_date,
+    )\
+        .filter(in_stock_filter)\
+        .order_by(Product.product_id)\
+        .all()
+    in_stock = db.query(Product.product_id).filter(in_stock_filter).scalar_subquery()
+
+    categories: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    for product_id, category_id, category_name in db.query(
+        ProductsCategories.product_id, Category.category_id, Category.category_name
+    )\
+            .join(Category, Category.category_id == ProductsCategories.category_id)\
+            .filter(ProductsCategories.product_id.in_(in_stock))\
+            .order_by(ProductsCategories.product_id, Category.category_id):
+        categories[product_id].append({"category_id": category_id, "category_name": category_name})
+
+    # 每個商品的第一張照片（photo_id 最小者）
+    first_photo_ids = db.query(func.min(ProductPhoto.photo_id))\
+        .filter(ProductPhoto.product_id.in_(in_stock))\
+        .group_by(ProductPhoto.product_id)\
+        .scalar_subquery()
+    photos = dict(
+        db.query(ProductPhoto.product_id, ProductPhoto.file_path)
+        .filter(ProductPhoto.photo_id.in_(first_photo_ids))
+    )
+
+    discounts: Dict[int, List[ProductDiscount]] = defaultdict(list)
+    for discount in db.query(ProductDiscount)\
+            .filter(ProductDiscount.product_id.in_(in_stock))\
+            .order_by(ProductDiscount.discount_id):
+        discounts[discount.product_id].append(discount)
+
+    payload = []
+    for (product_id, name, description, price, one_set_price, one_set_quantity,
+         stock_quantity, unit, arrival_date) in products:
+        ladder = DiscountLadder(discounts.get(product_id, ()))
+        payload.append({
+            "product_id": product_id,
+            "product_name": name,
+            "description": description,
+            "price": price,
+            "one_set_price": one_set_price,
+            "one_set_quantity": one_set_quantity,
+            "stock_quantity": counters.get(product_id, stock_quantity),
+            "unit": unit,
+            "arrival_date": arrival_date.isoformat() if arrival_date else None,
+            "categories": categories.get(product_id, []),
+            "photo": photos.get(product_id),
+            "discounts": [{"quantity": q, "price": p} for q, p in zip(ladder.quantities, ladder.prices)],
+        })
+    return payload
+
+
+class CatalogSnapshot:
+    """
+    Pre-serialized, pre-gzipped catalog of in-stock products.
+
+    Catalog writes bump `version`; a background builder (or, without one,
+    the next request) rebuilds the blob. While a rebuild is pending the
+    previous snapshot keeps being served. `max_age` bounds how long a
+    snapshot can miss writes made in another worker.
+    """
+
+    def __init__(self, max_age: float = 60):
+        self.max_age = max_age
+        self.version = 0
+        self._current: Optional[Snapshot] = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._changed = threading.Event()
+        self.background = False
+
+    def bump(self) -> None:
+        with self._lock:
+            self.version += 1
+        self.notify()
+
+    def notify(self) -> None:
+        """Wake the background builder"""
+        self._changed.set()
+
+    def is_stale(self, snapshot: Optional[Snapshot]) -> bool:
+        if snapshot is None:
+            return True
+        return snapshot.version != self.version or time.monotonic() - snapshot.built_at >= self.max_age
+
+    def needs_rebuild(self) -> bool:
+        return self.is_stale(self._current)
+
+    def get(self, db: Session) -> Snapshot:
+        snapshot = self._current
+        if snapshot is None or (self.is_stale(snapshot) and not self.background):
+            snapshot = self.rebuild(db)
+        return snapshot
+
+    def rebuild(self, db: Session) -> Snapshot:
+        with self._build_lock:
+            # 等待鎖期間其他執行緒可能已建好最新版本
+            if not self.is_stale(self._current):
+                return self._current
+            version = self.version
+            body = json.dumps(build_catalog_payload(db), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            snapshot = Snapshot(
+                version=version,
+                etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+                body=body,
+                gzipped=gzip.compress(body, compresslevel=9, mtime=0),
+                built_at=time.monotonic(),
+            )
+            self._current = snapshot
+            return snapshot
+
+    def clear(self) -> None:
+        with self._build_lock:
+            self._current = None
+        with self._lock:
+            self.version = 0
+
+    def wait_for_change(self, timeout: float) -> None:
+        self._changed.wait(timeout)
+        self._changed.clear()
+
+
+catalog_snapshot = CatalogSnapshot()
+
+
+class CatalogSnapshotBuilder:
+    """Background thread that rebuilds the catalog snapshot after writes, at most every `interval` seconds"""
+
+    def __init__(self, session_factory: sessionmaker, interval: float):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        catalog_snapshot.background = True
+        self._thread = threading.Thread(target=self._run, name="catalog-snapshot-builder", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        catalog_snapshot.notify()
+        if self._thread is not None:
+            self._thread.join()
+        catalog_snapshot.background = False
+
+    def build(self) -> None:
+        db = self.session_factory()
+        try:
+            catalog_snapshot.rebuild(db)
+        except Exception:
+            logger.exception("Failed to rebuild the catalog snapshot")
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if catalog_snapshot.needs_rebuild():
+                self.build()
+            catalog_snapshot.wait_for_change(catalog_snapshot.max_age)
+            # 連續寫入時合併成一次重建
+            if self._stop.wait(self.interval):
+                break
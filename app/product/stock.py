@@ -0,0 +1,103 @@
+from typing import Dict, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from .catalog import mark_catalog_changed
+from .flash import flash_stock, record_adjustment
+from .models import Product
+
+
+def stock_units(product: Product, quantity: int) -> int:
+    """Convert an ordered quantity into stock units (sets are one_set_quantity units each)"""
+    if product.one_set_quantity and product.one_set_quantity > 0:
+        return quantity * product.one_set_quantity
+    return quantity
+
+
+def available_units(product: Product) -> int:
+    """Units a buyer can still reserve: the flash counter in flash mode, otherwise stock_quantity"""
+    if flash_stock.in_flash_mode(product.product_id):
+        available = flash_stock.available(product.product_id)
+        if available is not None:
+            return available
+    return product.stock_quantity
+
+
+def reserve_stock(db: Session, product_id: int, amount: int) -> bool:
+    """
+    Atomically take `amount` units of stock; returns False if not enough is left.
+
+    The check and the decrement happen in one conditional UPDATE, so
+    concurrent buyers can never both pass the check on the same units.
+    Products in flash-sale mode are reserved from their local counter instead.
+
+    Only a reservation that takes the last units invalidates the catalog
+    caches (the product leaves the in-stock set); it is told apart by a
+    second conditional UPDATE, so the usual case stays one statement.
+    """
+    if amount <= 0:
+        return True
+    flash_reserved = flash_stock.reserve(product_id, amount)
+    if flash_reserved is not None:
+        if flash_reserved:
+            record_adjustment(db, product_id, -amount)
+        return flash_reserved
+    result = db.execute(
+        update(Product)
+        .where(Product.product_id == product_id, Product.stock_quantity > amount)
+        .values(stock_quantity=Product.stock_quantity - amount)
+    )
+    if result.rowcount == 1:
+        return True
+    result = db.execute(
+        update(Product)
+        .where(Product.product_id == product_id, Product.stock_quantity == amount)
+        .values(stock_quantity=0)
+    )
+    if result.rowcount == 1:
+        mark_catalog_changed(db)
+        return True
+    return False
+
+
+def release_stock(db: Session, product_id: int, amount: int) -> None:
+    """
+    Atomically give `amount` units of stock back.
+
+    Like reserve_stock, only a release that brings a sold-out product back
+    into stock invalidates the catalog caches.
+    """
+    if amount <= 0:
+        return
+    if flash_stock.release(product_id, amount):
+        record_adjustment(db, product_id, amount)
+        return
+    result = db.execute(
+        update(Product)
+        .where(Product.product_id == product_id, Product.stock_quantity > 0)
+        .values(stock_quantity=Product.stock_quantity + amount)
+    )
+    if result.rowcount == 1:
+        return
+    db.execute(
+        update(Product)
+        .where(Product.product_id == product_id)
+        .values(stock_quantity=Product.stock_quantity + amount)
+    )
+    mark_catalog_changed(db)
+
+
+def reserve_many(db: Session, amounts: Dict[int, int]) -> Optional[int]:
+    """
+    Reserve stock for several products inside the caller's transaction.
+
+    Rows are locked in ascending product_id order so concurrent multi-item
+    orders cannot deadlock. Returns the product_id that ran out of stock, or
+    None when every reservation succeeded (the caller rolls back on failure).
+    """
+    for product_id in sorted(amounts):
+        if not reserve_stock(db, product_id, amounts[product_id]):
+            return product_id
+    return None
+
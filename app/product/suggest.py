@@ -0,0 +1,223 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.order.models import Order, OrderDetail
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+
+def sales_window_days() -> int:
+    return int(os.getenv("PRODUCT_SUGGEST_SALES_DAYS", "30"))
+
+
+def name_keys(name: str) -> List[str]:
+    """
+    Every suffix of the lowercased name that starts a word or a CJK character,
+    so typing the start of any word (or any character run in Chinese) matches.
+    """
+    name = (name or "").lower().strip()
+    keys = []
+    for i, char in enumerate(name):
+        if not char.isalnum():
+            continue
+        previous = name[i - 1] if i else " "
+        # 中文沒有分詞，每個字都可能是使用者輸入的開頭
+        if i == 0 or not previous.isalnum() or not char.isascii():
+            keys.append(name[i:])
+    return keys
+
+
+class ProductSuggestIndex:
+    """
+    Per-worker sorted array of name keys for prefix autocomplete.
+
+    A lookup is two bisects over the key array plus a top-N pick by recent
+    sales over the matching slice; results are memoized per prefix, since
+    short prefixes match large slices. Product writes in this worker update
+    the index in place; a periodic rebuild picks up writes from other
+    workers and refreshes the sales ranking. Writes made while a rebuild
+    reads the database are replayed onto the new index after the swap.
+    With a background refresher running, requests serve the stale index
+    instead of rebuilding it themselves.
+    """
+
+    def __init__(self, ttl_seconds: float = 600, max_cached_prefixes: int = 4096):
+        self.ttl_seconds = ttl_seconds
+        self.max_cached_prefixes = max_cached_prefixes
+        self._results: Dict[Tuple[str, int], List[Dict[str, object]]] = {}
+        self._keys: List[str] = []
+        self._ids: List[int] = []
+        self._names: Dict[int, str] = {}
+        self._sales: Dict[int, int] = {}
+        self._built_at: Optional[float] = None
+        self._lock = threading.Lock()
+        # 每次 upsert/remove 遞增；重建期間的異動記在 _changes，換上新索引後重播
+        self._generation = 0
+        self._changes: List[Tuple[int, int, Optional[str]]] = []
+        self._builds = 0
+        self.background = False
+
+    def build(self, db: Session) -> None:
+        with self._lock:
+            started = self._generation
+            self._builds += 1
+        try:
+            names = dict(db.query(Product.product_id, Product.product_name))
+            sales = recent_sales(db)
+            entries = sorted((key, product_id) for product_id, name in names.items() for key in name_keys(name))
+            with self._lock:
+                self._keys = [key for key, _ in entries]
+                self._ids = [product_id for _, product_id in entries]
+                self._names = names
+                self._sales = sales
+                self._results = {}
+                self._built_at = time.monotonic()
+                for generation, product_id, name in self._changes:
+                    if generation > started:
+                        self._remove(product_id)
+                        if name is not None:
+                            self._insert(product_id, name)
+        finally:
+            with self._lock:
+                self._builds -= 1
+                if not self._builds:
+                    self._changes = []
+
+    def is_stale(self) -> bool:
+        return self._built_at is None or time.monotonic() - self._built_at >= self.ttl_seconds
+
+    def suggest(self, db: Session, prefix: str, limit: int = 10) -> List[Dict[str, object]]:
+        # 未建立時以本次請求的 session 建立；過期時若無背景重建才於請求中重建
+        if self._built_at is None or (self.is_stale() and not self.background):
+            self.build(db)
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        with self._lock:
+            cached = self._results.get((prefix, limit))
+            if cached is not None:
+                return cached
+            start = bisect_left(self._keys, prefix)
+            end = bisect_left(self._keys, prefix + "\U0010ffff", start)
+            matched = set(self._ids[start:end])
+            top = heapq.nsmallest(
+                limit, matched, key=lambda product_id: (-self._sales.get(product_id, 0), self._names[product_id])
+            )
+            result = [
+                {"product_id": product_id, "product_name": self._names[product_id], "recent_sales": self._sales.get(product_id, 0)}
+                for product_id in top
+            ]
+            if len(self._results) >= self.max_cached_prefixes:
+                self._results.clear()
+            self._results[(prefix, limit)] = result
+            return result
+
+    def upsert(self, product_id: int, name: str) -> None:
+        self._apply(product_id, name)
+
+    def remove(self, product_id: int) -> None:
+        self._apply(product_id, None)
+
+    def _apply(self, product_id: int, name: Optional[str]) -> None:
+        with self._lock:
+            self._generation += 1
+            if self._builds:
+                self._changes.append((self._generation, product_id, name))
+            if self._built_at is None:
+                return
+            self._remove(product_id)
+            if name is not None:
+                self._insert(product_id, name)
+            self._results = {}
+
+    def _insert(self, product_id: int, name: str) -> None:
+        self._names[product_id] = name
+        for key in name_keys(name):
+            index = bisect_left(self._keys, key)
+            # 同鍵依 product_id 排序，與 build 的結果一致
+            while index < len(self._keys) and self._keys[index] == key and self._ids[index] < product_id:
+                index += 1
+            self._keys.insert(index, key)
+            self._ids.insert(index, product_id)
+
+    def _remove(self, product_id: int) -> None:
+        name = self._names.pop(product_id, None)
+        if name is None:
+            return
+        for key in name_keys(name):
+            index = bisect_left(self._keys, key)
+            while index < len(self._keys) and self._keys[index] == key:
+                if self._ids[index] == product_id:
+                    del self._keys[index]
+                    del self._ids[index]
+                    break
+                index += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys, self._ids = [], []
+            self._names, self._sales = {}, {}
+            self._results = {}
+            self._built_at = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"products": len(self._names), "keys": len(self._keys)}
+
+
+def recent_sales(db: Session) -> Dict[int, int]:
+    """Quantity sold per product over the sales window, cancelled orders excluded (one grouped query)"""
+    since = datetime.utcnow() - timedelta(days=sales_window_days())
+    rows = db.query(OrderDetail.product_id, func.sum(OrderDetail.quantity))\
+        .join(Order, Order.order_id == OrderDetail.order_id)\
+        .filter(Order.order_date >= since, Order.order_status != "cancelled")\
+        .group_by(OrderDetail.product_id)
+    return {product_id: int(quantity or 0) for product_id, quantity in rows}
+
+
+product_suggestions = ProductSuggestIndex()
+
+
+class ProductSuggestRefresher:
+    """Background thread that builds the index at worker start and rebuilds it every `interval` seconds"""
+
+    def __init__(self, session_factory: sessionmaker, interval: float):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        product_suggestions.background = True
+        self._thread = threading.Thread(target=self._run, name="product-suggest-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        product_suggestions.background = False
+
+    def refresh(self) -> None:
+        db = self.session_factory()
+        try:
+            product_suggestions.build(db)
+        except Exception:
+            logger.exception("Failed to rebuild the product suggest index")
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        self.refresh()
+        while not self._stop.wait(self.interval):
+            self.refresh()
@@ -0,0 +1,30 @@
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 每個請求一個可變計數器；同步路由在 threadpool 執行時會複製 context，仍指向同一個 list
+_request_queries: ContextVar[Optional[List[int]]] = ContextVar("request_queries", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def start_counting() -> List[int]:
+    """Begin counting SQL statements for the current request"""
+    counter = [0]
+    _request_queries.set(counter)
+    return counter
+
+
+async def query_count_middleware(request, call_next):
+    """Report the number of SQL statements a request issued in the X-Query-Count header"""
+    counter = start_counting()
+    response = await call_next(request)
+    response.headers["X-Query-Count"] = str(counter[0])
+    return response
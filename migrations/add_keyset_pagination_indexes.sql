@@ -0,0 +1,3 @@
+-- 新增 keyset 分頁所需的複合索引
+CREATE INDEX ix_orders_order_date_order_id ON orders (order_date, order_id);
+CREATE INDEX ix_customers_create_date_line_id ON customers (create_date, line_id);
@@ -0,0 +1,34 @@
+-- 建立已完成/已取消舊訂單的封存表，由 python -m app.order.archive 分批搬移
+CREATE TABLE orders_archive (
+    order_id INT PRIMARY KEY,
+    line_id VARCHAR(100) NULL,
+    schedule_id INT NULL,
+    order_date DATETIME NULL,
+    order_status VARCHAR(50) NULL,
+    payment_method VARCHAR(50) NULL,
+    payment_status VARCHAR(50) NULL,
+    total_amount DECIMAL(10, 2) NULL,
+    delivery_address VARCHAR(255) NULL,
+    delivery_method VARCHAR(50) NULL,
+    create_time DATETIME NULL,
+    update_time DATETIME NULL,
+    revision INT NOT NULL DEFAULT 0,
+    archived_at DATETIME NULL
+);
+CREATE INDEX ix_orders_archive_line_id ON orders_archive (line_id);
+
+CREATE TABLE order_details_archive (
+    order_detail_id INT PRIMARY KEY,
+    order_id INT NULL,
+    product_id INT NULL,
+    quantity INT NULL,
+    unit_price DECIMAL(10, 2) NULL,
+    subtotal DECIMAL(10, 2) NULL,
+    discount_id INT NULL,
+    is_finish BOOLEAN NULL
+);
+CREATE INDEX ix_order_details_archive_order_id ON order_details_archive (order_id);
+CREATE INDEX ix_order_details_archive_product_id ON order_details_archive (product_id);
+
+-- 封存條件 (order_status, order_date) 的索引
+CREATE INDEX ix_orders_order_status_order_date ON orders (order_status, order_date);
@@ -0,0 +1,15 @@
+-- 建立訂單事件 outbox 表，由背景派送器送出 LINE 推播等副作用
+CREATE TABLE order_events (
+    event_id INT AUTO_INCREMENT PRIMARY KEY,
+    order_id INT NOT NULL,
+    line_id VARCHAR(100) NULL,
+    event_type VARCHAR(50) NOT NULL,
+    payload TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NOT NULL,
+    last_error VARCHAR(255) NULL,
+    create_time DATETIME NULL,
+    sent_time DATETIME NULL
+);
+CREATE INDEX ix_order_events_status_next_attempt_at ON order_events (status, next_attempt_at);
@@ -0,0 +1,12 @@
+-- 建立訂單 Idempotency-Key 紀錄表，吸收 LIFF 重送造成的重複訂單
+CREATE TABLE order_idempotency_keys (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    line_id VARCHAR(100) NOT NULL,
+    idempotency_key VARCHAR(100) NOT NULL,
+    fingerprint VARCHAR(32) NOT NULL,
+    order_id INT NOT NULL,
+    create_time DATETIME NULL,
+    CONSTRAINT uq_order_idempotency_keys_line_id_key UNIQUE (line_id, idempotency_key),
+    CONSTRAINT fk_order_idempotency_keys_order_id FOREIGN KEY (order_id) REFERENCES orders (order_id) ON DELETE CASCADE
+);
+CREATE INDEX ix_order_idempotency_keys_create_time ON order_idempotency_keys (create_time);
@@ -0,0 +1,2 @@
+-- 新增訂單 revision 欄位，訂單或明細變動時遞增，供取貨清單快取判斷是否過期
+ALTER TABLE orders ADD COLUMN revision INT NOT NULL DEFAULT 0;
@@ -0,0 +1,9 @@
+-- 訂單交易只新增銷售異動列，由背景程序批次併入 product_sales_summary，避免結帳時鎖定同一彙總列
+CREATE TABLE product_sales_deltas (
+    delta_id INT AUTO_INCREMENT PRIMARY KEY,
+    product_id INT NOT NULL,
+    order_status VARCHAR(50) NOT NULL,
+    quantity INT NOT NULL DEFAULT 0,
+    subtotal DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    line_count INT NOT NULL DEFAULT 0
+);
@@ -0,0 +1,10 @@
+-- 建立每個商品依訂單狀態彙總的銷售統計表，由訂單寫入時同步維護
+CREATE TABLE product_sales_summary (
+    product_id INT NOT NULL,
+    order_status VARCHAR(50) NOT NULL,
+    quantity INT NOT NULL DEFAULT 0,
+    subtotal DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    line_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (product_id, order_status)
+);
+-- 建表後執行 python -m app.order.sales_summary 以現有訂單回填
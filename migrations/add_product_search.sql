@@ -0,0 +1,12 @@
+-- 商品搜尋文件表與 ngram FULLTEXT 索引（ngram_token_size 預設為 2，即 CJK 雙字詞）
+-- 建立後執行 python -m app.product.search 建立既有商品的索引
+CREATE TABLE product_search_documents (
+    product_id INT PRIMARY KEY,
+    name_tokens TEXT NOT NULL,
+    body_tokens TEXT NOT NULL,
+    update_time DATETIME NULL,
+    CONSTRAINT fk_product_search_documents_product
+        FOREIGN KEY (product_id) REFERENCES products (product_id) ON DELETE CASCADE
+);
+ALTER TABLE product_search_documents ADD FULLTEXT INDEX ft_product_search_all (name_tokens, body_tokens) WITH PARSER ngram;
+ALTER TABLE product_search_documents ADD FULLTEXT INDEX ft_product_search_name (name_tokens) WITH PARSER ngram;
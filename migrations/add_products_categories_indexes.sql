@@ -0,0 +1,3 @@
+-- 商品與類別關聯表的複合索引（依類別篩選商品、依商品查類別）
+CREATE INDEX ix_products_categories_category_id_product_id ON products_categories (category_id, product_id);
+CREATE INDEX ix_products_categories_product_id_category_id ON products_categories (product_id, category_id);
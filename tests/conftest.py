@@ -4,14 +4,27 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 from app.main import app
-from app.db import Base, get_db
+from app.db import Base, get_db, get_read_db
 from app.auth.dependencies import get_current_user, verify_token
 from app.customer.models import Customer
+from app.product.cache import discount_ladders
+from app.product.catalog import category_listings, product_pages
+from app.product.snapshot import catalog_snapshot
+from app.product.suggest import product_suggestions
+from app.product.flash import flash_stock
+from app.order.manifest import pickup_manifests
 import os
 import shutil
+import tempfile
 
 # 設置測試環境變量
 os.environ["TESTING"] = "True"
+os.environ.setdefault("FLASH_STOCK_PATH", os.path.join(tempfile.mkdtemp(), "flash_stock.db"))
+os.environ["FLASH_FLUSH_INTERVAL"] = "0"
+os.environ["ORDER_EVENT_DISPATCH_INTERVAL"] = "0"
+os.environ["CATALOG_SNAPSHOT_INTERVAL"] = "0"
+os.environ["PRODUCT_SUGGEST_REFRESH_INTERVAL"] = "0"
+os.environ["SALES_SUMMARY_FLUSH_INTERVAL"] = "0"
 
 # Use SQLite in-memory database for testing
 SQLALCHEMY_DATABASE_URL =  "sqlite:///:memory:"
@@ -29,6 +42,26 @@ engine = create_engine(
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+@pytest.fixture(autouse=True)
+def reset_caches():
+    """Clear per-worker caches so ids reused across tests never hit stale entries."""
+    discount_ladders.clear()
+    flash_stock.clear()
+    pickup_manifests.clear()
+    product_pages.clear()
+    category_listings.clear()
+    catalog_snapshot.clear()
+    product_suggestions.clear()
+    yield
+    discount_ladders.clear()
+    flash_stock.clear()
+    pickup_manifests.clear()
+    product_pages.clear()
+    category_listings.clear()
+    catalog_snapshot.clear()
+    product_suggestions.clear()
+
+
 @pytest.fixture(scope="function")
 def db_session():
     """Create a new database session for each test."""
@@ -70,6 +103,7 @@ def client(db_session):
         return user
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     app.dependency_overrides[get_current_user] = override_get_current_user
     app.dependency_overrides[verify_token] = override_get_current_user
     
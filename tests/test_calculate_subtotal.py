@@ -1,7 +1,7 @@
 import pytest
 from decimal import Decimal
 from unittest.mock import MagicMock
-from app.order.routes import calculate_item_subtotal
+from app.order.pricing import calculate_item_subtotal
 from app.product.models import Product, ProductDiscount
 
 def test_basic_price_calculation():
@@ -171,10 +171,43 @@ def test_frontend_consistency():
     
     print("✅ 前後端計算一致性測試通過")
 
+def test_discount_ladder_cache():
+    """測試折扣階梯快取：命中時不查詢資料庫"""
+    from app.product.cache import discount_ladders
+
+    product = MagicMock(spec=Product)
+    product.product_id = 1
+    product.price = Decimal("120")
+    product.one_set_quantity = None
+    product.one_set_price = None
+
+    discount_2 = MagicMock(spec=ProductDiscount)
+    discount_2.quantity = 2
+    discount_2.price = Decimal("200")
+
+    mock_db = MagicMock()
+    mock_db.query.return_value.filter.return_value.all.return_value = [discount_2]
+
+    for _ in range(3):
+        result = calculate_item_subtotal(product, 3, mock_db)
+        assert result["price"] == 320
+
+    assert mock_db.query.call_count == 1
+    assert discount_ladders.stats() == {"size": 1, "hits": 2, "misses": 1}
+
+    # 失效後重新載入
+    discount_ladders.invalidate(1)
+    mock_db.query.return_value.filter.return_value.all.return_value = []
+    assert calculate_item_subtotal(product, 3, mock_db)["price"] == 360
+    assert mock_db.query.call_count == 2
+
+    print("✅ 折扣階梯快取測試通過")
+
 if __name__ == "__main__":
     print("開始測試 calculate_item_subtotal 函數...")
     test_basic_price_calculation()
     test_set_price_calculation()
     test_discount_calculation()
     test_frontend_consistency()
+    test_discount_ladder_cache()
     print("所有測試通過！✅")
@@ -61,6 +61,65 @@ def test_list_customers(client: TestClient, test_customer):
     assert any(customer["line_id"] == test_customer["line_id"] for customer in data)
 
 
+def test_list_customers_page(client: TestClient, test_customer):
+    for i in range(5):
+        client.post("/customers/", json={**test_customer, "line_id": f"page_user_{i}"})
+
+    seen = []
+    cursor = None
+    while True:
+        url = "/customers/page?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["items"]) <= 2
+        seen.extend(c["line_id"] for c in data["items"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+
+    # 同一秒內建立的客戶以 line_id 排序，不重複也不遺漏
+    assert seen == [f"page_user_{i}" for i in range(5)]
+
+
+def test_list_customers_page_invalid_cursor(client: TestClient):
+    from app.pagination import encode_cursor
+
+    response = client.get("/customers/page?cursor=not-a-cursor")
+    assert response.status_code == 400
+    # 格式正確但 row_id 型別不對的 cursor 也回 400，而非 500
+    for row_id in ([1], {"a": 1}, True, 1.5):
+        response = client.get(f"/customers/page?cursor={encode_cursor('2024-01-01', row_id)}")
+        assert response.status_code == 400
+
+
+def test_keyset_page_with_null_sort_values(client: TestClient, db_session, test_customer):
+    from app.customer.models import Customer
+    from app.pagination import keyset_page
+
+    for i in range(5):
+        client.post("/customers/", json={**test_customer, "line_id": f"page_user_{i}"})
+    db_session.query(Customer).filter(Customer.line_id.in_(["page_user_1", "page_user_3"]))\
+        .update({Customer.create_date: None}, synchronize_session=False)
+    db_session.commit()
+
+    for descending in (False, True):
+        seen = []
+        cursor = None
+        while True:
+            items, cursor = keyset_page(
+                db_session.query(Customer), Customer.create_date, Customer.line_id, cursor, 2, descending=descending
+            )
+            seen.extend(c.line_id for c in items)
+            if cursor is None:
+                break
+        # create_date 為 NULL 的客戶不論方向都排在最後，依 line_id 排序
+        valued, nulls = ["page_user_0", "page_user_2", "page_user_4"], ["page_user_1", "page_user_3"]
+        if descending:
+            valued, nulls = valued[::-1], nulls[::-1]
+        assert seen == valued + nulls
+
+
 def test_update_customer(client: TestClient, test_customer):
     # Create customer first
     client.post("/customers/", json=test_customer)
@@ -349,12 +349,13 @@ def test_update_order_detail_insufficient_stock(client, db_session, test_order,
         "discount_id": None
     }
     
+    product_id = product.product_id
     response = client.put(f"/orders/{order.order_id}/details/{order_detail.order_detail_id}", json=update_data)
     assert response.status_code == 400
     assert "Insufficient stock" in response.json()["detail"]
     
     # Verify stock was not changed
-    updated_product = db_session.query(Product).filter(Product.product_id == product.product_id).first()
+    updated_product = db_session.query(Product).filter(Product.product_id == product_id).first()
     assert updated_product.stock_quantity == 2
 
 
@@ -851,4 +851,833 @@ def test_create_order_with_quantity_discount(client, db_session, test_customer,
     
     # 驗證庫存是否正確減少
     updated_product = db_session.query(Product).filter(Product.product_id == product.product_id).first()
-    assert updated_product.stock_quantity == 40  # 原始50 - 訂購的10
\ No newline at end of file
+    assert updated_product.stock_quantity == 40  # 原始50 - 訂購的10
+
+def _count_queries(db_session, func):
+    """執行 func 並回傳期間送出的 SQL 次數"""
+    from sqlalchemy import event
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        result = func()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return result, len(statements)
+
+
+def _add_orders(db_session, customer, schedule, products, count):
+    for _ in range(count):
+        order = Order(
+            line_id=customer.line_id,
+            schedule_id=schedule.schedule_id,
+            total_amount=0,
+            payment_method="cash",
+            order_status="paid"
+        )
+        db_session.add(order)
+        db_session.flush()
+        for product in products:
+            db_session.add(OrderDetail(
+                order_id=order.order_id,
+                product_id=product.product_id,
+                quantity=3,
+                unit_price=float(product.price),
+                subtotal=float(product.price) * 3
+            ))
+    db_session.commit()
+
+
+def test_get_orders_list_query_count_is_flat(client, db_session, test_customer, test_product, test_schedule):
+    plain_product = Product(
+        product_name="Plain Product",
+        description="Product with a discount ladder",
+        price=120.00,
+        stock_quantity=50,
+        unit="piece"
+    )
+    db_session.add(plain_product)
+    db_session.flush()
+    db_session.add(ProductDiscount(product_id=plain_product.product_id, quantity=2, price=200))
+    db_session.commit()
+    products = [test_product, plain_product]
+
+    from app.product.cache import discount_ladders
+
+    _add_orders(db_session, test_customer, test_schedule, products, 3)
+    discount_ladders.clear()
+    response, small_count = _count_queries(db_session, lambda: client.get("/orders/list/all"))
+    assert response.status_code == 200
+    assert len(response.json()) == 6
+
+    _add_orders(db_session, test_customer, test_schedule, products, 30)
+    discount_ladders.clear()
+    response, large_count = _count_queries(db_session, lambda: client.get("/orders/list/all"))
+    assert response.status_code == 200
+    rows = response.json()
+    assert len(rows) == 66
+    assert large_count == small_count
+
+    set_row = next(r for r in rows if r["商品名稱"] == "Test Product")
+    assert set_row["單位"] == "組(每組5piece)"
+    assert set_row["小計金額"] == 270.0
+    assert set_row["訂單狀態"] == "已付款"
+    assert set_row["地點"] == "Test Location"
+    assert set_row["訂購人"] == "Test Customer"
+
+    discounted_row = next(r for r in rows if r["商品名稱"] == "Plain Product")
+    assert discounted_row["單位"] == "piece"
+    # 3 個：買 2 個折扣 200 + 1 個原價 120
+    assert discounted_row["小計金額"] == 320.0
+
+
+def test_export_orders_list(client, db_session, test_customer, test_product, test_schedule):
+    import csv
+    import io
+    import json
+
+    _add_orders(db_session, test_customer, test_schedule, [test_product], 3)
+    cancelled = Order(
+        line_id=test_customer.line_id,
+        schedule_id=test_schedule.schedule_id,
+        total_amount=0,
+        payment_method="cash",
+        order_status="cancelled"
+    )
+    db_session.add(cancelled)
+    db_session.flush()
+    db_session.add(OrderDetail(
+        order_id=cancelled.order_id,
+        product_id=test_product.product_id,
+        quantity=1,
+        unit_price=90.00,
+        subtotal=90.00
+    ))
+    db_session.commit()
+
+    response = client.get("/orders/list/export?format=csv")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text.lstrip("\ufeff"))))
+    assert len(rows) == 4
+    assert rows[0]["商品名稱"] == "Test Product"
+    assert rows[0]["小計金額"] == "270.0"
+
+    response = client.get(f"/orders/list/export?format=ndjson&status=paid&location_id={test_schedule.location_id}")
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 3
+    assert all(row["訂單狀態"] == "已付款" for row in rows)
+    assert rows == client.get("/orders/list/all").json()[:3]
+
+    response = client.get("/orders/list/export?format=ndjson&schedule_date=2000-01-01")
+    assert response.status_code == 200
+    assert response.text == ""
+
+    response = client.get("/orders/list/export?format=xlsx")
+    assert response.status_code == 400
+
+
+def test_get_orders_page(client, db_session, test_customer, test_product, test_schedule):
+    from datetime import timedelta
+
+    line_id = test_customer.line_id
+    schedule_id = test_schedule.schedule_id
+    base = datetime(2024, 1, 1, 12, 0, 0)
+    # 兩筆訂單共用同一個 order_date，驗證以 order_id 作為次排序
+    order_dates = [base, base + timedelta(hours=1), base + timedelta(hours=1), base + timedelta(hours=2), base + timedelta(hours=3)]
+    for order_date in order_dates:
+        db_session.add(Order(
+            line_id=line_id,
+            schedule_id=schedule_id,
+            total_amount=100.00,
+            payment_method="cash",
+            order_date=order_date
+        ))
+    db_session.commit()
+    expected = [o.order_id for o in db_session.query(Order).order_by(Order.order_date.desc(), Order.order_id.desc())]
+
+    response = client.get("/orders/page?limit=2")
+    assert response.status_code == 200
+    first_page = response.json()
+    assert [o["order_id"] for o in first_page["items"]] == expected[:2]
+
+    # 新訂單插入不影響後續頁面
+    db_session.add(Order(
+        line_id=line_id,
+        schedule_id=schedule_id,
+        total_amount=100.00,
+        payment_method="cash",
+        order_date=base + timedelta(days=1)
+    ))
+    db_session.commit()
+
+    seen = [o["order_id"] for o in first_page["items"]]
+    cursor = first_page["next_cursor"]
+    while cursor:
+        data = client.get(f"/orders/page?limit=2&cursor={cursor}").json()
+        seen.extend(o["order_id"] for o in data["items"])
+        cursor = data["next_cursor"]
+    assert seen == expected
+
+
+def test_quote_order(client, db_session, test_product):
+    discounted = Product(
+        product_name="Quote Product",
+        description="Product with quantity discounts",
+        price=120.00,
+        stock_quantity=50,
+        unit="piece"
+    )
+    db_session.add(discounted)
+    db_session.flush()
+    db_session.add_all([
+        ProductDiscount(product_id=discounted.product_id, quantity=2, price=200),
+        ProductDiscount(product_id=discounted.product_id, quantity=5, price=450),
+    ])
+    db_session.commit()
+    set_product_id = test_product.product_id
+    discounted_id = discounted.product_id
+
+    quote_request = {"items": [
+        {"product_id": set_product_id, "quantity": 2},
+        {"product_id": discounted_id, "quantity": 7},
+    ]}
+    response, query_count = _count_queries(db_session, lambda: client.post("/orders/quote", json=quote_request))
+    assert response.status_code == 200
+    data = response.json()
+    # 一次查詢商品、一次查詢折扣
+    assert query_count == 2
+
+    assert data["items"][0] == {
+        "product_id": set_product_id, "quantity": 2,
+        "price": 180.0, "originalPrice": 180.0, "savedAmount": 0.0
+    }
+    # 7 個：買 5 個折扣 450 + 2 個原價 240
+    assert data["items"][1]["price"] == 690.0
+    assert data["items"][1]["savedAmount"] == 150.0
+    assert data["totalPrice"] == 870.0
+    assert data["totalOriginalPrice"] == 1020.0
+    assert data["totalSavedAmount"] == 150.0
+
+    response = client.post("/orders/quote", json={"items": [{"product_id": 99999, "quantity": 1}]})
+    assert response.status_code == 404
+    assert "Product 99999 not found" in response.json()["detail"]
+
+
+def test_flash_sale_orders_reserve_from_counter(client, db_session, test_customer, test_product, test_schedule):
+    from app.product.flash import flash_stock, flush_flash_stock
+
+    product_id = test_product.product_id
+    customer_id = test_customer.line_id
+    schedule_id = test_schedule.schedule_id
+    scarce = Product(product_name="Scarce Product", description="", price=10, stock_quantity=0, unit="piece")
+    db_session.add(scarce)
+    db_session.commit()
+    scarce_id = scarce.product_id
+
+    response = client.post(f"/products/{product_id}/flash")
+    assert response.status_code == 200
+    assert (response.json()["available"], response.json()["stock_quantity"]) == (50, 0)
+    # 庫存整批移入計數器，products 不再持有同一批數量
+    db_session.expire_all()
+    assert db_session.get(Product, product_id).stock_quantity == 0
+
+    def order(details):
+        return client.post("/orders/", json={
+            "line_id": customer_id,
+            "schedule_id": schedule_id,
+            "payment_method": "cash",
+            "order_details": [
+                {"product_id": pid, "quantity": qty, "unit_price": 90.0, "subtotal": 90.0 * qty}
+                for pid, qty in details
+            ],
+        })
+
+    # 2 組 = 10 個，只扣快閃計數，不動 products 的列
+    assert order([(product_id, 2)]).status_code == 200
+    assert flash_stock.available(product_id) == 40
+    db_session.expire_all()
+    assert db_session.get(Product, product_id).stock_quantity == 0
+    # 商品頁與目錄顯示計數器中的剩餘數量
+    assert client.get(f"/products/{product_id}").json()["stock_quantity"] == 40
+    snapshot = client.get("/products/snapshot", headers={"Accept-Encoding": "identity"}).json()
+    assert [p["stock_quantity"] for p in snapshot if p["product_id"] == product_id] == [40]
+
+    # 另一項商品庫存不足時整筆回滾，快閃計數也要補回
+    response = order([(product_id, 1), (scarce_id, 1)])
+    assert response.status_code == 400
+    assert flash_stock.available(product_id) == 40
+
+    # 超過快閃計數的訂單被拒絕
+    response = order([(product_id, 9)])
+    assert response.status_code == 400
+    assert "Available: 40" in response.json()["detail"]
+
+    # 沒有需要寫回的數量；再次啟用只移入之後補進 products 的庫存
+    assert flush_flash_stock(db_session) == {}
+    db_session.get(Product, product_id).stock_quantity = 5
+    db_session.commit()
+    assert client.post(f"/products/{product_id}/flash").json()["available"] == 45
+
+    assert order([(product_id, 1)]).status_code == 200
+    response = client.delete(f"/products/{product_id}/flash")
+    assert response.status_code == 200
+    assert response.json()["stock_quantity"] == 40
+    assert flash_stock.available(product_id) is None
+
+
+def test_create_order_idempotency_key(client, db_session, test_customer, test_product, test_schedule):
+    from datetime import timedelta
+    from app.order.models import OrderIdempotencyKey
+
+    product_id = test_product.product_id
+    order_data = {
+        "line_id": test_customer.line_id,
+        "schedule_id": test_schedule.schedule_id,
+        "payment_method": "cash",
+        "order_details": [{"product_id": product_id, "quantity": 1, "unit_price": 90.0, "subtotal": 90.0}],
+    }
+    headers = {"Idempotency-Key": "liff-retry-1"}
+
+    first = client.post("/orders/", json=order_data, headers=headers)
+    assert first.status_code == 200
+    replay = client.post("/orders/", json=order_data, headers=headers)
+    assert replay.status_code == 200
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.json()["order_id"] == first.json()["order_id"]
+
+    # 重送不會再扣庫存或建立明細
+    db_session.expire_all()
+    assert db_session.get(Product, product_id).stock_quantity == 45
+    assert db_session.query(Order).count() == 1
+    assert db_session.query(OrderDetail).count() == 1
+
+    # 同一把 key 用於不同內容的請求
+    order_data["order_details"][0]["quantity"] = 2
+    assert client.post("/orders/", json=order_data, headers=headers).status_code == 422
+
+    # 過期的 key 可以批次清除
+    record = db_session.query(OrderIdempotencyKey).one()
+    record.create_time -= timedelta(days=2)
+    db_session.commit()
+    response = client.delete("/orders/idempotency-keys/expired")
+    assert response.json() == {"deleted": 1}
+    assert db_session.query(OrderIdempotencyKey).count() == 0
+
+
+def test_create_order_query_count_is_flat(client, db_session, test_customer, test_schedule):
+    products = []
+    for i in range(12):
+        product = Product(product_name=f"Cart Product {i}", description="", price=10, stock_quantity=100, unit="piece")
+        product.discounts = [ProductDiscount(quantity=3, price=25)]
+        products.append(product)
+    db_session.add_all(products)
+    db_session.commit()
+    product_ids = [p.product_id for p in products]
+    customer_id = test_customer.line_id
+    schedule_id = test_schedule.schedule_id
+
+    def order(ids):
+        response = client.post("/orders/", json={
+            "line_id": customer_id,
+            "schedule_id": schedule_id,
+            "payment_method": "cash",
+            "order_details": [
+                {"product_id": pid, "quantity": 3, "unit_price": 25.0, "subtotal": 25.0} for pid in ids
+            ],
+        })
+        assert response.status_code == 200
+        return response
+
+    small = order(product_ids[:2])
+    large = order(product_ids)
+    assert len(large.json()["order_details"]) == 12
+    assert all(d["discount_id"] is not None for d in large.json()["order_details"])
+
+    # 只有預留庫存隨商品數增加，載入商品、折扣與寫入明細都是固定次數
+    small_count = int(small.headers["X-Query-Count"])
+    large_count = int(large.headers["X-Query-Count"])
+    assert large_count - small_count <= len(product_ids) - 2
+
+
+def test_bulk_order_transitions(client, db_session, test_customer, test_product, test_schedule):
+    _add_orders(db_session, test_customer, test_schedule, [test_product], 4)
+    order_ids = [o.order_id for o in db_session.query(Order).order_by(Order.order_id)]
+    schedule_id = test_schedule.schedule_id
+    db_session.get(Order, order_ids[0]).order_status = "pending"
+    db_session.commit()
+
+    # 依取貨時段與目前狀態篩選：只有已付款的三筆會移到可取貨
+    response = client.post("/orders/bulk/status", json={
+        "schedule_id": schedule_id,
+        "current_status": "paid",
+        "order_status": "ready_for_pickup",
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["updated"] == 3
+    assert [r["order_id"] for r in data["results"]] == order_ids[1:]
+
+    response = client.post("/orders/bulk/status", json={
+        "order_ids": order_ids[1:3] + [999999],
+        "order_status": "ready_for_pickup",
+    })
+    results = {r["order_id"]: r["result"] for r in response.json()["results"]}
+    assert results == {order_ids[1]: "unchanged", order_ids[2]: "unchanged", 999999: "not_matched"}
+
+    response = client.post("/orders/bulk/payment", json={"order_ids": order_ids, "payment_status": "paid"})
+    assert response.json()["updated"] == 4
+
+    db_session.expire_all()
+    statuses = [(o.order_status, o.payment_status) for o in db_session.query(Order).order_by(Order.order_id)]
+    assert statuses == [("pending", "paid")] + [("ready_for_pickup", "paid")] * 3
+
+    assert client.post("/orders/bulk/status", json={"order_ids": order_ids, "order_status": "shipped"}).status_code == 400
+    assert client.post("/orders/bulk/status", json={"order_status": "completed"}).status_code == 400
+
+
+def test_bulk_finish_details(client, db_session, test_customer, test_product, test_schedule):
+    second_product = Product(product_name="Second Product", description="", price=10, stock_quantity=10, unit="piece")
+    db_session.add(second_product)
+    db_session.commit()
+    _add_orders(db_session, test_customer, test_schedule, [test_product, second_product], 2)
+    first_id, second_id = [o.order_id for o in db_session.query(Order).order_by(Order.order_id)]
+    schedule_id = test_schedule.schedule_id
+
+    # 先領取第一筆訂單的一項商品
+    detail = db_session.query(OrderDetail).filter(OrderDetail.order_id == first_id).first()
+    response = client.put(f"/orders/{first_id}/details/{detail.order_detail_id}/finish?is_finish=true")
+    assert response.status_code == 200
+
+    response = client.post("/orders/bulk/finish", json={"order_id": second_id, "auto_advance": True})
+    assert response.json() == {
+        "orders_matched": 1, "details_updated": 2, "orders_completed": 1, "orders_partial_completed": 0
+    }
+
+    # 取消領取；未開啟 auto_advance 時不動訂單狀態
+    response = client.post("/orders/bulk/finish", json={"order_id": second_id, "is_finish": False})
+    assert response.json()["details_updated"] == 2
+
+    response = client.post("/orders/bulk/finish", json={"schedule_id": schedule_id, "auto_advance": True})
+    assert response.json()["details_updated"] == 3
+    db_session.expire_all()
+    assert {o.order_status for o in db_session.query(Order)} == {"completed"}
+    assert db_session.query(OrderDetail).filter(OrderDetail.is_finish.is_(False)).count() == 0
+
+    assert client.post("/orders/bulk/finish", json={"is_finish": True}).status_code == 400
+
+
+def test_get_order_query_count_is_flat(client, db_session, test_customer, test_schedule):
+    from app.photo.models import ProductPhoto
+    from app.product.cache import discount_ladders
+
+    products = []
+    for i in range(10):
+        product = Product(product_name=f"Photo Product {i}", description="", price=10, stock_quantity=100, unit="piece")
+        product.discounts = [ProductDiscount(quantity=2, price=15)]
+        product.photos = [
+            ProductPhoto(file_path=f"/static/{i}-a.jpg", image_hash=f"hash-{i}-a"),
+            ProductPhoto(file_path=f"/static/{i}-b.jpg", image_hash=f"hash-{i}-b"),
+        ]
+        products.append(product)
+    db_session.add_all(products)
+    db_session.commit()
+
+    _add_orders(db_session, test_customer, test_schedule, products[:1], 1)
+    _add_orders(db_session, test_customer, test_schedule, products, 1)
+    small_id, large_id = [o.order_id for o in db_session.query(Order).order_by(Order.order_id)]
+
+    small = client.get(f"/orders/{small_id}")
+    discount_ladders.clear()
+    large = client.get(f"/orders/{large_id}")
+    assert small.status_code == 200 and large.status_code == 200
+    assert large.headers["X-Query-Count"] == small.headers["X-Query-Count"]
+
+    details = large.json()["order_details"]
+    assert len(details) == 10
+    assert details[3]["product_photo_path"] == "/static/3-a.jpg"
+    # 數量 3：一組折扣 (2 個 15 元) + 1 個原價
+    assert details[3]["current_price"] == 25
+    assert details[3]["saved_amount"] == 5
+
+
+def test_orders_by_product_simple_and_rollup(client, db_session, test_customer, test_product, test_schedule):
+    other_location = PickupLocation(district="Other District", name="Other Location", address="Other Address")
+    db_session.add(other_location)
+    db_session.flush()
+    other_schedule = Schedule(
+        date=datetime.now().date(),
+        location_id=other_location.location_id,
+        pickup_start_time=datetime.now().time(),
+        pickup_end_time=datetime.now().time(),
+        status="ACTIVE"
+    )
+    side_product = Product(product_name="Side Product", description="", price=10, stock_quantity=10, unit="bag")
+    db_session.add_all([other_schedule, side_product])
+    db_session.commit()
+
+    _add_orders(db_session, test_customer, test_schedule, [test_product, side_product], 2)
+    _add_orders(db_session, test_customer, other_schedule, [test_product], 1)
+    _add_orders(db_session, test_customer, other_schedule, [side_product], 1)
+    cancelled = db_session.query(Order).order_by(Order.order_id.desc()).offset(1).first()
+    cancelled.order_status = "cancelled"
+    db_session.commit()
+    product_id = test_product.product_id
+    location_name = test_schedule.location.name
+
+    response = client.get(f"/orders/by-product/{product_id}/simple")
+    assert response.status_code == 200
+    assert response.headers["X-Query-Count"] == "1"
+    rows = response.json()
+    assert len(rows) == 3
+    assert rows[0]["訂購人"] == "Test Customer"
+    assert rows[0]["取貨地點"] == location_name
+    assert [item["product_name"] for item in rows[0]["訂購項目"]] == ["Test Product", "Side Product"]
+    assert rows[2]["取貨地點"] == "Other Location"
+
+    rollup = client.get(f"/orders/by-product/{product_id}/rollup").json()
+    assert rollup["total_quantity"] == 6
+    assert rollup["order_count"] == 2
+    assert [(l["location_name"], l["quantity"]) for l in rollup["by_location"]] == [(location_name, 6)]
+    assert rollup["by_schedule"][0]["schedule_id"] == test_schedule.schedule_id
+
+
+def test_product_sales_summary_tracks_order_writes(client, db_session, test_customer, test_product, test_schedule):
+    from app.order.models import ProductSalesDelta, ProductSalesSummary
+    from app.order.sales_summary import flush_sales_deltas
+
+    side_product = Product(product_name="Summary Side", description="", price=10, stock_quantity=100, unit="piece")
+    db_session.add(side_product)
+    db_session.commit()
+    product_id, side_id = test_product.product_id, side_product.product_id
+    customer_id, schedule_id = test_customer.line_id, test_schedule.schedule_id
+
+    def create(details):
+        response = client.post("/orders/", json={
+            "line_id": customer_id,
+            "schedule_id": schedule_id,
+            "payment_method": "cash",
+            "order_details": [
+                {"product_id": pid, "quantity": qty, "unit_price": 10.0, "subtotal": 10.0 * qty} for pid, qty in details
+            ],
+        })
+        assert response.status_code == 200
+        return response.json()
+
+    first = create([(product_id, 2), (side_id, 3)])
+    second = create([(product_id, 1)])
+    third = create([(side_id, 4)])
+
+    detail_id = first["order_details"][1]["order_detail_id"]
+    client.put(f"/orders/{first['order_id']}/details/{detail_id}", json={
+        "product_id": side_id, "quantity": 5, "unit_price": 10.0, "subtotal": 50.0
+    })
+    client.post(f"/orders/{second['order_id']}/details", json={
+        "product_id": side_id, "quantity": 1, "unit_price": 10.0, "subtotal": 10.0
+    })
+    client.patch(f"/orders/{first['order_id']}/status", json={"order_status": "paid"})
+    client.post("/orders/bulk/status", json={"order_ids": [second["order_id"]], "order_status": "ready_for_pickup"})
+    client.post("/orders/bulk/finish", json={"order_id": second["order_id"], "auto_advance": True})
+    client.delete(f"/orders/{third['order_id']}")
+
+    def summary():
+        return {
+            (row["product_id"], row["order_status"]): (row["quantity"], row["subtotal"], row["line_count"])
+            for row in client.get("/orders/sales-summary").json()
+        }
+
+    expected = {
+        (product_id, "paid"): (2, 20.0, 1),
+        (side_id, "paid"): (5, 50.0, 1),
+        (product_id, "completed"): (1, 10.0, 1),
+        (side_id, "completed"): (1, 10.0, 1),
+    }
+    # 訂單交易只新增異動列，讀取時一併加總尚未併入的異動
+    assert db_session.query(ProductSalesSummary).count() == 0
+    assert summary() == expected
+    queued = db_session.query(ProductSalesDelta).count()
+    assert queued > 4
+    assert flush_sales_deltas(db_session, batch_size=4) == queued
+    assert db_session.query(ProductSalesDelta).count() == 0
+    assert summary() == expected
+    assert client.post("/orders/sales-summary/rebuild").json() == {"drift": []}
+
+    # 繞過 API 直接改資料後，重建會回報並修正偏差
+    db_session.query(ProductSalesSummary).filter(ProductSalesSummary.product_id == side_id).delete()
+    db_session.commit()
+    drift = client.post("/orders/sales-summary/rebuild").json()["drift"]
+    assert [(d["product_id"], d["order_status"]) for d in drift] == [(side_id, "completed"), (side_id, "paid")]
+    assert len(client.get(f"/orders/sales-summary?product_id={side_id}").json()) == 2
+
+    # 尚未併入的異動計入目前值，並由重建一併處理
+    assert client.delete(f"/orders/{first['order_id']}").status_code == 200
+    assert db_session.query(ProductSalesDelta).count() > 0
+    assert client.post("/orders/sales-summary/rebuild").json() == {"drift": []}
+    assert db_session.query(ProductSalesDelta).count() == 0
+    assert (product_id, "paid") not in {
+        (row["product_id"], row["order_status"]) for row in client.get("/orders/sales-summary").json()
+    }
+
+
+def test_pickup_manifest_is_cached_until_orders_change(client, db_session, test_customer, test_product, test_schedule):
+    from app.order.manifest import pickup_manifests
+
+    other = Customer(line_id="another_line_id", name="Another Customer", line_name="Another", line_pic_url="")
+    db_session.add(other)
+    db_session.commit()
+    _add_orders(db_session, test_customer, test_schedule, [test_product], 2)
+    _add_orders(db_session, other, test_schedule, [test_product], 1)
+    schedule_id = test_schedule.schedule_id
+    first_order_id = db_session.query(Order).order_by(Order.order_id).first().order_id
+
+    manifest = client.get(f"/orders/manifest/{schedule_id}").json()
+    assert [c["name"] for c in manifest["customers"]] == ["Another Customer", "Test Customer"]
+    customer = manifest["customers"][1]
+    assert [o["order_id"] for o in customer["orders"]][0] == first_order_id
+    item = customer["orders"][0]["items"][0]
+    assert item["unit"] == "組(每組5piece)"
+    assert item["is_finish"] is False
+    assert (customer["finished_items"], customer["total_items"]) == (0, 2)
+
+    cached = client.get(f"/orders/manifest/{schedule_id}")
+    assert cached.json() == manifest
+    assert pickup_manifests.hits == 1
+
+    client.post("/orders/bulk/finish", json={"order_id": first_order_id})
+    manifest = client.get(f"/orders/manifest/{schedule_id}").json()
+    assert manifest["customers"][1]["orders"][0]["items"][0]["is_finish"] is True
+    assert manifest["customers"][1]["finished_items"] == 1
+
+    client.patch(f"/orders/{first_order_id}/status", json={"order_status": "cancelled"})
+    manifest = client.get(f"/orders/manifest/{schedule_id}").json()
+    assert manifest["order_count"] == 2
+    assert pickup_manifests.hits == 1
+
+    # 單筆明細的領取狀態變動也會讓快取失效
+    second_order = manifest["customers"][1]["orders"][0]
+    detail_id = second_order["items"][0]["order_detail_id"]
+    client.put(f"/orders/{second_order['order_id']}/details/{detail_id}/finish?is_finish=true")
+    manifest = client.get(f"/orders/manifest/{schedule_id}").json()
+    assert manifest["customers"][1]["orders"][0]["items"][0]["is_finish"] is True
+
+    assert client.get("/orders/manifest/999999").status_code == 404
+
+
+def test_check_order_totals_reports_then_repairs(client, db_session, test_customer, test_product, test_schedule):
+    _add_orders(db_session, test_customer, test_schedule, [test_product], 3)
+    orders = db_session.query(Order).order_by(Order.order_id).all()
+    orders[1].total_amount = 300
+    db_session.commit()
+    mismatched = [orders[0].order_id, orders[2].order_id]
+
+    # 預設只回報，不修改
+    response = client.post("/orders/totals/check?batch_size=2")
+    assert [m["order_id"] for m in response.json()["mismatches"]] == mismatched
+    db_session.expire_all()
+    assert float(db_session.get(Order, mismatched[0]).total_amount) == 0
+
+    response = client.post("/orders/totals/check?repair=true&batch_size=2")
+    assert response.json()["repaired"] is True
+    db_session.expire_all()
+    assert {float(o.total_amount) for o in db_session.query(Order)} == {300.0}
+    assert client.post("/orders/totals/check").json()["mismatches"] == []
+
+
+def test_order_events_outbox_dispatch(client, db_session, test_customer, test_product, test_schedule):
+    from datetime import date, timedelta
+    from app.linebot_usage.models import LineBotUsage
+    from app.order.events import OrderEventSender, StubSender, dispatch_pending
+    from app.order.models import OrderEvent
+
+    with pytest.raises(TypeError):
+        OrderEventSender()
+
+    product_id, schedule_id = test_product.product_id, test_schedule.schedule_id
+    response = client.post("/orders/", json={
+        "line_id": test_customer.line_id,
+        "schedule_id": schedule_id,
+        "payment_method": "cash",
+        "order_details": [{"product_id": product_id, "quantity": 1, "unit_price": 90.0, "subtotal": 90.0}],
+    })
+    order_id = response.json()["order_id"]
+    client.patch(f"/orders/{order_id}/status", json={"order_status": "paid"})
+    client.patch(f"/orders/{order_id}/payment", json={"payment_status": "paid"})
+    client.post("/orders/bulk/status", json={"order_ids": [order_id], "order_status": "ready_for_pickup"})
+    # 庫存不足而回滾的訂單不會留下事件
+    client.post("/orders/", json={
+        "line_id": "admin_test_id",
+        "schedule_id": schedule_id,
+        "order_details": [{"product_id": product_id, "quantity": 100, "unit_price": 1.0, "subtotal": 1.0}],
+    })
+
+    events = db_session.query(OrderEvent).order_by(OrderEvent.event_id).all()
+    assert [e.event_type for e in events] == [
+        "order_created", "order_status_changed", "payment_status_changed", "order_status_changed"
+    ]
+
+    sender = StubSender(fail_times=1)
+    assert dispatch_pending(db_session, sender) == {"sent": 3, "retried": 1, "failed": 0}
+    assert [e["event_type"] for e in sender.sent] == ["order_status_changed", "payment_status_changed", "order_status_changed"]
+    assert sender.sent[2] == {
+        "event_type": "order_status_changed", "line_id": "admin_test_id", "order_id": order_id,
+        "order_status": "ready_for_pickup", "previous": "paid",
+    }
+
+    # 失敗的事件在退避時間到之前不會重送
+    assert dispatch_pending(db_session, sender) == {"sent": 0, "retried": 0, "failed": 0}
+    retry = db_session.query(OrderEvent).filter(OrderEvent.status == "pending").one()
+    assert retry.attempts == 1
+    retry.next_attempt_at -= timedelta(minutes=1)
+    db_session.commit()
+    assert dispatch_pending(db_session, sender)["sent"] == 1
+
+    assert db_session.query(LineBotUsage).filter(LineBotUsage.date == date.today()).one().push_count == 4
+
+
+def test_order_reads_support_conditional_get(client, db_session, test_customer, test_product, test_schedule):
+    _add_orders(db_session, test_customer, test_schedule, [test_product], 2)
+    order_id = db_session.query(Order).order_by(Order.order_id).first().order_id
+    line_id = test_customer.line_id
+
+    response = client.get(f"/orders/{order_id}")
+    etag = response.headers["ETag"]
+    not_modified = client.get(f"/orders/{order_id}", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    # 驗證、revision 查詢之外不再有其他查詢
+    assert int(not_modified.headers["X-Query-Count"]) < int(response.headers["X-Query-Count"])
+
+    listing = client.get(f"/orders/customer/{line_id}")
+    list_etag = listing.headers["ETag"]
+    assert client.get(f"/orders/customer/{line_id}", headers={"If-None-Match": f'W/{list_etag}'}).status_code == 304
+
+    # 明細變動會遞增 revision，兩個 ETag 都會改變
+    detail_id = response.json()["order_details"][0]["order_detail_id"]
+    client.put(f"/orders/{order_id}/details/{detail_id}/finish?is_finish=true")
+    changed = client.get(f"/orders/{order_id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert client.get(f"/orders/customer/{line_id}", headers={"If-None-Match": list_etag}).status_code == 200
+
+    assert client.get("/orders/999999", headers={"If-None-Match": etag}).status_code == 404
+
+
+def test_archive_moves_old_finished_orders(client, db_session, test_customer, test_product, test_schedule):
+    from datetime import timedelta
+    from app.order.models import OrderArchive, OrderDetailArchive
+
+    product_id, customer_id, schedule_id = test_product.product_id, test_customer.line_id, test_schedule.schedule_id
+    order_ids = []
+    for _ in range(3):
+        response = client.post("/orders/", json={
+            "line_id": customer_id,
+            "schedule_id": schedule_id,
+            "payment_method": "cash",
+            "order_details": [{"product_id": product_id, "quantity": 2, "unit_price": 10.0, "subtotal": 20.0}],
+        })
+        order_ids.append(response.json()["order_id"])
+    old_completed, old_paid, recent_completed = order_ids
+    for order_id in (old_completed, recent_completed):
+        client.patch(f"/orders/{order_id}/status", json={"order_status": "completed"})
+    db_session.query(Order).filter(Order.order_id.in_([old_completed, old_paid]))\
+        .update({Order.order_date: datetime.utcnow() - timedelta(days=400)}, synchronize_session=False)
+    db_session.commit()
+
+    assert client.post("/orders/archive/run?older_than_days=180").json() == {"archived": 1}
+    db_session.expire_all()
+    assert db_session.get(Order, old_completed) is None
+    assert db_session.get(OrderArchive, old_completed).order_status == "completed"
+    assert db_session.query(OrderDetailArchive).filter(OrderDetailArchive.order_id == old_completed).count() == 1
+
+    hot_rows = client.get("/orders/list/all").json()
+    assert {row["訂單編號"] for row in hot_rows} == {old_paid, recent_completed}
+    all_rows = client.get("/orders/list/all?include_archived=true").json()
+    assert [row["訂單編號"] for row in all_rows if row["訂單編號"] == old_completed] == [old_completed]
+
+    assert [o["order_id"] for o in client.get(f"/orders/customer/{customer_id}").json()] == [old_paid, recent_completed]
+    customer_orders = client.get(f"/orders/customer/{customer_id}?include_archived=true")
+    assert [o["order_id"] for o in customer_orders.json()] == order_ids
+    archived_order = customer_orders.json()[0]
+    assert archived_order["order_status"] == "completed"
+    assert [(d["product_id"], d["quantity"], d["product"]["product_id"]) for d in archived_order["order_details"]] == [
+        (product_id, 2, product_id)
+    ]
+    assert customer_orders.headers["ETag"] != client.get(f"/orders/customer/{customer_id}").headers["ETag"]
+
+    simple = client.get(f"/orders/by-product/{product_id}/simple?include_archived=true").json()
+    assert [row["訂單編號"] for row in simple] == order_ids
+    assert client.get(f"/orders/by-product/{product_id}/rollup").json()["total_quantity"] == 4
+    rollup = client.get(f"/orders/by-product/{product_id}/rollup?include_archived=true").json()
+    assert rollup["total_quantity"] == 6
+    assert len(rollup["by_schedule"]) == 1
+
+    # 封存不影響銷售彙總，重建時會一併計入封存明細
+    assert client.post("/orders/sales-summary/rebuild").json() == {"drift": []}
+
+
+def test_checkout_keeps_catalog_caches(client, db_session, test_customer, test_product, test_schedule):
+    from app.product.snapshot import catalog_snapshot
+
+    product_id, customer_id, schedule_id = test_product.product_id, test_customer.line_id, test_schedule.schedule_id
+    client.get("/products/")
+    version = catalog_snapshot.version
+
+    # 未賣完的下單與狀態更新不會讓商品列表快取失效
+    response = client.post("/orders/", json={
+        "line_id": customer_id,
+        "schedule_id": schedule_id,
+        "payment_method": "cash",
+        "order_details": [{"product_id": product_id, "quantity": 1, "unit_price": 90.0, "subtotal": 90.0}],
+    })
+    assert response.status_code == 200
+    client.patch(f"/orders/{response.json()['order_id']}/status", json={"order_status": "paid"})
+    assert client.get("/products/").headers["X-Query-Count"] == "0"
+    assert catalog_snapshot.version == version
+
+
+def test_update_order_detail_moves_stock_between_products(client, db_session, test_customer, test_product, test_schedule):
+    plain = Product(product_name="Plain Swap Product", description="", price=10, stock_quantity=10, unit="piece")
+    db_session.add(plain)
+    db_session.commit()
+    product_id, plain_id = test_product.product_id, plain.product_id
+    customer_id, schedule_id = test_customer.line_id, test_schedule.schedule_id
+
+    order = client.post("/orders/", json={
+        "line_id": customer_id,
+        "schedule_id": schedule_id,
+        "payment_method": "cash",
+        "order_details": [{"product_id": product_id, "quantity": 2, "unit_price": 90.0, "subtotal": 180.0}],
+    }).json()
+    order_id, detail_id = order["order_id"], order["order_details"][0]["order_detail_id"]
+
+    def stocks():
+        db_session.expire_all()
+        return db_session.get(Product, product_id).stock_quantity, db_session.get(Product, plain_id).stock_quantity
+
+    assert stocks() == (40, 10)
+
+    # 換商品：舊商品歸還 2 組（10 個），新商品預留全部數量
+    response = client.put(f"/orders/{order_id}/details/{detail_id}", json={
+        "product_id": plain_id, "quantity": 3, "unit_price": 10.0, "subtotal": 30.0
+    })
+    assert response.status_code == 200
+    assert stocks() == (50, 7)
+
+    # 庫存不足時整筆回滾
+    response = client.put(f"/orders/{order_id}/details/{detail_id}", json={
+        "product_id": plain_id, "quantity": 20, "unit_price": 10.0, "subtotal": 200.0
+    })
+    assert response.status_code == 400
+    assert stocks() == (50, 7)
+
+    response = client.put(f"/orders/{order_id}/details/{detail_id}", json={
+        "product_id": product_id, "quantity": 1, "unit_price": 90.0, "subtotal": 90.0
+    })
+    assert response.status_code == 200
+    assert stocks() == (45, 10)
@@ -152,6 +152,264 @@ def test_delete_product(client):
     assert get_response.status_code == 404
 
 
+def test_list_products_is_eager_loaded_and_cached(client, db_session):
+    from app.product.catalog import product_pages
+    from app.product.stock import reserve_stock
+
+    category_id = client.post("/categories/", json={"category_name": "Listing Category"}).json()["category_id"]
+    product_ids = []
+    for i in range(5):
+        response = client.post("/products/", json={
+            "product_name": f"Listing Product {i}",
+            "description": "",
+            "price": 100,
+            "one_set_price": 0,
+            "one_set_quantity": 0,
+            "stock_quantity": 10,
+            "unit": "個",
+            "category_ids": [category_id]
+        })
+        product_ids.append(response.json()["product_id"])
+        client.post(f"/products/{product_ids[-1]}/discounts", json={"quantity": 2, "price": 150})
+
+    # 商品一次查詢，類別、照片、折扣各一次 selectin 查詢，與商品數量無關
+    response = client.get("/products/")
+    assert response.headers["X-Query-Count"] == "4"
+    data = response.json()
+    assert [p["product_id"] for p in data] == product_ids
+    assert data[0]["categories"][0]["category_name"] == "Listing Category"
+    assert data[0]["discounts"][0]["price"] == 150
+
+    cached = client.get("/products/")
+    assert cached.headers["X-Query-Count"] == "0"
+    assert cached.json() == data
+    assert product_pages.stats()["hits"] == 1
+
+    client.put(f"/products/{product_ids[0]}/discounts", json=[{"quantity": 3, "price": 200}])
+    assert client.get("/products/").json()[0]["discounts"][0]["quantity"] == 3
+
+    # 一般扣庫存不清除快取；賣完（離開有庫存狀態）時才清除
+    assert reserve_stock(db_session, product_ids[1], 4) is True
+    db_session.commit()
+    cached = client.get("/products/")
+    assert cached.headers["X-Query-Count"] == "0"
+    assert cached.json()[1]["stock_quantity"] == 10
+    assert reserve_stock(db_session, product_ids[1], 6) is True
+    db_session.commit()
+    assert client.get("/products/").json()[1]["stock_quantity"] == 0
+    assert len(client.get(f"/products/?category_id={category_id}&limit=2").json()) == 2
+
+
+def test_catalog_snapshot_etag_and_gzip(client, db_session):
+    from app.photo.models import ProductPhoto
+
+    category_id = client.post("/categories/", json={"category_name": "Snapshot Category"}).json()["category_id"]
+    ids = []
+    for name, stock in (("Snapshot A", 5), ("Snapshot Sold Out", 0)):
+        ids.append(client.post("/products/", json={
+            "product_name": name, "description": "", "price": 100, "one_set_price": 0,
+            "one_set_quantity": 0, "stock_quantity": stock, "unit": "個", "category_ids": [category_id]
+        }).json()["product_id"])
+    client.post(f"/products/{ids[0]}/discounts", json={"quantity": 3, "price": 250})
+    client.post(f"/products/{ids[0]}/discounts", json={"quantity": 2, "price": 180})
+    db_session.add_all([
+        ProductPhoto(product_id=ids[0], file_path="second.jpg", image_hash="b"),
+        ProductPhoto(product_id=ids[0], file_path="third.jpg", image_hash="c"),
+    ])
+    db_session.commit()
+
+    response = client.get("/products/snapshot", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    etag = response.headers["ETag"]
+    data = response.json()
+    assert [p["product_id"] for p in data] == [ids[0]]
+    assert data[0]["photo"] == "second.jpg"
+    assert data[0]["categories"] == [{"category_id": category_id, "category_name": "Snapshot Category"}]
+    assert data[0]["discounts"] == [{"quantity": 2, "price": 180.0}, {"quantity": 3, "price": 250.0}]
+
+    assert etag.endswith('-gz"')
+
+    # 未變更時回 304，不查詢資料庫；gzip 與未壓縮的表示各有自己的 ETag
+    unchanged = client.get("/products/snapshot", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert unchanged.status_code == 304
+    assert unchanged.headers["X-Query-Count"] == "0"
+    identity = client.get("/products/snapshot", headers={"If-None-Match": etag, "Accept-Encoding": "identity"})
+    assert identity.status_code == 200
+    assert identity.headers["ETag"] == etag.replace('-gz"', '"')
+
+    client.put(f"/products/{ids[1]}", json={
+        "product_name": "Snapshot Sold Out", "description": "", "price": 100, "one_set_price": 0,
+        "one_set_quantity": 0, "stock_quantity": 7, "unit": "個"
+    })
+    changed = client.get("/products/snapshot", headers={"If-None-Match": etag, "Accept-Encoding": "identity"})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert "Content-Encoding" not in changed.headers
+    assert [p["product_id"] for p in changed.json()] == ids
+
+
+def _search_ids(client, q):
+    response = client.get("/products/search", params={"q": q})
+    assert response.status_code == 200
+    return [p["product_id"] for p in response.json()]
+
+
+def test_search_products(client):
+    category_id = client.post("/categories/", json={"category_name": "有機水果"}).json()["category_id"]
+
+    def create(name, description, category_ids=None):
+        return client.post("/products/", json={
+            "product_name": name, "description": description, "price": 100, "one_set_price": 0,
+            "one_set_quantity": 0, "stock_quantity": 5, "unit": "個", "category_ids": category_ids
+        }).json()["product_id"]
+
+    juice = create("蘋果汁", "100% 純果汁")
+    apple = create("富士蘋果", "Fuji apple from Aomori", [category_id])
+    tea = create("烏龍茶", "搭配蘋果派")
+
+    # 名稱符合者排在只有描述符合者之前
+    ranked = _search_ids(client, "蘋果")
+    assert set(ranked[:2]) == {juice, apple} and ranked[2] == tea
+    assert _search_ids(client, "蘋果汁") == [juice]
+    assert _search_ids(client, "APPLE") == [apple]
+    assert _search_ids(client, "有機") == [apple]
+    assert _search_ids(client, "茶") == [tea]
+    assert _search_ids(client, "and") == []
+
+    client.put(f"/products/{tea}", json={
+        "product_name": "烏龍茶", "description": "無糖", "price": 100, "one_set_price": 0,
+        "one_set_quantity": 0, "stock_quantity": 5, "unit": "個"
+    })
+    assert tea not in _search_ids(client, "蘋果")
+    client.delete(f"/products/{juice}")
+    assert _search_ids(client, "果汁") == []
+    client.delete(f"/categories/{category_id}")
+    assert _search_ids(client, "有機") == []
+
+
+def test_search_uses_fts_index_on_large_catalog(db_session):
+    from sqlalchemy import event, insert
+    from app.product.models import Product, ProductSearchDocument
+    from app.product.search import search_product_ids, tokenize
+
+    words = ["蘋果", "香蕉", "鳳梨", "芒果", "葡萄", "高麗菜", "地瓜", "雞蛋", "牛奶", "豆腐"]
+    rows = []
+    for i in range(5000):
+        name = f"{words[i % 10]}{words[(i // 10) % 10]} {i}"
+        rows.append({"product_id": i + 1, "product_name": name, "description": "", "price": 10, "stock_quantity": 1})
+    db_session.execute(insert(Product), rows)
+    db_session.execute(insert(ProductSearchDocument), [
+        {"product_id": row["product_id"], "name_tokens": " ".join(tokenize(row["product_name"], unigrams=True)), "body_tokens": ""}
+        for row in rows
+    ])
+    db_session.commit()
+
+    statements = []
+    connection = db_session.connection()
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(connection, "before_cursor_execute", capture)
+    try:
+        ids = search_product_ids(db_session, "芒果 牛奶")
+    finally:
+        event.remove(connection, "before_cursor_execute", capture)
+    assert len(ids) == 20
+    assert len(statements) == 1
+
+    # 以查詢計畫確認走 FTS 索引，不掃描整張文件表
+    statement, parameters = statements[0]
+    plan = " | ".join(row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+    # FTS5 的 idxStr 中 M 表示以 MATCH 條件查詢索引
+    assert "product_search_fts VIRTUAL TABLE INDEX 0:M" in plan, plan
+    assert "product_search_documents" not in plan, plan
+
+
+def test_suggest_products_by_prefix_and_recent_sales(client, db_session):
+    from app.order.models import Order, OrderDetail
+
+    def create(name):
+        return client.post("/products/", json={
+            "product_name": name, "description": "", "price": 100, "one_set_price": 0,
+            "one_set_quantity": 0, "stock_quantity": 5, "unit": "個"
+        }).json()["product_id"]
+
+    fuji = create("富士蘋果")
+    juice = create("蘋果汁")
+    banana = create("Organic Banana")
+
+    order = Order(line_id="suggest_buyer", total_amount=0, payment_method="cash", order_status="paid")
+    cancelled = Order(line_id="suggest_buyer", total_amount=0, payment_method="cash", order_status="cancelled")
+    db_session.add_all([order, cancelled])
+    db_session.flush()
+    db_session.add_all([
+        OrderDetail(order_id=order.order_id, product_id=fuji, quantity=3, unit_price=100, subtotal=300),
+        OrderDetail(order_id=cancelled.order_id, product_id=juice, quantity=9, unit_price=100, subtotal=900),
+    ])
+    db_session.commit()
+
+    def suggest(q):
+        response = client.get("/products/suggest", params={"q": q})
+        assert response.status_code == 200
+        return [(s["product_id"], s["recent_sales"]) for s in response.json()]
+
+    # 中文從任一字開始皆可比對，依近期銷量排序（取消的訂單不計）
+    assert suggest("蘋果") == [(fuji, 3), (juice, 0)]
+    assert suggest("富") == [(fuji, 3)]
+    assert suggest("ban") == [(banana, 0)]
+    assert suggest("anana") == []
+
+    # 商品異動直接更新記憶體中的索引
+    client.put(f"/products/{banana}", json={
+        "product_name": "有機香蕉", "description": "", "price": 100, "one_set_price": 0,
+        "one_set_quantity": 0, "stock_quantity": 5, "unit": "個"
+    })
+    client.delete(f"/products/{juice}")
+    kiwi = create("奇異果")
+    assert suggest("ban") == []
+    assert suggest("香蕉") == [(banana, 0)]
+    assert suggest("果") == [(fuji, 3), (kiwi, 0)]
+
+
+def test_suggest_index_keeps_writes_made_during_a_rebuild(db_session, monkeypatch):
+    import app.product.suggest as suggest_module
+    from app.product.models import Product
+    from app.product.suggest import ProductSuggestIndex
+
+    apple = Product(product_name="Apple", description="", price=10, stock_quantity=1, unit="個")
+    banana = Product(product_name="Banana", description="", price=10, stock_quantity=1, unit="個")
+    db_session.add_all([apple, banana])
+    db_session.commit()
+    apple_id, banana_id = apple.product_id, banana.product_id
+
+    index = ProductSuggestIndex()
+    index.build(db_session)
+    real_recent_sales = suggest_module.recent_sales
+
+    def recent_sales_with_concurrent_writes(db):
+        # 重建已讀出商品名稱後，其他請求改名並刪除商品
+        index.upsert(apple_id, "Avocado")
+        index.remove(banana_id)
+        return real_recent_sales(db)
+
+    monkeypatch.setattr(suggest_module, "recent_sales", recent_sales_with_concurrent_writes)
+    index.build(db_session)
+    monkeypatch.setattr(suggest_module, "recent_sales", real_recent_sales)
+    assert [s["product_id"] for s in index.suggest(db_session, "avo")] == [apple_id]
+    assert index.suggest(db_session, "app") == []
+    assert index.suggest(db_session, "ban") == []
+
+    # 有背景重建時，過期的索引照常提供，不在請求中重建
+    index.ttl_seconds = 0
+    index.background = True
+    db_session.add(Product(product_name="Apricot", description="", price=10, stock_quantity=1, unit="個"))
+    db_session.commit()
+    assert index.suggest(db_session, "apr") == []
+    index.background = False
+    assert len(index.suggest(db_session, "apr")) == 1
+
 # def test_create_original_product_discount(client):
 #     # Create a product first
 #     product_data = {
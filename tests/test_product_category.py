@@ -72,4 +72,31 @@ def test_create_product_category(client):
     assert response.status_code == 200
     data = response.json()
     assert data["product_id"] == product["product_id"]
-    assert data["category_id"] == category["category_id"]
\ No newline at end of file
+    assert data["category_id"] == category["category_id"]
+
+
+def test_get_categories_with_counts(client):
+    fruit = client.post("/categories/", json={"category_name": "Fruit"}).json()["category_id"]
+    empty = client.post("/categories/", json={"category_name": "Empty"}).json()["category_id"]
+    product_ids = []
+    for i, stock in enumerate((5, 0, 3)):
+        product_ids.append(client.post("/products/", json={
+            "product_name": f"Counted Product {i}", "description": "", "price": 100, "one_set_price": 0,
+            "one_set_quantity": 0, "stock_quantity": stock, "unit": "個", "category_ids": [fruit]
+        }).json()["product_id"])
+
+    response = client.get("/categories/?with_counts=true")
+    assert response.status_code == 200
+    assert response.headers["X-Query-Count"] == "1"
+    assert response.json() == [
+        {"category_id": fruit, "category_name": "Fruit", "product_count": 3, "in_stock_count": 2},
+        {"category_id": empty, "category_name": "Empty", "product_count": 0, "in_stock_count": 0},
+    ]
+    assert client.get("/categories/?with_counts=true").headers["X-Query-Count"] == "0"
+    assert "product_count" not in client.get("/categories/").json()[0]
+
+    # 商品或類別異動後重新計算
+    client.delete(f"/products/{product_ids[0]}/categories")
+    client.post("/products-categories/", json={"product_id": product_ids[0], "category_id": empty})
+    counts = {c["category_id"]: (c["product_count"], c["in_stock_count"]) for c in client.get("/categories/?with_counts=true").json()}
+    assert counts == {fruit: (2, 1), empty: (1, 1)}
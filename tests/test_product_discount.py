@@ -440,4 +440,31 @@ def test_update_product_discounts_skip_used_quantities(client, db_session):
     assert 5 in quantities
     assert 10 in quantities
     assert 15 not in quantities  # 應該被刪除
-    assert 20 not in quantities  # 應該被刪除
\ No newline at end of file
+    assert 20 not in quantities  # 應該被刪除
+
+
+def test_discount_writes_invalidate_ladder_cache(client, db_session):
+    from app.product.cache import discount_ladders
+
+    product_data = {
+        "product_name": "Cached Ladder Product",
+        "description": "A test product description",
+        "price": 100,
+        "one_set_price": None,
+        "one_set_quantity": None,
+        "stock_quantity": 100,
+        "unit": "個"
+    }
+    product_id = client.post("/products/", json=product_data).json()["product_id"]
+
+    assert not discount_ladders.get(db_session, product_id)
+
+    client.post(f"/products/{product_id}/discounts", json={"quantity": 2, "price": 180})
+    assert discount_ladders.get(db_session, product_id).best_tier(3) == (2, 180.0)
+
+    client.put(f"/products/{product_id}/discounts", json=[{"quantity": 2, "price": 150}, {"quantity": 5, "price": 400}])
+    assert discount_ladders.get(db_session, product_id).best_tier(6) == (5, 400.0)
+    assert discount_ladders.get(db_session, product_id).best_tier(4) == (2, 150.0)
+
+    client.delete(f"/products/{product_id}/discounts")
+    assert not discount_ladders.get(db_session, product_id)
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.db as db_module
+from app.db import Base
+from app.main import app
+from app.product.models import Product
+
+
+@pytest.fixture
+def replica_client(tmp_path, monkeypatch):
+    """Primary and replica as two SQLite files, routed through the real get_db/get_read_db"""
+    engines = {}
+    for name in ("primary", "replica"):
+        engine = create_engine(f"sqlite:///{tmp_path / name}.db", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        engines[name] = engine
+    primary = sessionmaker(autocommit=False, autoflush=False, bind=engines["primary"])
+    replica = sessionmaker(autocommit=False, autoflush=False, bind=engines["replica"])
+
+    for factory, name in ((primary, "Primary Product"), (replica, "Replica Product")):
+        db = factory()
+        db.add(Product(product_name=name, description="", price=10, stock_quantity=1, unit="piece"))
+        db.commit()
+        db.close()
+
+    monkeypatch.setattr(db_module, "engine", engines["primary"])
+    monkeypatch.setattr(db_module, "read_engine", engines["replica"])
+    monkeypatch.setattr(db_module, "SessionLocal", primary)
+    monkeypatch.setattr(db_module, "ReadSessionLocal", replica)
+    monkeypatch.setattr(db_module, "_last_writes", OrderedDict())
+    app.dependency_overrides.clear()
+    with TestClient(app) as client:
+        yield client
+    for engine in engines.values():
+        engine.dispose()
+
+
+def _product_names(client, token):
+    response = client.get("/products/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    return [p["product_name"] for p in response.json()]
+
+
+def test_read_routes_use_replica_until_client_writes(replica_client):
+    assert _product_names(replica_client, "user_a") == ["Replica Product"]
+
+    # user_a 寫入後，短時間內改讀主庫以看見自己的寫入
+    response = replica_client.post(
+        "/categories/", json={"category_name": "Fresh"}, headers={"Authorization": "Bearer user_a"}
+    )
+    assert response.status_code == 200
+    assert _product_names(replica_client, "user_a") == ["Primary Product"]
+
+    # 其他使用者仍讀 replica
+    assert _product_names(replica_client, "user_b") == ["Replica Product"]
+
+
+def test_read_your_writes_window_expires(replica_client, monkeypatch):
+    monkeypatch.setattr(db_module, "READ_YOUR_WRITES_SECONDS", 0)
+    replica_client.post("/categories/", json={"category_name": "Fresh"}, headers={"Authorization": "Bearer user_a"})
+    assert _product_names(replica_client, "user_a") == ["Replica Product"]
+
+
+def test_only_committed_changes_count_as_writes(replica_client):
+    # 沒有異動的提交不會讓使用者改讀主庫
+    db = db_module.SessionLocal()
+    db.info["client_key"] = "reader"
+    db.query(Product).all()
+    db.commit()
+    db.close()
+    assert "reader" not in db_module._last_writes
+
+    replica_client.post("/categories/", json={"category_name": "Fresh"}, headers={"Authorization": "Bearer user_a"})
+    # 以 token 的雜湊為鍵，不保留原始 Authorization 標頭
+    assert "Bearer user_a" not in db_module._last_writes
+    assert len(db_module._last_writes) == 1
+
+
+def test_last_writes_is_bounded(replica_client, monkeypatch):
+    monkeypatch.setattr(db_module, "READ_YOUR_WRITES_MAX_CLIENTS", 2)
+    for token in ("user_a", "user_b", "user_c"):
+        replica_client.post("/categories/", json={"category_name": token}, headers={"Authorization": f"Bearer {token}"})
+    assert len(db_module._last_writes) == 2
+    assert _product_names(replica_client, "user_a") == ["Replica Product"]
+    assert _product_names(replica_client, "user_c") == ["Primary Product"]
@@ -0,0 +1,175 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.auth.dependencies import get_current_user, verify_token
+from app.customer.models import Customer
+from app.db import Base, get_db, get_read_db
+from app.location.models import PickupLocation, Schedule
+from app.main import app
+from app.order.models import OrderDetail
+from app.product.models import Product
+from app.product.stock import release_stock, reserve_stock
+
+
+@pytest.fixture
+def file_session_factory(tmp_path):
+    """File-backed SQLite so several connections can write concurrently"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'stock.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+
+    # SQLite 的讀交易升級為寫交易時可能直接回報 locked；
+    # 一開始就取得寫鎖，讓併發請求排隊等待（MySQL 則由列鎖處理）
+    @event.listens_for(engine, "connect")
+    def _disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin_immediate(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def file_client(file_session_factory):
+    """Client whose requests each get their own session on the file-backed database"""
+    db = file_session_factory()
+    db.add(Customer(line_id="stock_test_id", name="Stock Tester", line_name="Stock Tester", line_pic_url="http://example.com/pic.jpg"))
+    location = PickupLocation(district="Test District", name="Test Location", address="Test Address")
+    db.add(location)
+    db.flush()
+    schedule = Schedule(
+        date=datetime.now().date(),
+        location_id=location.location_id,
+        pickup_start_time=datetime.now().time(),
+        pickup_end_time=datetime.now().time(),
+        status="ACTIVE",
+    )
+    db.add(schedule)
+    db.commit()
+    schedule_id = schedule.schedule_id
+    db.close()
+
+    def override_get_db():
+        session = file_session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def override_get_current_user(session: Session = Depends(get_db)):
+        return session.get(Customer, "stock_test_id")
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_current_user] = override_get_current_user
+    app.dependency_overrides[verify_token] = override_get_current_user
+    with TestClient(app) as test_client:
+        test_client.headers.update({"Authorization": "Bearer stock_test_id"})
+        test_client.schedule_id = schedule_id
+        yield test_client
+    app.dependency_overrides.clear()
+
+
+def _create_product(session_factory, name, stock):
+    db = session_factory()
+    product = Product(product_name=name, description="", price=100, stock_quantity=stock, unit="個")
+    db.add(product)
+    db.commit()
+    product_id = product.product_id
+    db.close()
+    return product_id
+
+
+def _stock_of(session_factory, product_id):
+    db = session_factory()
+    stock = db.query(Product.stock_quantity).filter(Product.product_id == product_id).scalar()
+    db.close()
+    return stock
+
+
+def test_reserve_stock_is_conditional(db_session):
+    product = Product(product_name="Reserve Product", description="", price=100, stock_quantity=5, unit="個")
+    db_session.add(product)
+    db_session.commit()
+
+    assert reserve_stock(db_session, product.product_id, 3) is True
+    assert reserve_stock(db_session, product.product_id, 3) is False
+    release_stock(db_session, product.product_id, 1)
+    db_session.commit()
+
+    db_session.expire_all()
+    assert product.stock_quantity == 3
+
+
+def test_concurrent_orders_never_oversell(file_client, file_session_factory):
+    plentiful_id = _create_product(file_session_factory, "Flash Product A", 1000)
+    scarce_id = _create_product(file_session_factory, "Flash Product B", 100)
+
+    def place_order(i):
+        # 反向順序傳入，reserve_many 仍會依 product_id 排序鎖定
+        response = file_client.post("/orders/", json={
+            "line_id": "stock_test_id",
+            "schedule_id": file_client.schedule_id,
+            "payment_method": "cash",
+            "order_details": [
+                {"product_id": scarce_id, "quantity": 1, "unit_price": 100.0, "subtotal": 100.0},
+                {"product_id": plentiful_id, "quantity": 2, "unit_price": 100.0, "subtotal": 200.0},
+            ],
+        })
+        assert response.status_code in (200, 400), response.text
+        return response.status_code == 200
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(place_order, range(300)))
+
+    assert results.count(True) == 100
+    db = file_session_factory()
+    try:
+        ordered = dict(
+            db.query(OrderDetail.product_id, func.sum(OrderDetail.quantity)).group_by(OrderDetail.product_id)
+        )
+    finally:
+        db.close()
+    # 失敗的訂單整筆回滾，先扣的商品也會還原；庫存與已下訂數量相加等於初始庫存
+    assert _stock_of(file_session_factory, scarce_id) + ordered[scarce_id] == 100
+    assert _stock_of(file_session_factory, plentiful_id) + ordered[plentiful_id] == 1000
+    assert _stock_of(file_session_factory, scarce_id) == 0
+
+
+def test_units_returned_after_flash_mode_ends_go_back_to_products(file_session_factory):
+    from app.product.flash import flash_stock, flush_flash_stock
+
+    product_id = _create_product(file_session_factory, "Flash Ended Product", 0)
+    flash_stock.enable(product_id, 20)
+    db = file_session_factory()
+    try:
+        # 與下單相同，先在交易中讀取商品
+        assert db.get(Product, product_id) is not None
+        assert reserve_stock(db, product_id, 5) is True
+        # 交易回滾前快閃模式已結束：剩餘數量已移回，回滾補回的數量改記為待寫回
+        assert flash_stock.disable(product_id) == 15
+        db.rollback()
+    finally:
+        db.close()
+    assert flash_stock.in_flash_mode(product_id) is False
+    assert flash_stock.reserve(product_id, 1) is None
+
+    db = file_session_factory()
+    try:
+        assert flush_flash_stock(db) == {product_id: 5}
+    finally:
+        db.close()
+    assert flash_stock.take_pending() == {}
+    # 未寫入 products 的 15 由 disable 的呼叫端移回，這裡只驗證補回的 5
+    assert _stock_of(file_session_factory, product_id) == 5